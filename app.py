@@ -77,6 +77,13 @@ def create_app(config_name=None):
     from routes.templates import templates_bp
     app.register_blueprint(templates_bp)
     
+    # Deliver queued SMS in the background of every worker process
+    from services.sms_outbox import start_outbox_worker
+    
+    @app.before_request
+    def ensure_sms_outbox_worker():
+        start_outbox_worker(app)
+    
     # Add favicon route
     @app.route('/favicon.ico')
     def favicon():
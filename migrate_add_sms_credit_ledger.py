@@ -0,0 +1,40 @@
+"""
+Migration script to move the SMS balance into the credit ledger
+and add the reservation_id column to sms_outbox table
+"""
+from app import create_app
+from models import db
+from sqlalchemy import text, inspect
+from services.sms_credits import ensure_balance_row, get_sms_balance
+
+def migrate():
+    """Create the ledger tables, link outbox messages to reservations and open the ledger"""
+    app = create_app()
+    with app.app_context():
+        try:
+            db.create_all()
+
+            columns = [col['name'] for col in inspect(db.engine).get_columns('sms_outbox')]
+            if 'reservation_id' in columns:
+                print("✅ Column 'reservation_id' already exists in sms_outbox table")
+            else:
+                print("📝 Adding 'reservation_id' column to sms_outbox table...")
+                db.session.execute(text(
+                    'ALTER TABLE sms_outbox ADD COLUMN reservation_id INTEGER REFERENCES sms_credit_ledger(id)'
+                ))
+                db.session.execute(text(
+                    'CREATE INDEX IF NOT EXISTS ix_sms_outbox_reservation_id ON sms_outbox (reservation_id)'
+                ))
+            db.session.commit()
+
+            # Opens the ledger with the balance kept in Settings
+            ensure_balance_row()
+            db.session.commit()
+            print(f"✅ SMS credit ledger balance: {get_sms_balance()['balance']}")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,35 @@
+"""
+Migration script to add subject_rank and subject_percentile columns to monthly_marks table
+"""
+from app import create_app
+from models import db, MonthlyExam
+from sqlalchemy import text, inspect
+from services.subject_ranks import refresh_subject_ranks
+
+def migrate():
+    """Add per-subject rank columns and fill them for existing exams"""
+    app = create_app()
+    with app.app_context():
+        try:
+            columns = [col['name'] for col in inspect(db.engine).get_columns('monthly_marks')]
+            
+            for column, column_type in (('subject_rank', 'INTEGER'), ('subject_percentile', 'FLOAT')):
+                if column in columns:
+                    print(f"✅ Column '{column}' already exists in monthly_marks table")
+                    continue
+                print(f"📝 Adding '{column}' column to monthly_marks table...")
+                db.session.execute(text(f'ALTER TABLE monthly_marks ADD COLUMN {column} {column_type}'))
+            db.session.commit()
+            
+            exam_ids = [row[0] for row in db.session.query(MonthlyExam.id).all()]
+            for exam_id in exam_ids:
+                refresh_subject_ranks(exam_id)
+            db.session.commit()
+            print(f"✅ Computed subject ranks for {len(exam_ids)} monthly exams")
+            
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate()
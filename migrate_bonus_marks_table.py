@@ -0,0 +1,28 @@
+"""
+Migration script to move monthly exam bonus marks from Settings JSON blobs
+("monthly_exam_bonus_{exam_id}") into the monthly_bonus_marks table
+"""
+from app import create_app
+from models import db, MonthlyBonusMark
+from services.bonus_marks import migrate_settings_bonus_marks
+
+def migrate():
+    app = create_app()
+    
+    with app.app_context():
+        print("=" * 60)
+        print("Moving bonus marks into monthly_bonus_marks table...")
+        print("=" * 60)
+        
+        MonthlyBonusMark.__table__.create(db.engine, checkfirst=True)
+        print("✅ monthly_bonus_marks table ready")
+        
+        exams_migrated, rows_migrated = migrate_settings_bonus_marks()
+        print(f"✅ Migrated {rows_migrated} bonus marks from {exams_migrated} exams")
+        
+        print("=" * 60)
+        print("Migration completed successfully!")
+        print("=" * 60)
+
+if __name__ == '__main__':
+    migrate()
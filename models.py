@@ -332,6 +332,87 @@ class SmsLog(db.Model):
     def __repr__(self):
         return f'<SmsLog {self.phone_number}: {self.status}>'
 
+class SmsOutbox(db.Model):
+    """Outgoing SMS waiting for the background delivery worker, one row per recipient"""
+    __tablename__ = 'sms_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    phone_number = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # Recipient student
+    sent_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    category = db.Column(db.String(50), nullable=True)  # exam_result, attendance, bulk
+    charge_sender = db.Column(db.Boolean, nullable=False, default=False)  # Deduct from sender's sms_count when sent
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(32), nullable=True, index=True)  # Set by the worker delivering it
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    sms_log_id = db.Column(db.Integer, db.ForeignKey('sms_logs.id'), nullable=True)
+    reservation_id = db.Column(db.Integer, db.ForeignKey('sms_credit_ledger.id'), nullable=True, index=True)  # Campaign's credit hold
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_sms_outbox_due', 'status', 'next_attempt_at'),)
+
+    # Relationships
+    sms_log = db.relationship('SmsLog')
+
+    def __repr__(self):
+        return f'<SmsOutbox {self.phone_number}: {self.status}>'
+
+class SmsCreditEntry(db.Model):
+    """Append-only SMS credit ledger; the running totals are materialized in SmsCreditBalance"""
+    __tablename__ = 'sms_credit_ledger'
+
+    id = db.Column(db.Integer, primary_key=True)
+    entry_type = db.Column(db.String(20), nullable=False)  # opening, credit, debit, reservation
+    amount = db.Column(db.Integer, nullable=False)  # SMS credits; negative for debits and reservations
+    status = db.Column(db.String(20), nullable=True)  # Reservations only: held, settled
+    reservation_id = db.Column(db.Integer, db.ForeignKey('sms_credit_ledger.id'), nullable=True)  # Debit settling a reservation
+    reference = db.Column(db.String(255), nullable=True)  # e.g. outbox:attendance, send-bulk-noauth
+    memo = db.Column(db.String(255), nullable=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    settled_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<SmsCreditEntry {self.entry_type} {self.amount}>'
+
+class SmsCreditBalance(db.Model):
+    """Materialized totals of the SMS credit ledger (a single row)"""
+    __tablename__ = 'sms_credit_balance'
+
+    id = db.Column(db.Integer, primary_key=True)
+    balance = db.Column(db.Integer, nullable=False, default=0)  # Sum of posted entries
+    held = db.Column(db.Integer, nullable=False, default=0)  # Credits reserved by unsettled campaigns
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SmsCreditBalance {self.balance} held={self.held}>'
+
+class Holiday(db.Model):
+    """Non-working day for attendance; batch_id NULL applies to every batch"""
+    __tablename__ = 'holidays'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False, index=True)
+    name = db.Column(db.String(255), nullable=False)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batches.id'), nullable=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    batch = db.relationship('Batch')
+    
+    __table_args__ = (db.UniqueConstraint('date', 'batch_id', name='unique_holiday_date_batch'),)
+    
+    def __repr__(self):
+        return f'<Holiday {self.date}: {self.name}>'
+
 class Attendance(db.Model):
     """Attendance tracking model"""
     __tablename__ = 'attendance'
@@ -532,6 +613,9 @@ class MonthlyMark(db.Model):
     gpa = db.Column(db.Float, nullable=True)
     is_absent = db.Column(db.Boolean, default=False)
     remarks = db.Column(db.Text, nullable=True)
+    # Rank and percentile (100 = top) among the paper's present students; set with the ranking snapshot
+    subject_rank = db.Column(db.Integer, nullable=True)
+    subject_percentile = db.Column(db.Float, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -598,6 +682,86 @@ class MonthlyRanking(db.Model):
     def __repr__(self):
         return f'<MonthlyRanking {self.position} - User {self.user_id}>'
 
+class MonthlyBonusMark(db.Model):
+    """Teacher-added bonus marks per student for a monthly exam"""
+    __tablename__ = 'monthly_bonus_marks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    monthly_exam_id = db.Column(db.Integer, db.ForeignKey('monthly_exams.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    bonus_marks = db.Column(db.Float, nullable=False, default=0)
+    updated_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('monthly_exam_id', 'user_id', name='unique_monthly_bonus_mark'),)
+    
+    def __repr__(self):
+        return f'<MonthlyBonusMark Exam {self.monthly_exam_id} User {self.user_id}: {self.bonus_marks}>'
+
+class RankingSnapshot(db.Model):
+    """Stored comprehensive ranking for a monthly exam, recomputed only when stale"""
+    __tablename__ = 'ranking_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    monthly_exam_id = db.Column(db.Integer, db.ForeignKey('monthly_exams.id'), nullable=False, unique=True)
+    payload = db.Column(db.JSON, nullable=True)  # {'individual_exams': [...], 'rankings': [...], 'roster': [...]}
+    is_stale = db.Column(db.Boolean, nullable=False, default=True)
+    version = db.Column(db.Integer, nullable=False, default=0)  # Bumped on every invalidation
+    computed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    monthly_exam = db.relationship('MonthlyExam')
+
+    def __repr__(self):
+        return f'<RankingSnapshot Exam {self.monthly_exam_id} stale={self.is_stale}>'
+
+class BackgroundJob(db.Model):
+    """Long-running task executed outside the HTTP request, polled for progress"""
+    __tablename__ = 'background_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    job_type = db.Column(db.String(50), nullable=False)  # generate_ranking, ...
+    job_key = db.Column(db.String(255), nullable=False, index=True)  # e.g. generate_ranking:12
+    active_key = db.Column(db.String(255), unique=True, nullable=True)  # Equals job_key while queued/running
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    progress = db.Column(db.Integer, nullable=False, default=0)  # 0-100
+    message = db.Column(db.String(255), nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<BackgroundJob {self.job_type} {self.id}: {self.status}>'
+
+
+class MonthEndStep(db.Model):
+    """Outcome of one month-end close step for one batch; completed steps are skipped on re-runs"""
+    __tablename__ = 'month_end_steps'
+
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batches.id'), nullable=False)
+    step = db.Column(db.String(50), nullable=False)  # generate_ranking, publish_results, send_result_sms, fee_dues
+    status = db.Column(db.String(20), nullable=False)  # completed, failed
+    duration_ms = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    job_id = db.Column(db.String(32), db.ForeignKey('background_jobs.id'), nullable=True)
+    finished_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('year', 'month', 'batch_id', 'step', name='unique_month_end_step'),)
+
+    def __repr__(self):
+        return f'<MonthEndStep {self.year}-{self.month:02d} batch {self.batch_id} {self.step}: {self.status}>'
+
 
 class Document(db.Model):
     """PDF/Document storage for online exams and study materials"""
@@ -2,14 +2,22 @@
 Attendance Management Routes - Enhanced for Mobile & PC Responsiveness
 """
 from flask import Blueprint, request, send_file, make_response
-from models import db, Attendance, User, Batch, UserRole, AttendanceStatus
+from models import db, Attendance, User, Batch, UserRole, AttendanceStatus, Holiday
 from utils.auth import login_required, require_role, get_current_user
 from utils.response import success_response, error_response
+from services.ranking_snapshot import mark_batch_rankings_stale
+from services.attendance_calendar import get_month_calendar, count_working_days, invalidate_month_calendar
+from services.sms_outbox import enqueue_sms, notify_outbox, reserve_campaign
+from services.sms_credits import reserve_credits, settle_reservation
+from services.sms_template_registry import compile_template
 from datetime import datetime, timedelta, date as date_type
 from sqlalchemy import func, and_, extract, text
 import calendar
 import io
 import csv
+import logging
+
+logger = logging.getLogger(__name__)
 
 attendance_bp = Blueprint('attendance', __name__)
 
@@ -151,24 +159,21 @@ def bulk_mark_attendance():
                     'action': 'created'
                 })
         
+        # Attendance marks feed the monthly ranking for this month
+        mark_batch_rankings_stale(batch.id, attendance_date.year, attendance_date.month)
+        
         db.session.commit()
         
-        # Send SMS notifications if requested
-        sms_sent = 0
-        sms_sent_numbers = []
+        # Queue SMS notifications if requested; the outbox worker sends them
+        queued_items = []
         if send_sms and attendance_updates:
-            # Import SMS sending function (no balance check - API handles it)
-            from routes.sms import send_sms_via_api
-            from models import SmsLog, SmsStatus
+            from flask import session
+            custom_templates = session.get('custom_templates', {})
             
             for update in attendance_updates:
                 student = update['student']
                 status = update['status']
                 
-                # Prepare SMS message using templates
-                from flask import session
-                custom_templates = session.get('custom_templates', {})
-                
                 # Get the appropriate template based on attendance status
                 if status.lower() == 'present':
                     template = custom_templates.get('attendance_present', 'Dear Parent, {student_name} was PRESENT today in {batch_name} on {date}. Keep up the good work!')
@@ -176,73 +181,31 @@ def bulk_mark_attendance():
                     template = custom_templates.get('attendance_absent', 'Dear Parent, {student_name} was ABSENT today in {batch_name} on {date}. Please ensure regular attendance.')
                 
                 # Replace template variables with actual data
-                message = template.format(
-                    student_name=student.full_name,
-                    batch_name=batch.name,
-                    date=attendance_date.strftime('%d/%m/%Y')
-                )
-                
-                # Collect phone numbers to send SMS
-                phone_numbers = []
-                
-                # Add guardian/parent phone number if exists
-                if hasattr(student, 'guardian_phone') and student.guardian_phone:
-                    phone_numbers.append(student.guardian_phone)
-                
-                # Add student's own phone number
-                if student.phone:
-                    phone_numbers.append(student.phone)
+                message = compile_template(template).render({
+                    'student_name': student.full_name,
+                    'batch_name': batch.name,
+                    'date': attendance_date.strftime('%d/%m/%Y')
+                })
                 
-                # Remove duplicates
-                phone_numbers = list(set(phone_numbers))
+                # Guardian/parent and student's own phone, without duplicates
+                phone_numbers = {phone for phone in (student.guardian_phone, student.phone) if phone}
                 
-                # Send SMS to each phone number
-                for phone in phone_numbers:
-                    if not phone:
-                        continue
-                    
-                    # Check if teacher still has SMS balance
-                    if current_user.sms_count <= 0:
+                for phone in sorted(phone_numbers):
+                    # Stop once the teacher's SMS balance is spoken for
+                    if len(queued_items) >= current_user.sms_count:
                         break
-                    
-                    try:
-                        # Send SMS
-                        result = send_sms_via_api(phone, message)
-                        
-                        # Calculate SMS cost based on message content
-                        from routes.sms import calculate_sms_cost, deduct_sms_balance
-                        sms_cost = calculate_sms_cost(message) if result.get('success') else 0
-                        
-                        # Create SMS log
-                        sms_log = SmsLog(
-                            user_id=student.id,
-                            phone_number=phone,
-                            message=message,
-                            status=SmsStatus.SENT if result.get('success') else SmsStatus.FAILED,
-                            sent_by=current_user.id,
-                            api_response=result,
-                            cost=sms_cost,
-                            sent_at=datetime.utcnow() if result.get('success') else None
-                        )
-                        db.session.add(sms_log)
-                        
-                        if result.get('success'):
-                            # Deduct from local balance
-                            deduct_sms_balance(sms_cost)
-                            sms_sent += 1
-                            sms_sent_numbers.append(phone)
-                            # Deduct 1 SMS from teacher's balance
-                            current_user.sms_count -= 1
-                            
-                    except Exception as sms_error:
-                        print(f"Failed to send SMS to {phone}: {sms_error}")
+                    queued_items.append(enqueue_sms(phone, message, user_id=student.id, sent_by=current_user.id,
+                                                    category='attendance', charge_sender=True))
             
-            # Commit SMS logs and balance update
-            db.session.commit()
+            if queued_items:
+                # One reservation holds the campaign's credits and the teacher's quota
+                reserve_campaign(queued_items, created_by=current_user.id, reference='outbox:attendance')
+                db.session.commit()
+                notify_outbox()
         
         response_data = {
             'attendance_marked': len(attendance_updates),
-            'sms_sent': sms_sent,
+            'sms_queued': len(queued_items),
             'sms_balance': current_user.sms_count,
             'date': attendance_date.isoformat(),
             'batch_name': batch.name
@@ -327,86 +290,87 @@ def bulk_mark_attendance_send_absent_sms():
             if status.lower() == 'absent':
                 absent_students.append(user)
         
+        # Attendance marks feed the monthly ranking for this month
+        mark_batch_rankings_stale(batch.id, attendance_date.year, attendance_date.month)
+        
         db.session.commit()
         
         # Send SMS only to absent students
         sms_sent = 0
         sms_failed = 0
+        messages = []
         
         if absent_students:
-            # Check teacher's SMS balance
-            # Import SMS sending function (no balance check - API handles it)
-            from routes.sms import send_sms_via_api
+            # Import SMS sending function; credits are held in the ledger before sending
+            from routes.sms import send_sms_via_api, calculate_sms_cost
             from models import SmsLog, SmsStatus
             
+            # Get absent message template
+            from flask import session
+            custom_templates = session.get('custom_templates', {})
+            template = custom_templates.get(
+                'attendance_absent', 
+                'Dear Parent, {student_name} was ABSENT today in {batch_name} on {date}. Please ensure regular attendance.'
+            )
+            
             for student in absent_students:
-                # Get absent message template
-                from flask import session
-                custom_templates = session.get('custom_templates', {})
-                template = custom_templates.get(
-                    'attendance_absent', 
-                    'Dear Parent, {student_name} was ABSENT today in {batch_name} on {date}. Please ensure regular attendance.'
-                )
-                
                 # Replace template variables with actual data
-                message = template.format(
-                    student_name=student.full_name,
-                    batch_name=batch.name,
-                    date=attendance_date.strftime('%d/%m/%Y')
-                )
-                
-                # Collect phone numbers to send SMS
-                phone_numbers = []
-                
-                # Add guardian/parent phone number if exists
-                if hasattr(student, 'guardian_phone') and student.guardian_phone:
-                    phone_numbers.append(student.guardian_phone)
-                
-                # Add student's own phone number
-                if student.phone:
-                    phone_numbers.append(student.phone)
-                
-                # Remove duplicates
-                phone_numbers = list(set(phone_numbers))
+                message = compile_template(template).render({
+                    'student_name': student.full_name,
+                    'batch_name': batch.name,
+                    'date': attendance_date.strftime('%d/%m/%Y')
+                })
                 
-                # Send SMS to each phone number
-                for phone in phone_numbers:
-                    if not phone:
-                        continue
-                    
+                # Guardian/parent and student's own phone, without duplicates
+                for phone in {phone for phone in (student.guardian_phone, student.phone) if phone}:
+                    messages.append((student, phone, message))
+        
+        if messages:
+            # Hold the credits of all messages once; settled after sending
+            reservation = reserve_credits(sum(calculate_sms_cost(message) for _, _, message in messages),
+                                          reference='bulk-absent-sms', created_by=current_user.id)
+            db.session.commit()
+            
+            sms_used = 0
+            try:
+                for student, phone, message in messages:
                     try:
                         # Send SMS
                         result = send_sms_via_api(phone, message)
-                        
-                        # Calculate SMS cost based on message content
-                        from routes.sms import calculate_sms_cost, deduct_sms_balance
-                        sms_cost = calculate_sms_cost(message) if result.get('success') else 0
-                        
-                        # Create SMS log
-                        sms_log = SmsLog(
-                            user_id=student.id,
-                            phone_number=phone,
-                            message=message,
-                            status=SmsStatus.SENT if result.get('success') else SmsStatus.FAILED,
-                            sent_by=current_user.id,
-                            api_response=result,
-                            cost=sms_cost,
-                            sent_at=datetime.utcnow() if result.get('success') else None
-                        )
-                        db.session.add(sms_log)
-                        
-                        if result.get('success'):
-                            # Deduct from local balance
-                            deduct_sms_balance(sms_cost)
-                            sms_sent += 1
-                        else:
-                            sms_failed += 1
-                            
                     except Exception as sms_error:
-                        print(f"Failed to send SMS to {phone}: {sms_error}")
+                        logger.warning(f"Failed to send SMS to {phone}: {sms_error}")
+                        sms_failed += 1
+                        continue
+                    
+                    # Calculate SMS cost based on message content
+                    sms_cost = calculate_sms_cost(message) if result.get('success') else 0
+                    
+                    # Create SMS log
+                    db.session.add(SmsLog(
+                        user_id=student.id,
+                        phone_number=phone,
+                        message=message,
+                        status=SmsStatus.SENT if result.get('success') else SmsStatus.FAILED,
+                        sent_by=current_user.id,
+                        api_response=result,
+                        cost=sms_cost,
+                        sent_at=datetime.utcnow() if result.get('success') else None
+                    ))
+                    
+                    if result.get('success'):
+                        sms_used += sms_cost
+                        sms_sent += 1
+                    else:
                         sms_failed += 1
+            except Exception:
+                # Never leave the credits held: charge only what was confirmed sent
+                db.session.rollback()
+                settle_reservation(reservation.id, sms_used)
+                db.session.commit()
+                raise
             
-            # Commit SMS logs and balance update
+            # Commit SMS logs and the single settlement of the reservation
+            settle_reservation(reservation.id, sms_used)
             db.session.commit()
         
         response_data = {
@@ -530,13 +494,17 @@ def get_monthly_attendance():
                 'attendance': attendance_dict
             })
         
+        month_calendar = get_month_calendar(batch_id, year, month)
+        
         month_data = {
             'students': students_data,
             'days': days,
             'month': month,
             'year': year,
             'month_name': calendar.month_name[month],
-            'batch_name': batch.name
+            'batch_name': batch.name,
+            'working_days': month_calendar.working_days,
+            'holidays': {holiday_date.day: name for holiday_date, name in month_calendar.holidays.items()}
         }
         
         return success_response('Monthly attendance retrieved', month_data)
@@ -588,6 +556,11 @@ def get_attendance_summary():
         
         results = query.group_by(User.id, User.first_name, User.last_name).all()
         
+        # Scheduled working days in the range, net of weekends and holidays
+        working_days = None
+        if batch_id and start_date_str and end_date_str:
+            working_days = count_working_days(batch_id, start_date, end_date)
+        
         summary_data = []
         for result in results:
             attendance_percentage = (result.present_days / result.total_days * 100) if result.total_days > 0 else 0
@@ -598,6 +571,7 @@ def get_attendance_summary():
                 'total_days': result.total_days,
                 'present_days': result.present_days,
                 'absent_days': result.absent_days,
+                'working_days': working_days,
                 'attendance_percentage': round(attendance_percentage, 1)
             })
         
@@ -607,6 +581,103 @@ def get_attendance_summary():
         return error_response(f'Failed to retrieve attendance summary: {str(e)}', 500)
 
 
+@attendance_bp.route('/holidays', methods=['GET'])
+@login_required
+def get_holidays():
+    """Get holidays and working days for a month"""
+    try:
+        batch_id = request.args.get('batch_id', type=int)
+        month = request.args.get('month', type=int)
+        year = request.args.get('year', type=int)
+        
+        if not month or not year:
+            return error_response('Month and year are required', 400)
+        
+        month_calendar = get_month_calendar(batch_id, year, month)
+        
+        return success_response('Holidays retrieved', {
+            'month': month,
+            'year': year,
+            'batch_id': batch_id,
+            'working_days': month_calendar.working_days,
+            'holidays': [{'date': holiday_date.isoformat(), 'name': name}
+                         for holiday_date, name in sorted(month_calendar.holidays.items())]
+        })
+        
+    except Exception as e:
+        return error_response(f'Failed to retrieve holidays: {str(e)}', 500)
+
+@attendance_bp.route('/holidays', methods=['POST'])
+@login_required
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
+def create_holiday():
+    """Declare a holiday for one batch or for every batch"""
+    try:
+        data = request.get_json() or {}
+        name = (data.get('name') or '').strip()
+        batch_id = data.get('batch_id')
+        
+        if not data.get('date') or not name:
+            return error_response('Date and name are required', 400)
+        
+        try:
+            holiday_date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+        except ValueError:
+            return error_response('Invalid date format. Use YYYY-MM-DD', 400)
+        
+        if batch_id and not Batch.query.get(batch_id):
+            return error_response('Batch not found', 404)
+        
+        if Holiday.query.filter_by(date=holiday_date, batch_id=batch_id or None).first():
+            return error_response('A holiday already exists on this date', 400)
+        
+        holiday = Holiday(
+            date=holiday_date,
+            name=name,
+            batch_id=batch_id or None,
+            created_by=get_current_user().id
+        )
+        db.session.add(holiday)
+        
+        # Working days feed the attendance marks of this month's rankings
+        mark_batch_rankings_stale(batch_id or None, holiday_date.year, holiday_date.month)
+        db.session.commit()
+        invalidate_month_calendar(holiday_date.year, holiday_date.month)
+        
+        return success_response('Holiday created', {
+            'id': holiday.id,
+            'date': holiday.date.isoformat(),
+            'name': holiday.name,
+            'batch_id': holiday.batch_id
+        }, 201)
+        
+    except Exception as e:
+        db.session.rollback()
+        return error_response(f'Failed to create holiday: {str(e)}', 500)
+
+@attendance_bp.route('/holidays/<int:holiday_id>', methods=['DELETE'])
+@login_required
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
+def delete_holiday(holiday_id):
+    """Remove a holiday"""
+    try:
+        holiday = Holiday.query.get(holiday_id)
+        if not holiday:
+            return error_response('Holiday not found', 404)
+        
+        holiday_date = holiday.date
+        mark_batch_rankings_stale(holiday.batch_id, holiday_date.year, holiday_date.month)
+        db.session.delete(holiday)
+        db.session.commit()
+        invalidate_month_calendar(holiday_date.year, holiday_date.month)
+        
+        return success_response('Holiday deleted')
+        
+    except Exception as e:
+        db.session.rollback()
+        return error_response(f'Failed to delete holiday: {str(e)}', 500)
+
+
 @attendance_bp.route('/download-monthly', methods=['GET'])
 @login_required
 def download_monthly_attendance():
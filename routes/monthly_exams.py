@@ -4,21 +4,45 @@ Ranking, GPA calculation, merit lists, and performance analytics
 """
 from flask import Blueprint, request, jsonify, current_app
 from models import (db, MonthlyExam, IndividualExam, MonthlyMark, Batch, User, 
-                   UserRole, Settings, SmsLog, SmsStatus, Attendance, AttendanceStatus, MonthlyRanking)
+                   UserRole, MonthlyRanking,
+                   RankingSnapshot, MonthlyBonusMark)
 from utils.auth import login_required, require_role, get_current_user
 from utils.response import success_response, error_response
 from services.sms_service import send_bulk_notification
+from services.sms_outbox import enqueue_sms, notify_outbox, reserve_campaign
+from services.sms_template_registry import get_saved_template, compile_template
+from services.grading import calculate_grade_and_gpa
+from services.marks_import import import_marks_sheet
+from services.jobs import get_job, serialize_job
+from services.bonus_marks import save_bonus_marks
+from services.roll_numbers import parse_roll_assignments, apply_roll_numbers
+from services.student_timeline import get_student_timeline, parse_year_month
+from services.report_cards import load_report_cards, iter_rendered_cards, stream_zip
+from services.transcripts import (TRANSCRIPT_FORMATS, load_transcript_inputs, iter_transcript_csv,
+                                  iter_transcript_jsonl)
+from services.exam_analytics import cached_exam_analytics, get_marks_fingerprint
+from services.single_flight import shared_result, make_fingerprint
+from services.homepage_snapshot import get_homepage_snapshot, refresh_homepage_snapshot
+from services.ranking_jobs import enqueue_ranking_generation
+from services.month_end import enqueue_month_end_close, get_month_end_steps
+from services.ranking_updates import update_student_ranking
+from services.subject_ranks import get_subject_ranks
+from services.marks_store import (load_students_by_id, load_existing_mark_user_ids, validate_mark_entry,
+                                  build_mark_row, upsert_monthly_marks, parse_user_id)
+from services.ranking_snapshot import (get_ranking_snapshot, mark_rankings_stale,
+                                       mark_dependent_rankings_stale, to_columnar)
 from sqlalchemy import func, desc, case, and_, or_
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 import calendar
 import logging
-import requests
 import os
 import re
 
 logger = logging.getLogger(__name__)
 
+MERIT_LIST_MAX_TOP = 100  # Bounds the shared merit lists a query string can create per exam
+
 monthly_exams_bp = Blueprint('monthly_exams', __name__)
 
 @monthly_exams_bp.route('/test-db', methods=['GET'])
@@ -254,6 +278,8 @@ def submit_marks():
                 )
                 db.session.add(monthly_mark)
         
+        mark_rankings_stale({m['monthly_exam_id'] for m in marks_data})
+        
         db.session.commit()
         
         # Recalculate rankings
@@ -287,212 +313,12 @@ def get_comprehensive_monthly_ranking(exam_id):
             if monthly_exam.batch_id not in user_batch_ids:
                 return error_response('Access denied', 403)
         
-        # Get all individual exams for this monthly exam
-        individual_exams = IndividualExam.query.filter_by(
-            monthly_exam_id=exam_id
-        ).order_by(IndividualExam.order_index).all()
-        
-        # Get all students in the batch (exclude archived students)
-        batch_students = User.query.join(
-            User.batches
-        ).filter(
-            User.role == UserRole.STUDENT,
-            User.is_active == True,
-            User.is_archived == False,
-            Batch.id == monthly_exam.batch_id
-        ).all()
-        
-        # Calculate comprehensive rankings
-        rankings = []
-        
-        for student in batch_students:
-            # Get existing ranking to get roll number and previous position
-            existing_ranking = MonthlyRanking.query.filter_by(
-                monthly_exam_id=exam_id,
-                user_id=student.id
-            ).first()
-            
-            # Get individual exam marks
-            individual_marks = {}
-            total_exam_marks = 0
-            total_possible_marks = 0
-            exam_count = len(individual_exams)
-            passed_exams = 0
-            
-            for exam in individual_exams:
-                mark = MonthlyMark.query.filter_by(
-                    monthly_exam_id=exam_id,
-                    individual_exam_id=exam.id,
-                    user_id=student.id
-                ).first()
-                
-                if mark:
-                    individual_marks[exam.id] = {
-                        'exam_title': exam.title,
-                        'subject': exam.subject,
-                        'marks_obtained': mark.marks_obtained,
-                        'total_marks': mark.total_marks,
-                        'percentage': round((mark.marks_obtained / mark.total_marks * 100), 2) if mark.total_marks > 0 else 0,
-                        'is_absent': mark.is_absent,
-                        'grade': calculate_grade_and_gpa((mark.marks_obtained / mark.total_marks * 100) if mark.total_marks > 0 else 0)[0]
-                    }
-                    if not mark.is_absent:
-                        total_exam_marks += mark.marks_obtained
-                        if mark.marks_obtained >= (mark.total_marks * 0.4):  # 40% pass mark
-                            passed_exams += 1
-                    total_possible_marks += mark.total_marks
-                else:
-                    individual_marks[exam.id] = {
-                        'exam_title': exam.title,
-                        'subject': exam.subject,
-                        'marks_obtained': 0,
-                        'total_marks': exam.marks,
-                        'percentage': 0,
-                        'is_absent': True,
-                        'grade': 'F'
-                    }
-                    total_possible_marks += exam.marks
-            
-            # Calculate attendance marks (1 mark per present day in the month)
-            # Only count attendance from the SAME MONTH as the exam
-            attendance_marks = 0
-            total_days = 0
-            max_attendance_marks = 0
-            
-            if monthly_exam.start_date and monthly_exam.end_date:
-                # Get the first and last day of the exam's month
-                exam_month = monthly_exam.month
-                exam_year = monthly_exam.year
-                
-                # First day of the month
-                month_start = datetime(exam_year, exam_month, 1).date()
-                
-                # Last day of the month
-                if exam_month == 12:
-                    month_end = datetime(exam_year + 1, 1, 1).date() - timedelta(days=1)
-                else:
-                    month_end = datetime(exam_year, exam_month + 1, 1).date() - timedelta(days=1)
-                
-                # Count total working days in this specific month (Monday to Friday)
-                current_date = month_start
-                
-                while current_date <= month_end:
-                    # Count only weekdays (Monday to Friday)
-                    if current_date.weekday() < 5:  # 0-4 are Monday to Friday
-                        total_days += 1
-                    current_date += timedelta(days=1)
-                
-                max_attendance_marks = total_days  # Maximum possible attendance marks for the month
-                
-                # Count present days ONLY in this specific month
-                present_count = Attendance.query.filter(
-                    Attendance.user_id == student.id,
-                    Attendance.batch_id == monthly_exam.batch_id,
-                    Attendance.date >= month_start,
-                    Attendance.date <= month_end,
-                    Attendance.status == AttendanceStatus.PRESENT
-                ).count()
-                attendance_marks = present_count
-            
-            # Calculate attendance percentage
-            attendance_percentage = (attendance_marks / total_days * 100) if total_days > 0 else 0
-            
-            # Calculate final totals (NO BONUS - just exam marks + attendance marks)
-            final_total = total_exam_marks + attendance_marks
-            total_possible = total_possible_marks + max_attendance_marks  # Total possible including max attendance
-            
-            # Calculate simple percentage based on obtained vs total possible
-            percentage = (final_total / total_possible * 100) if total_possible > 0 else 0
-            
-            # Calculate grade and GPA based on final percentage
-            grade, gpa = calculate_grade_and_gpa(percentage)
-            exam_gpa = calculate_grade_and_gpa((total_exam_marks / total_possible_marks * 100) if total_possible_marks > 0 else 0)[1]
-            
-            # Get previous month ranking for comparison and roll number
-            previous_position = None
-            previous_roll_number = None
-            
-            if existing_ranking and existing_ranking.previous_position:
-                previous_position = existing_ranking.previous_position
-            
-            # Always try to find previous month ranking for roll number inheritance
-            prev_month = monthly_exam.month - 1 if monthly_exam.month > 1 else 12
-            prev_year = monthly_exam.year if monthly_exam.month > 1 else monthly_exam.year - 1
-            
-            prev_exam = MonthlyExam.query.filter_by(
-                batch_id=monthly_exam.batch_id,
-                month=prev_month,
-                year=prev_year
-            ).first()
-            
-            if prev_exam:
-                prev_ranking = MonthlyRanking.query.filter_by(
-                    monthly_exam_id=prev_exam.id,
-                    user_id=student.id,
-                    is_final=True
-                ).first()
-                if prev_ranking:
-                    previous_position = prev_ranking.position
-                    previous_roll_number = prev_ranking.roll_number
-            
-            # Determine roll number: use existing, or inherit from previous month, or None
-            current_roll_number = None
-            if existing_ranking and existing_ranking.roll_number:
-                current_roll_number = existing_ranking.roll_number
-            elif previous_roll_number:
-                current_roll_number = previous_roll_number  # Inherit from previous month
-            
-            ranking_data = {
-                'user_id': student.id,
-                'student_name': student.full_name,
-                'student_phone': student.phoneNumber,
-                'roll_number': current_roll_number,
-                'individual_marks': individual_marks,
-                'total_exam_marks': total_exam_marks,
-                'total_possible_marks': total_possible_marks,
-                'attendance_marks': attendance_marks,
-                'max_attendance_marks': max_attendance_marks,
-                'total_attendance_days': total_days,
-                'attendance_percentage': round(attendance_percentage, 2),
-                'final_total': final_total,
-                'total_possible': total_possible,
-                'percentage': round(percentage, 2),
-                'grade': grade,
-                'gpa': round(gpa, 2),
-                'exam_gpa': round(exam_gpa, 2),
-                'passed_exams': passed_exams,
-                'total_exams': exam_count,
-                'previous_position': previous_position
-            }
-            
-            rankings.append(ranking_data)
-        
-        # Sort by final percentage (descending), then by total marks, then by name
-        rankings.sort(key=lambda x: (-x['percentage'], -x['final_total'], x['student_name']))
-        
-        # Assign positions and calculate position changes
-        for idx, rank in enumerate(rankings):
-            current_position = idx + 1
-            rank['current_position'] = current_position
-            rank['position'] = current_position  # For compatibility
-            
-            # Calculate position change
-            if rank['previous_position']:
-                rank['position_change'] = rank['previous_position'] - current_position
-                if rank['position_change'] > 0:
-                    rank['position_trend'] = 'up'
-                elif rank['position_change'] < 0:
-                    rank['position_trend'] = 'down'
-                else:
-                    rank['position_trend'] = 'same'
-            else:
-                rank['position_change'] = None
-                rank['position_trend'] = 'new'
-        
-        # Filter out archived students from rankings before returning
-        # (in case any old data exists)
-        active_student_ids = [s.id for s in batch_students]
-        rankings = [r for r in rankings if r['user_id'] in active_student_ids]
+        # Served from the stored snapshot; the ranking engine recomputes it
+        # only after a marks/attendance/bonus write has marked it stale
+        snapshot = get_ranking_snapshot(monthly_exam)
+        individual_exams = snapshot['individual_exams']
+        rankings = snapshot['rankings']
+        columnar = request.args.get('format') == 'columnar'
         
         # If student, only return their data and nearby rankings
         if current_user.role == UserRole.STUDENT:
@@ -508,28 +334,68 @@ def get_comprehensive_monthly_ranking(exam_id):
                     if abs(rank['position'] - current_pos) <= 2
                 ]
                 
-                return success_response('Student comprehensive ranking retrieved', {
+                data = {
                     'monthly_exam': serialize_monthly_exam(monthly_exam),
-                    'individual_exams': [{'id': e.id, 'title': e.title, 'exam_title': e.title, 'subject': e.subject, 'marks': e.marks} for e in individual_exams],
+                    'individual_exams': individual_exams,
                     'student_position': current_pos,
                     'total_students': len(rankings),
                     'nearby_rankings': nearby_rankings
-                })
+                }
+                if columnar:
+                    data['format'] = 'columnar'
+                    data['nearby_rankings'] = to_columnar(individual_exams, nearby_rankings)
+                return success_response('Student comprehensive ranking retrieved', data)
             else:
                 return error_response('No data found for student', 404)
         
         # For teachers/admin, return full comprehensive ranking
-        return success_response('Comprehensive monthly ranking retrieved', {
+        data = {
             'monthly_exam': serialize_monthly_exam(monthly_exam),
-            'individual_exams': [{'id': e.id, 'title': e.title, 'exam_title': e.title, 'subject': e.subject, 'marks': e.marks} for e in individual_exams],
+            'individual_exams': individual_exams,
             'rankings': rankings,
             'total_students': len(rankings)
-        })
+        }
+        if columnar:
+            # Opt-in compact shape: paper metadata once, one array per student
+            data['format'] = 'columnar'
+            data['rankings'] = to_columnar(individual_exams, rankings)
+        return success_response('Comprehensive monthly ranking retrieved', data)
         
     except Exception as e:
         logger.error(f"Error getting comprehensive monthly ranking: {e}")
         return error_response(f'Failed to retrieve comprehensive ranking: {str(e)}', 500)
 
+@monthly_exams_bp.route('/<int:exam_id>/subject-ranks', methods=['GET'])
+@login_required
+def get_subject_ranks_route(exam_id):
+    """Get each student's rank and percentile in every paper of a monthly exam"""
+    try:
+        current_user = get_current_user()
+        
+        monthly_exam = MonthlyExam.query.get(exam_id)
+        if not monthly_exam:
+            return error_response('Monthly exam not found', 404)
+        
+        if current_user.role == UserRole.STUDENT:
+            user_batch_ids = [b.id for b in current_user.batches if b.is_active]
+            if monthly_exam.batch_id not in user_batch_ids:
+                return error_response('Access denied', 403)
+        
+        # Subject ranks are refreshed together with a stale ranking snapshot
+        get_ranking_snapshot(monthly_exam)
+        
+        # Students only see their own ranks
+        user_id = current_user.id if current_user.role == UserRole.STUDENT else None
+        
+        return success_response('Subject ranks retrieved', {
+            'monthly_exam': serialize_monthly_exam(monthly_exam),
+            'subjects': get_subject_ranks(exam_id, user_id)
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting subject ranks: {e}")
+        return error_response(f'Failed to retrieve subject ranks: {str(e)}', 500)
+
 @monthly_exams_bp.route('/<int:exam_id>/update-bonus', methods=['POST'])
 @login_required
 @require_role(UserRole.TEACHER, UserRole.SUPER_USER)
@@ -546,38 +412,20 @@ def update_bonus_marks(exam_id):
             return error_response('Monthly exam not found', 404)
         
         bonus_data = data['bonus_data']  # List of {user_id, bonus_marks}
-        updated_count = 0
-        
-        # For now, we'll store bonus marks in the Settings table as JSON
-        # Key format: "monthly_exam_bonus_{exam_id}"
-        bonus_key = f"monthly_exam_bonus_{exam_id}"
-        
-        # Get existing bonus data or create new
-        bonus_setting = Settings.query.filter_by(key=bonus_key).first()
-        if not bonus_setting:
-            bonus_setting = Settings(
-                key=bonus_key,
-                value={},
-                description=f"Bonus marks for Monthly Exam {monthly_exam.title}",
-                category="exam_bonus",
-                updated_by=get_current_user().id
-            )
-            db.session.add(bonus_setting)
-        
-        # Update bonus marks
-        current_bonus = bonus_setting.value or {}
         
+        bonus_by_user = {}
         for entry in bonus_data:
-            user_id = str(entry.get('user_id'))
-            bonus_marks = float(entry.get('bonus_marks', 0))
-            
-            if user_id:
-                current_bonus[user_id] = bonus_marks
-                updated_count += 1
+            user_id = parse_user_id(entry.get('user_id'))
+            if not user_id:
+                continue
+            try:
+                bonus_by_user[user_id] = float(entry.get('bonus_marks', 0))
+            except (TypeError, ValueError):
+                return error_response(f"Invalid bonus marks for student {user_id}", 400)
         
-        bonus_setting.value = current_bonus
-        bonus_setting.updated_at = datetime.utcnow()
-        bonus_setting.updated_by = get_current_user().id
+        updated_count = save_bonus_marks(exam_id, bonus_by_user, get_current_user().id)
+        
+        mark_rankings_stale([exam_id])
         
         db.session.commit()
         
@@ -597,8 +445,6 @@ def update_bonus_marks(exam_id):
 def assign_roll_numbers(exam_id):
     """Assign roll numbers to students for monthly exam"""
     try:
-        from models import MonthlyRanking
-        
         data = request.get_json()
         if not data or 'roll_assignments' not in data:
             return error_response('Roll assignments data is required', 400)
@@ -607,40 +453,11 @@ def assign_roll_numbers(exam_id):
         if not monthly_exam:
             return error_response('Monthly exam not found', 404)
         
-        roll_assignments = data['roll_assignments']  # List of {user_id, roll_number}
-        updated_count = 0
+        # List of {user_id, roll_number}; students outside the batch are skipped
+        roll_numbers = parse_roll_assignments(monthly_exam, data['roll_assignments'])
+        updated_count = apply_roll_numbers(monthly_exam, roll_numbers)
         
-        for assignment in roll_assignments:
-            user_id = assignment.get('user_id')
-            roll_number = assignment.get('roll_number')
-            
-            if not user_id or not roll_number:
-                continue
-            
-            # Check if user is in the batch
-            user = User.query.get(user_id)
-            if not user or monthly_exam.batch_id not in [b.id for b in user.batches]:
-                continue
-            
-            # Create or update MonthlyRanking record
-            ranking = MonthlyRanking.query.filter_by(
-                monthly_exam_id=exam_id,
-                user_id=user_id
-            ).first()
-            
-            if not ranking:
-                ranking = MonthlyRanking(
-                    monthly_exam_id=exam_id,
-                    user_id=user_id,
-                    position=0,  # Will be updated when rankings are calculated
-                    roll_number=roll_number
-                )
-                db.session.add(ranking)
-            else:
-                ranking.roll_number = roll_number
-                ranking.updated_at = datetime.utcnow()
-            
-            updated_count += 1
+        mark_dependent_rankings_stale(monthly_exam)
         
         db.session.commit()
         
@@ -660,46 +477,19 @@ def assign_roll_numbers(exam_id):
 def auto_assign_roll_numbers(exam_id):
     """Auto-assign roll numbers based on current ranking"""
     try:
-        from models import MonthlyRanking
-        
         monthly_exam = MonthlyExam.query.get(exam_id)
         if not monthly_exam:
             return error_response('Monthly exam not found', 404)
         
-        # Get current comprehensive ranking
-        ranking_response = get_comprehensive_monthly_ranking(exam_id)
-        if not ranking_response.json.get('success'):
-            return error_response('Failed to get current rankings', 500)
-        
-        rankings = ranking_response.json['data']['rankings']
-        updated_count = 0
+        # Roll number = current comprehensive ranking position
+        rankings = get_ranking_snapshot(monthly_exam)['rankings']
+        positions = {rank_data['user_id']: rank_data['position'] for rank_data in rankings}
+        updated_count = apply_roll_numbers(monthly_exam, positions, positions=positions)
         
-        for rank_data in rankings:
-            user_id = rank_data['user_id']
-            position = rank_data['position']
-            
-            # Create or update MonthlyRanking record with roll number = position
-            ranking = MonthlyRanking.query.filter_by(
-                monthly_exam_id=exam_id,
-                user_id=user_id
-            ).first()
-            
-            if not ranking:
-                ranking = MonthlyRanking(
-                    monthly_exam_id=exam_id,
-                    user_id=user_id,
-                    position=position,
-                    roll_number=position
-                )
-                db.session.add(ranking)
-            else:
-                ranking.roll_number = position
-                ranking.position = position
-                ranking.updated_at = datetime.utcnow()
-            
-            updated_count += 1
+        mark_dependent_rankings_stale(monthly_exam)
         
         db.session.commit()
+        refresh_homepage_snapshot()
         
         return success_response('Roll numbers auto-assigned based on ranking', {
             'updated_count': updated_count,
@@ -715,106 +505,89 @@ def auto_assign_roll_numbers(exam_id):
 @login_required
 @require_role(UserRole.TEACHER, UserRole.SUPER_USER)
 def generate_monthly_ranking(exam_id):
-    """Generate and save final monthly rankings to database"""
+    """Start a background job that generates and saves final monthly rankings"""
     try:
-        from models import MonthlyRanking
-        
         monthly_exam = MonthlyExam.query.get(exam_id)
         if not monthly_exam:
             return error_response('Monthly exam not found', 404)
         
-        # Get comprehensive ranking data (same as the display function)
-        ranking_response_tuple = get_comprehensive_monthly_ranking(exam_id)
-        ranking_response, status_code = ranking_response_tuple
+        # A second click while a job is running returns that job instead of starting another
+        job, created = enqueue_ranking_generation(monthly_exam, created_by=get_current_user().id)
         
-        if status_code != 200:
-            return error_response('Failed to calculate rankings', 500)
-            
-        ranking_data = ranking_response.get_json()
-        if not ranking_data.get('success'):
-            return error_response('Failed to calculate rankings', 500)
-            
-        rankings = ranking_data['data']['rankings']
-        updated_count = 0
+        message = 'Ranking generation started' if created else 'Ranking generation already in progress'
+        data = serialize_job(job)
+        data['status_url'] = f'/api/monthly-exams/jobs/{job.id}'
+        return success_response(message, data, 202)
         
-        # Find previous month's exam to get roll numbers
-        prev_month = monthly_exam.month - 1 if monthly_exam.month > 1 else 12
-        prev_year = monthly_exam.year if monthly_exam.month > 1 else monthly_exam.year - 1
-        
-        prev_exam = MonthlyExam.query.filter_by(
-            batch_id=monthly_exam.batch_id,
-            month=prev_month,
-            year=prev_year
-        ).first()
-        
-        # Build a map of user_id to previous roll number
-        prev_roll_map = {}
-        if prev_exam:
-            print(f"\n🔍 Found previous exam: {prev_exam.month}/{prev_exam.year} (ID: {prev_exam.id})")
-            prev_rankings = MonthlyRanking.query.filter_by(
-                monthly_exam_id=prev_exam.id,
-                is_final=True
-            ).all()
-            print(f"📋 Previous rankings count: {len(prev_rankings)}")
-            for pr in prev_rankings:
-                if pr.roll_number:
-                    prev_roll_map[pr.user_id] = pr.roll_number
-                    print(f"  User {pr.user_id} had roll number: {pr.roll_number}")
-        else:
-            print(f"\n⚠️  No previous exam found for {prev_month}/{prev_year}")
-        
-        print(f"📊 Previous roll map: {prev_roll_map}")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error starting ranking generation: {e}")
+        return error_response(f'Failed to generate ranking: {str(e)}', 500)
+
+@monthly_exams_bp.route('/month-end-close', methods=['POST'])
+@login_required
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
+def start_month_end_close():
+    """Start the month-end close (rankings, results, result SMS, fee dues) for every active batch"""
+    try:
+        data = request.get_json() or {}
+        try:
+            year = int(data.get('year'))
+            month = int(data.get('month'))
+        except (TypeError, ValueError):
+            return error_response('year and month are required', 400)
+        if not 1 <= month <= 12:
+            return error_response('month must be between 1 and 12', 400)
+        
+        # Re-running skips the steps that already completed for this month
+        job, created = enqueue_month_end_close(year, month, send_sms=bool(data.get('send_sms', True)),
+                                               created_by=get_current_user().id)
+        
+        message = 'Month-end close started' if created else 'Month-end close already in progress'
+        data = serialize_job(job)
+        data['status_url'] = f'/api/monthly-exams/jobs/{job.id}'
+        return success_response(message, data, 202)
         
-        # Clear existing rankings for this exam
-        MonthlyRanking.query.filter_by(monthly_exam_id=exam_id).delete()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error starting month-end close: {e}")
+        return error_response(f'Failed to start month-end close: {str(e)}', 500)
+
+@monthly_exams_bp.route('/month-end-close', methods=['GET'])
+@login_required
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
+def get_month_end_close():
+    """Get the recorded month-end steps of every batch for a month"""
+    try:
+        year = request.args.get('year', type=int)
+        month = request.args.get('month', type=int)
+        if not year or not month:
+            return error_response('year and month are required', 400)
         
-        # Create new ranking records and assign roll numbers from previous month
-        for idx, rank_data in enumerate(rankings):
-            # ALWAYS use previous month's roll number map, ignore current roll_number
-            user_id = rank_data['user_id']
-            
-            # Inherit from previous month or assign new roll number
-            if user_id in prev_roll_map:
-                roll_number = prev_roll_map[user_id]
-                print(f"✅ User {user_id}: Inherited roll {roll_number} from previous month")
-            else:
-                # New student: assign roll number based on current rank
-                roll_number = idx + 1
-                print(f"🆕 User {user_id}: New student, assigned roll {roll_number}")
-            
-            ranking = MonthlyRanking(
-                monthly_exam_id=exam_id,
-                user_id=rank_data['user_id'],
-                position=rank_data['position'],
-                roll_number=roll_number,  # Use previous month's roll or auto-assigned
-                total_exam_marks=rank_data['total_exam_marks'],
-                total_possible_marks=rank_data['total_possible_marks'],
-                attendance_marks=rank_data['attendance_marks'],
-                bonus_marks=0,  # No bonus marks as requested
-                final_total=rank_data['final_total'],
-                max_possible_total=rank_data['total_possible'],
-                percentage=rank_data['percentage'],
-                grade=rank_data['grade'],
-                gpa=rank_data['gpa'],
-                exam_gpa=rank_data['exam_gpa'],
-                previous_position=rank_data.get('previous_position'),
-                is_final=True
-            )
-            db.session.add(ranking)
-            updated_count += 1
+        return success_response('Month-end steps retrieved', {
+            'year': year,
+            'month': month,
+            'steps': get_month_end_steps(year, month)
+        })
         
-        db.session.commit()
+    except Exception as e:
+        logger.error(f"Error getting month-end steps: {e}")
+        return error_response(f'Failed to retrieve month-end steps: {str(e)}', 500)
+
+@monthly_exams_bp.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_background_job(job_id):
+    """Poll the status and progress of a background job"""
+    try:
+        job = get_job(job_id)
+        if not job:
+            return error_response('Job not found', 404)
         
-        return success_response('Monthly rankings generated and saved successfully', {
-            'rankings_count': updated_count,
-            'exam_title': monthly_exam.title,
-            'total_students': len(rankings)
-        })
+        return success_response('Job status retrieved', serialize_job(job))
         
     except Exception as e:
-        db.session.rollback()
-        logger.error(f"Error generating monthly ranking: {e}")
-        return error_response(f'Failed to generate ranking: {str(e)}', 500)
+        logger.error(f"Error getting job status: {e}")
+        return error_response(f'Failed to get job status: {str(e)}', 500)
 
 @monthly_exams_bp.route('/<int:exam_id>/rankings-status', methods=['GET'])
 @login_required
@@ -859,6 +632,7 @@ def toggle_homepage_feature(exam_id):
         # Update the flag
         monthly_exam.show_on_homepage = show_on_homepage
         db.session.commit()
+        refresh_homepage_snapshot()
         
         message = 'Top 3 students will now appear on homepage' if show_on_homepage else 'Removed from homepage featured results'
         
@@ -886,33 +660,38 @@ def get_monthly_ranking(exam_id):
 def get_merit_list(exam_id):
     """Get merit list for monthly exam"""
     try:
-        top_count = request.args.get('top', type=int, default=10)
+        top_count = min(max(request.args.get('top', type=int, default=10), 1), MERIT_LIST_MAX_TOP)
         
         monthly_exam = MonthlyExam.query.get(exam_id)
         if not monthly_exam:
             return error_response('Monthly exam not found', 404)
         
-        rankings = calculate_monthly_rankings(exam_id, return_data=True)
-        
-        # Get top performers
-        merit_list = rankings[:top_count]
-        
-        # Add detailed performance data
-        for rank in merit_list:
-            user = User.query.get(rank['user_id'])
-            subject_wise_marks = get_subject_wise_marks(exam_id, rank['user_id'])
+        def build_merit_list():
+            rankings = calculate_monthly_rankings(exam_id, return_data=True)
             
-            rank.update({
-                'student_name': user.full_name,
-                'student_id': user.student_id,
-                'phone_number': user.phoneNumber,
-                'subject_wise_marks': subject_wise_marks
-            })
+            # Get top performers
+            merit_list = rankings[:top_count]
+            
+            # Add detailed performance data
+            for rank in merit_list:
+                user = User.query.get(rank['user_id'])
+                subject_wise_marks = get_subject_wise_marks(exam_id, rank['user_id'])
+                
+                rank.update({
+                    'student_name': user.full_name,
+                    'student_id': user.student_id,
+                    'phone_number': user.phoneNumber,
+                    'subject_wise_marks': subject_wise_marks
+                })
+            return {'merit_list': merit_list, 'total_students': len(rankings)}
+        
+        # Concurrent requests share one computation until the exam's marks change
+        result = shared_result(f'merit_list_{exam_id}_{top_count}',
+                               make_fingerprint(*get_marks_fingerprint(exam_id)), build_merit_list)
         
         return success_response('Merit list retrieved successfully', {
             'monthly_exam': serialize_monthly_exam(monthly_exam),
-            'merit_list': merit_list,
-            'total_students': len(rankings)
+            **result
         })
         
     except Exception as e:
@@ -929,79 +708,11 @@ def get_exam_analytics(exam_id):
         if not monthly_exam:
             return error_response('Monthly exam not found', 404)
         
-        # Get all marks for this exam
-        marks = (db.session.query(MonthlyMark)
-                .filter_by(monthly_exam_id=exam_id)
-                .all())
-        
-        if not marks:
+        analytics = cached_exam_analytics(monthly_exam)
+        if analytics is None:
             return error_response('No marks data available', 404)
         
-        # Calculate analytics
-        total_students = len(set(mark.user_id for mark in marks))
-        
-        # Overall performance
-        all_percentages = [mark.percentage for mark in marks if not mark.is_absent]
-        
-        if all_percentages:
-            avg_percentage = sum(all_percentages) / len(all_percentages)
-            highest_percentage = max(all_percentages)
-            lowest_percentage = min(all_percentages)
-        else:
-            avg_percentage = highest_percentage = lowest_percentage = 0
-        
-        # Pass/Fail statistics
-        pass_threshold = (monthly_exam.pass_marks / monthly_exam.total_marks) * 100
-        passed_count = sum(1 for p in all_percentages if p >= pass_threshold)
-        failed_count = len(all_percentages) - passed_count
-        absent_count = sum(1 for mark in marks if mark.is_absent)
-        
-        # Grade distribution
-        grade_distribution = {}
-        for mark in marks:
-            if not mark.is_absent:
-                grade = mark.grade or 'F'
-                grade_distribution[grade] = grade_distribution.get(grade, 0) + 1
-        
-        # Subject-wise performance
-        subjects = list(set(
-            exam.subject for exam in monthly_exam.individual_exams
-        ))
-        
-        subject_analytics = {}
-        for subject in subjects:
-            subject_marks = [
-                mark for mark in marks 
-                if mark.individual_exam.subject == subject and not mark.is_absent
-            ]
-            
-            if subject_marks:
-                subject_percentages = [mark.percentage for mark in subject_marks]
-                subject_analytics[subject] = {
-                    'average': sum(subject_percentages) / len(subject_percentages),
-                    'highest': max(subject_percentages),
-                    'lowest': min(subject_percentages),
-                    'students_count': len(subject_marks)
-                }
-        
-        analytics_data = {
-            'monthly_exam': serialize_monthly_exam(monthly_exam),
-            'overall_statistics': {
-                'total_students': total_students,
-                'average_percentage': round(avg_percentage, 2),
-                'highest_percentage': round(highest_percentage, 2),
-                'lowest_percentage': round(lowest_percentage, 2),
-                'pass_percentage': round((passed_count / total_students * 100), 2) if total_students > 0 else 0
-            },
-            'performance_breakdown': {
-                'passed': passed_count,
-                'failed': failed_count,
-                'absent': absent_count,
-                'total': total_students
-            },
-            'grade_distribution': grade_distribution,
-            'subject_wise_performance': subject_analytics
-        }
+        analytics_data = {'monthly_exam': serialize_monthly_exam(monthly_exam), **analytics}
         
         return success_response('Analytics retrieved successfully', analytics_data)
         
@@ -1027,6 +738,7 @@ def publish_results(exam_id):
         monthly_exam.result_published_at = datetime.utcnow()
         
         db.session.commit()
+        refresh_homepage_snapshot()
         
         # Send notifications to students (optional)
         send_notifications = request.get_json().get('send_notifications', False)
@@ -1155,6 +867,8 @@ def create_individual_exam(exam_id):
         monthly_exam.total_marks = new_total
         monthly_exam.pass_marks = int(new_total * 0.33)  # Update pass marks to 33% of new total
         
+        mark_rankings_stale([exam_id])
+        
         db.session.commit()
         
         return success_response('Individual exam created successfully', {
@@ -1244,133 +958,70 @@ def submit_individual_exam_marks(exam_id, individual_exam_id):
             logger.error("Empty students data provided")
             return error_response('At least one student mark is required', 400)
         
+        # Look up every referenced student in one IN query
+        students_by_id = load_students_by_id(
+            entry.get('user_id') for entry in students_data if isinstance(entry, dict)
+        )
+        mark_rows = []
+        
         for idx, student_entry in enumerate(students_data):
-            try:
-                # Validate student entry structure
-                if not isinstance(student_entry, dict):
-                    errors.append(f"Student entry {idx + 1}: Must be an object")
-                    continue
-                
-                user_id = student_entry.get('user_id')
-                marks_obtained = student_entry.get('marks_obtained')
-                
-                # Validate user_id
-                if not user_id:
-                    errors.append(f"Student entry {idx + 1}: user_id is required")
-                    continue
-                
-                # Validate marks_obtained
-                if marks_obtained is None or marks_obtained == '':
-                    errors.append(f"Student entry {idx + 1}: marks_obtained is required")
-                    continue
-                
-                # Convert and validate marks
-                try:
-                    marks_obtained = float(marks_obtained)
-                    if marks_obtained < 0:
-                        errors.append(f"Student entry {idx + 1}: marks cannot be negative")
-                        continue
-                    if marks_obtained > individual_exam.marks:
-                        errors.append(f"Student entry {idx + 1}: marks ({marks_obtained}) cannot exceed total marks ({individual_exam.marks})")
-                        continue
-                except (ValueError, TypeError) as e:
-                    errors.append(f"Student entry {idx + 1}: invalid marks format ({marks_obtained})")
-                    continue
-                
-                # Validate user exists
-                try:
-                    user = User.query.get(user_id)
-                    if not user:
-                        errors.append(f"Student entry {idx + 1}: student not found (ID: {user_id})")
-                        continue
-                except Exception as db_error:
-                    error_msg = f"Student entry {idx + 1}: database error while fetching student {user_id}: {str(db_error)}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
-                    continue
-            
-                # Check if mark already exists
-                try:
-                    existing_mark = MonthlyMark.query.filter_by(
-                        monthly_exam_id=exam_id,
-                        individual_exam_id=individual_exam_id,
-                        user_id=user_id
-                    ).first()
-                except Exception as db_error:
-                    error_msg = f"Student entry {idx + 1}: database error while checking existing marks: {str(db_error)}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
-                    continue
-                
-                # Calculate percentage, grade, and GPA
-                percentage = (marks_obtained / individual_exam.marks) * 100 if individual_exam.marks > 0 else 0
-                grade, gpa = calculate_grade_and_gpa(percentage)
-                
-                # Prepare SMS notification data
-                sms_notifications.append({
-                    'student': user,
-                    'marks_obtained': marks_obtained,
-                    'total_marks': individual_exam.marks,
-                    'percentage': percentage,
-                    'grade': grade,
-                    'subject': individual_exam.subject,
-                    'exam_title': individual_exam.title
-                })
-                
-                if existing_mark:
-                    # Update existing mark
-                    existing_mark.marks_obtained = marks_obtained
-                    existing_mark.total_marks = individual_exam.marks
-                    existing_mark.percentage = percentage
-                    existing_mark.grade = grade
-                    existing_mark.gpa = gpa
-                    existing_mark.is_absent = False  # No absent option
-                    existing_mark.remarks = ''      # No remarks option
-                    existing_mark.updated_at = datetime.utcnow()
-                    logger.info(f"Updated mark for user {user_id}: {marks_obtained}/{individual_exam.marks}")
-                else:
-                    # Create new mark
-                    monthly_mark = MonthlyMark(
-                        monthly_exam_id=exam_id,
-                        individual_exam_id=individual_exam_id,
-                        user_id=user_id,
-                        marks_obtained=marks_obtained,
-                        total_marks=individual_exam.marks,
-                        percentage=percentage,
-                        grade=grade,
-                        gpa=gpa,
-                        is_absent=False,  # No absent option
-                        remarks=''        # No remarks option
-                    )
-                    db.session.add(monthly_mark)
-                    logger.info(f"Created new mark for user {user_id}: {marks_obtained}/{individual_exam.marks}")
-                
-                saved_count += 1
-                
-            except Exception as entry_error:
-                error_msg = f"Student entry {idx + 1}: {str(entry_error)}"
-                logger.error(error_msg)
-                errors.append(error_msg)
+            user, marks_obtained, validation_error = validate_mark_entry(
+                student_entry, individual_exam, students_by_id
+            )
+            if validation_error:
+                errors.append(f"Student entry {idx + 1}: {validation_error}")
                 continue
+            
+            row = build_mark_row(exam_id, individual_exam, user.id, marks_obtained)
+            mark_rows.append(row)
+            
+            # Prepare SMS notification data
+            sms_notifications.append({
+                'student': user,
+                'marks_obtained': marks_obtained,
+                'total_marks': individual_exam.marks,
+                'percentage': row['percentage'],
+                'grade': row['grade'],
+                'subject': individual_exam.subject,
+                'exam_title': individual_exam.title
+            })
+            
+            saved_count += 1
         
         # If there were validation errors, return them
         if errors and saved_count == 0:
             return error_response(f'Validation errors: {"; ".join(errors[:5])}', 400)
         
-        # Commit database changes
+        # Write every row with one INSERT ... ON CONFLICT on unique_monthly_mark
         try:
+            existing_user_ids = load_existing_mark_user_ids(
+                exam_id, individual_exam_id, {row['user_id'] for row in mark_rows}
+            )
+            upsert_monthly_marks(mark_rows)
+            corrected_user_ids = {row['user_id'] for row in mark_rows}
+            ranking_update = None
+            if len(corrected_user_ids) == 1:
+                # A single correction moves one student instead of re-ranking the batch
+                ranking_update = update_student_ranking(monthly_exam, corrected_user_ids.pop())
+            else:
+                mark_rankings_stale([exam_id])
             db.session.commit()
-            logger.info(f"Successfully saved {saved_count} marks to database")
+            if ranking_update and ranking_update['final_updated']:
+                refresh_homepage_snapshot()
+            logger.info(f"Successfully saved {saved_count} marks to database "
+                        f"({len(existing_user_ids)} updated, "
+                        f"{len({row['user_id'] for row in mark_rows}) - len(existing_user_ids)} created)")
         except Exception as db_error:
             db.session.rollback()
             logger.error(f"Database commit failed: {str(db_error)}")
             return error_response(f'Failed to save marks to database: {str(db_error)}', 500)
         
-        # Send SMS notifications after successful save
+        # Queue SMS notifications after successful save; the outbox worker sends them
         current_user = get_current_user()
-        sms_sent_count = 0
+        sms_queued_count = 0
         sms_failed_count = 0
         sms_errors = []
+        queued_items = []
         
         # Check if SMS is enabled and user has SMS balance
         send_sms = data.get('send_sms', False)
@@ -1379,35 +1030,39 @@ def submit_individual_exam_marks(exam_id, individual_exam_id):
             exam_template_message = get_sms_template('exam_result')
             
             for notification in sms_notifications:
+                student = notification['student']
+                
+                # Determine phone number to send to (prefer parent/guardian phone)
+                target_phone = get_target_phone(student)
+                
+                if not target_phone:
+                    sms_errors.append(f"No valid phone number for {student.full_name}")
+                    sms_failed_count += 1
+                    continue
+                
+                if sms_queued_count >= current_user.sms_count:
+                    sms_errors.append(f"SMS balance exhausted before {student.full_name}")
+                    sms_failed_count += 1
+                    continue
+                
+                # Generate message using template
+                message = generate_exam_result_message(exam_template_message, notification)
+                queued_items.append(enqueue_sms(target_phone, message, user_id=student.id, sent_by=current_user.id,
+                                                category='exam_result', charge_sender=True))
+                sms_queued_count += 1
+            
+            if sms_queued_count:
                 try:
-                    student = notification['student']
-                    
-                    # Determine phone number to send to (prefer parent/guardian phone)
-                    target_phone = get_target_phone(student)
-                    
-                    if not target_phone:
-                        sms_errors.append(f"No valid phone number for {student.full_name}")
-                        sms_failed_count += 1
-                        continue
-                    
-                    # Generate message using template
-                    message = generate_exam_result_message(exam_template_message, notification)
-                    
-                    # Send SMS
-                    sms_result = send_sms_notification(target_phone, message, current_user)
-                    if sms_result.get('success'):
-                        sms_sent_count += 1
-                        logger.info(f"SMS sent successfully to {target_phone} for {student.full_name}")
-                    else:
-                        error_msg = sms_result.get('error', 'Unknown SMS error')
-                        sms_errors.append(f"SMS failed for {student.full_name}: {error_msg}")
-                        sms_failed_count += 1
-                            
+                    # One reservation holds the campaign's credits and the teacher's quota
+                    reserve_campaign(queued_items, created_by=current_user.id, reference='outbox:exam_result')
+                    db.session.commit()
+                    notify_outbox()
                 except Exception as sms_error:
-                    error_msg = f"SMS error for {student.full_name}: {str(sms_error)}"
-                    logger.warning(error_msg)
-                    sms_errors.append(error_msg)
-                    sms_failed_count += 1
+                    db.session.rollback()
+                    logger.error(f"Failed to queue SMS notifications: {str(sms_error)}")
+                    sms_errors.append(f"Failed to queue SMS: {str(sms_error)}")
+                    sms_failed_count += sms_queued_count
+                    sms_queued_count = 0
         
         # Prepare response data
         response_data = {
@@ -1423,7 +1078,7 @@ def submit_individual_exam_marks(exam_id, individual_exam_id):
         # Add SMS info if SMS was attempted
         if send_sms:
             response_data.update({
-                'sms_sent': sms_sent_count,
+                'sms_queued': sms_queued_count,
                 'sms_failed': sms_failed_count,
                 'remaining_sms_balance': current_user.sms_count
             })
@@ -1494,6 +1149,63 @@ def get_individual_exam_marks(exam_id, individual_exam_id):
         logger.error(f"Error getting individual exam marks: {e}")
         return error_response(f'Failed to retrieve marks: {str(e)}', 500)
 
+@monthly_exams_bp.route('/<int:exam_id>/individual-exams/<int:individual_exam_id>/marks/import', methods=['POST'])
+@login_required
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
+def import_individual_exam_marks(exam_id, individual_exam_id):
+    """Import marks for an individual exam from an uploaded CSV/XLSX sheet"""
+    try:
+        monthly_exam = MonthlyExam.query.get(exam_id)
+        if not monthly_exam:
+            return error_response('Monthly exam not found', 404)
+        
+        individual_exam = IndividualExam.query.filter_by(
+            id=individual_exam_id, 
+            monthly_exam_id=exam_id
+        ).first()
+        
+        if not individual_exam:
+            return error_response('Individual exam not found', 404)
+        
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            return error_response('A CSV or XLSX file is required', 400)
+        
+        # Rows are streamed from the upload and written in chunks
+        try:
+            report = import_marks_sheet(upload, monthly_exam, individual_exam)
+        except ValueError as parse_error:
+            db.session.rollback()
+            return error_response(str(parse_error), 400)
+        
+        if report['imported_count'] == 0:
+            db.session.rollback()
+            if not report['errors']:
+                return error_response('The uploaded sheet has no marks rows', 400)
+            row_errors = [f"Row {e['row']}: {e['error']}" for e in report['errors'][:5]]
+            return error_response(f'Validation errors: {"; ".join(row_errors)}', 400)
+        
+        mark_rankings_stale([exam_id])
+        db.session.commit()
+        
+        logger.info(f"Imported {report['imported_count']} marks for individual exam {individual_exam_id} "
+                    f"({report['error_count']} row errors)")
+        
+        message = f"Imported {report['imported_count']} marks"
+        if report['error_count']:
+            message += f" ({report['error_count']} rows skipped)"
+        
+        return success_response(message, {
+            'exam_title': individual_exam.title,
+            'total_marks': individual_exam.marks,
+            **report
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error importing individual exam marks: {e}")
+        return error_response(f'Failed to import marks: {str(e)}', 500)
+
 @monthly_exams_bp.route('/<int:exam_id>/individual-exams/<int:individual_exam_id>', methods=['DELETE'])
 @login_required
 @require_role(UserRole.TEACHER, UserRole.SUPER_USER)
@@ -1528,6 +1240,8 @@ def delete_individual_exam(exam_id, individual_exam_id):
         monthly_exam.total_marks = new_total
         monthly_exam.pass_marks = int(new_total * 0.33) if new_total > 0 else 0
         
+        mark_rankings_stale([exam_id])
+        
         db.session.commit()
         
         return success_response(f'Individual exam deleted successfully. {marks_deleted} marks record(s) removed.', {
@@ -1567,10 +1281,20 @@ def delete_monthly_exam(exam_id):
         # Delete individual exams
         individual_exams_deleted = IndividualExam.query.filter_by(monthly_exam_id=exam_id).delete()
         
+        # Delete the stored ranking snapshot
+        RankingSnapshot.query.filter_by(monthly_exam_id=exam_id).delete()
+        
+        # Delete bonus marks
+        MonthlyBonusMark.query.filter_by(monthly_exam_id=exam_id).delete()
+        
         # Delete the monthly exam
+        was_featured = monthly_exam.show_on_homepage
         db.session.delete(monthly_exam)
         db.session.commit()
         
+        if was_featured:
+            refresh_homepage_snapshot()
+        
         return success_response(f'Monthly exam period deleted successfully. Removed {marks_deleted} marks, {rankings_deleted} rankings, and {individual_exams_deleted} individual exams.', {
             'marks_deleted': marks_deleted,
             'rankings_deleted': rankings_deleted,
@@ -1607,37 +1331,6 @@ def serialize_monthly_exam(exam):
         'created_at': exam.created_at.isoformat()
     }
 
-def calculate_grade_and_gpa(percentage):
-    """Calculate grade and GPA based on percentage"""
-    if percentage >= 80:
-        return 'A+', 5.00
-    elif percentage >= 70:
-        return 'A', 4.00
-    elif percentage >= 60:
-        return 'A-', 3.50
-    elif percentage >= 50:
-        return 'B', 3.00
-    elif percentage >= 40:
-        return 'C', 2.00
-    elif percentage >= 33:
-        return 'D', 1.00
-    else:
-        return 'F', 0.00
-
-def get_bonus_marks_for_exam(exam_id, user_id):
-    """Get bonus marks for a student in a monthly exam"""
-    try:
-        bonus_key = f"monthly_exam_bonus_{exam_id}"
-        bonus_setting = Settings.query.filter_by(key=bonus_key).first()
-        
-        if bonus_setting and bonus_setting.value:
-            return float(bonus_setting.value.get(str(user_id), 0))
-        
-        return 0
-    except Exception as e:
-        logger.error(f"Error getting bonus marks: {e}")
-        return 0
-
 def calculate_monthly_rankings(exam_id, return_data=False):
     """Calculate and update rankings for monthly exam"""
     try:
@@ -1757,14 +1450,11 @@ def validate_phone_number(phone):
 def get_sms_template(template_type):
     """Get SMS template with fallback to default templates"""
     try:
-        # PRIORITY 1: Get template from database (permanent storage for all teachers)
-        template_key = f"sms_template_{template_type}"
-        template_setting = Settings.query.filter_by(key=template_key).first()
-        
-        if template_setting and template_setting.value:
-            message = template_setting.value.get('message')
-            if message:
-                return message
+        # PRIORITY 1: Template saved in the database (permanent storage for all teachers),
+        # loaded once per worker by the template registry
+        message = get_saved_template(template_type)
+        if message:
+            return message
         
         # PRIORITY 2: Try session as fallback (for backward compatibility)
         from flask import session
@@ -1830,7 +1520,7 @@ def generate_exam_result_message(template, notification):
         }
         
         # Format the template (short Bangla: "{student_name} পেয়েছে {marks}/{total} ({subject}) {date}")
-        message = template.format(**variables)
+        message = compile_template(template).render(variables)
         
         # New short template fits in 1 SMS (100 chars for mixed Bangla/English)
         return message
@@ -1840,131 +1530,117 @@ def generate_exam_result_message(template, notification):
         # Ultimate fallback
         return f"{notification['student'].first_name} scored {int(notification['marks_obtained'])}/{int(notification['total_marks'])} marks in {notification['subject']}"
 
-def send_sms_notification(phone, message, current_user):
-    """Send SMS notification and log the attempt"""
+
+@monthly_exams_bp.route('/homepage-top-performers', methods=['GET'])
+def get_homepage_top_performers():
+    """Get top 3 students from all monthly exams featured on homepage (precomputed snapshot)"""
     try:
-        # Use the BulkSMSBD API
-        api_key = "gsOKLO6XtKsANCvgPHNt"
-        sender_id = "8809617628909"
-        api_url = "http://bulksmsbd.net/api/smsapi"
-        
-        # Format phone number
-        formatted_phone = validate_phone_number(phone)
-        if not formatted_phone:
-            return {'success': False, 'error': 'Invalid phone number format'}
-        
-        # Prepare API payload
-        payload = {
-            'api_key': api_key,
-            'type': 'text',
-            'number': formatted_phone,
-            'senderid': sender_id,
-            'message': message
-        }
+        body, etag = get_homepage_snapshot()
         
-        # Create SMS log entry
-        sms_log = SmsLog(
-            phone_number=formatted_phone,
-            message=message,
-            sent_by=current_user.id,
-            status=SmsStatus.PENDING
-        )
+        response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.no_cache = True  # Revalidate with If-None-Match on every view
+        return response.make_conditional(request)
         
-        # Find user by phone number for logging
-        user = User.query.filter_by(phoneNumber=formatted_phone).first()
-        if user:
-            sms_log.user_id = user.id
-        
-        # Send SMS
-        response = requests.post(api_url, data=payload, timeout=30)
-        
-        if response.status_code == 200:
-            # Check if response contains success indicator
-            response_text = response.text.lower()
-            if 'success' in response_text or 'sent' in response_text:
-                sms_log.status = SmsStatus.SENT
-                sms_log.sent_at = datetime.utcnow()
-                sms_log.cost = 1  # Default cost
-                
-                # Deduct SMS count from user
-                current_user.sms_count = max(0, current_user.sms_count - 1)
-                
-                db.session.add(sms_log)
-                db.session.commit()
-                
-                return {'success': True, 'message_id': None, 'cost': 1}
-            else:
-                sms_log.status = SmsStatus.FAILED
-                sms_log.api_response = {'error': response.text}
-                db.session.add(sms_log)
-                db.session.commit()
-                
-                return {'success': False, 'error': response.text}
-        else:
-            sms_log.status = SmsStatus.FAILED
-            sms_log.api_response = {'error': f'HTTP {response.status_code}: {response.text}'}
-            db.session.add(sms_log)
-            db.session.commit()
-            
-            return {'success': False, 'error': f'HTTP {response.status_code}: {response.text}'}
-    
-    except requests.exceptions.Timeout:
-        return {'success': False, 'error': 'SMS API timeout'}
-    except requests.exceptions.ConnectionError:
-        return {'success': False, 'error': 'SMS API connection error'}
     except Exception as e:
-        return {'success': False, 'error': f'SMS API error: {str(e)}'}
+        logger.error(f"Error getting homepage top performers: {e}")
+        return error_response(f'Failed to get top performers: {str(e)}', 500)
 
+@monthly_exams_bp.route('/students/<int:student_id>/timeline', methods=['GET'])
+@login_required
+def get_student_timeline_route(student_id):
+    """Get a student's position, percentage, GPA and attendance for each monthly exam"""
+    try:
+        current_user = get_current_user()
+        
+        # Students can only see their own progress
+        if current_user.role == UserRole.STUDENT and current_user.id != student_id:
+            return error_response('Access denied', 403)
+        
+        student = db.session.get(User, student_id)
+        if not student or student.role != UserRole.STUDENT:
+            return error_response('Student not found', 404)
+        
+        try:
+            start = parse_year_month(request.args['start']) if request.args.get('start') else None
+            end = parse_year_month(request.args['end']) if request.args.get('end') else None
+        except ValueError:
+            return error_response('start and end must be in YYYY-MM format', 400)
+        
+        timeline = get_student_timeline(student_id, start, end)
+        
+        return success_response('Student timeline retrieved', {
+            'student_id': student_id,
+            'student_name': student.full_name,
+            'months_count': len(timeline),
+            'timeline': timeline
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting student timeline: {e}")
+        return error_response(f'Failed to get student timeline: {str(e)}', 500)
 
-@monthly_exams_bp.route('/homepage-top-performers', methods=['GET'])
-def get_homepage_top_performers():
-    """Get top 3 students from all monthly exams featured on homepage"""
+@monthly_exams_bp.route('/<int:exam_id>/report-cards', methods=['GET'])
+@login_required
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
+def download_report_cards(exam_id):
+    """Download every student's report card for a monthly exam as one ZIP"""
     try:
-        # Find all monthly exams that are marked to show on homepage
-        featured_exams = MonthlyExam.query.filter_by(show_on_homepage=True).all()
+        monthly_exam = db.session.get(MonthlyExam, exam_id)
+        if not monthly_exam:
+            return error_response('Monthly exam not found', 404)
         
-        if not featured_exams:
-            return success_response('No featured exams', {'featured_results': []})
+        cards = load_report_cards(monthly_exam)
+        if not cards:
+            return error_response('No final rankings found. Please generate rankings first.', 400)
         
-        featured_results = []
+        workers = current_app.config.get('REPORT_CARD_WORKERS') or os.cpu_count() or 1
+        filename = re.sub(r'[^A-Za-z0-9]+', '_', f'report_cards_{monthly_exam.title}').strip('_') + '.zip'
         
-        for exam in featured_exams:
-            # Get top 3 rankings for this exam
-            top_rankings = MonthlyRanking.query.filter_by(
-                monthly_exam_id=exam.id,
-                is_final=True
-            ).order_by(MonthlyRanking.position.asc()).limit(3).all()
-            
-            if top_rankings:
-                top_students = []
-                for ranking in top_rankings:
-                    student = User.query.get(ranking.user_id)
-                    if student:
-                        top_students.append({
-                            'position': ranking.position,
-                            'student_name': student.full_name,
-                            'student_phone': student.phoneNumber,
-                            'roll_number': ranking.roll_number,
-                            'total_marks': ranking.final_total,
-                            'total_possible': ranking.max_possible_total,
-                            'percentage': round(ranking.percentage, 2) if ranking.percentage else 0,
-                            'grade': ranking.grade
-                        })
-                
-                featured_results.append({
-                    'exam_id': exam.id,
-                    'exam_title': exam.title,
-                    'month': exam.month,
-                    'year': exam.year,
-                    'batch_name': exam.batch.name if exam.batch else 'N/A',
-                    'top_students': top_students
-                })
+        response = current_app.response_class(
+            stream_zip(iter_rendered_cards(cards, workers)),
+            mimetype='application/zip'
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
         
-        return success_response('Featured top performers retrieved', {
-            'featured_results': featured_results,
-            'count': len(featured_results)
-        })
+    except Exception as e:
+        logger.error(f"Error generating report cards: {e}")
+        return error_response(f'Failed to generate report cards: {str(e)}', 500)
+
+@monthly_exams_bp.route('/transcripts', methods=['GET'])
+@login_required
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
+def download_transcripts():
+    """Download year-end transcripts of a batch as CSV or JSON lines"""
+    try:
+        batch_id = request.args.get('batch_id', type=int)
+        year = request.args.get('year', type=int)
+        output_format = request.args.get('format', 'csv')
+        if not batch_id or not year:
+            return error_response('batch_id and year are required', 400)
+        if output_format not in TRANSCRIPT_FORMATS:
+            return error_response(f"format must be one of: {', '.join(TRANSCRIPT_FORMATS)}", 400)
+        
+        batch = db.session.get(Batch, batch_id)
+        if not batch:
+            return error_response('Batch not found', 404)
+        
+        inputs = load_transcript_inputs(batch_id, year)
+        if not inputs['exams']:
+            return error_response('No monthly exams found for this batch and year', 404)
+        
+        if output_format == 'csv':
+            body, mimetype = iter_transcript_csv(inputs), 'text/csv; charset=utf-8'
+        else:
+            body, mimetype = iter_transcript_jsonl(inputs), 'application/x-ndjson'
+        filename = re.sub(r'[^A-Za-z0-9]+', '_', f'transcripts_{batch.name}_{year}').strip('_')
+        
+        response = current_app.response_class(body, mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{output_format}"'
+        return response
         
     except Exception as e:
-        logger.error(f"Error getting homepage top performers: {e}")
-        return error_response(f'Failed to get top performers: {str(e)}', 500)
\ No newline at end of file
+        logger.error(f"Error generating transcripts: {e}")
+        return error_response(f'Failed to generate transcripts: {str(e)}', 500)
@@ -6,6 +6,7 @@ from flask import Blueprint, request
 from models import db, MonthlyResult, User, Batch, ExamSubmission, Attendance, Fee, UserRole, AttendanceStatus, FeeStatus
 from utils.auth import login_required, require_role, get_current_user, check_batch_access
 from utils.response import success_response, error_response, paginated_response
+from services.attendance_calendar import get_month_calendar
 from sqlalchemy import or_, and_, func, extract, case
 from datetime import datetime, date
 import calendar
@@ -170,6 +171,8 @@ def calculate_monthly_results():
         last_day = calendar.monthrange(year, month)[1]
         end_date = date(year, month, last_day)
         
+        working_days = get_month_calendar(batch_id, year, month).working_days
+        
         calculated_results = []
         
         for student in students:
@@ -207,11 +210,10 @@ def calculate_monthly_results():
                 Attendance.date <= end_date
             ).all()
             
-            if attendance_records:
-                present_count = len([a for a in attendance_records if a.status in [AttendanceStatus.PRESENT, AttendanceStatus.LATE]])
-                attendance_percentage = (present_count / len(attendance_records) * 100)
-            else:
-                attendance_percentage = 0
+            # Measure against the batch's working days so unmarked days are not ignored
+            present_count = len([a for a in attendance_records if a.status == AttendanceStatus.PRESENT])
+            attendance_days = working_days or len(attendance_records)
+            attendance_percentage = (present_count / attendance_days * 100) if attendance_days else 0
             
             # Check fee status for the month
             fee_records = Fee.query.filter(
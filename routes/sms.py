@@ -6,9 +6,14 @@ from flask import Blueprint, request, jsonify, session
 from models import db, SmsLog, User, Batch, UserRole, SmsStatus, user_batches
 from utils.auth import login_required, require_role, get_current_user
 from utils.response import success_response, error_response, paginated_response
+from services.sms_outbox import enqueue_sms, notify_outbox, get_outbox_summary, reserve_campaign
+from services.sms_credits import add_credits, get_sms_balance as get_system_sms_balance, reserve_credits, settle_reservation
+from services import sms_gateway
+from services.sms_dispatch import send_grouped
+from services.sms_segments import sms_cost, weighted_length
+from services.sms_template_registry import compile_template, get_user_template, invalidate_templates
 from sqlalchemy import or_, func, extract
 from datetime import datetime, date, timedelta
-import requests
 import os
 import re
 
@@ -70,29 +75,20 @@ def get_template_payload(template_id):
     if not template_def:
         return None
     custom_templates = session.get('custom_templates', {})
-    override = custom_templates.get(template_id)
+    override = custom_templates.get(template_id) or get_user_template(session.get('user_id'), template_id)
     return build_template_payload(template_def, override)
 
 
 def get_all_templates():
     """Return all templates with database and session overrides applied."""
-    from models import SmsTemplate
-    
     user_id = session.get('user_id')
     custom_templates = session.get('custom_templates', {})
     
-    # Load saved templates from database if user is logged in
-    db_templates = {}
-    if user_id:
-        saved_templates = SmsTemplate.query.filter_by(created_by=user_id, is_active=True).all()
-        for template in saved_templates:
-            db_templates[template.name] = template.content
-    
     # Merge: Database templates take precedence, then session, then defaults
     return [
         build_template_payload(
             template_def, 
-            custom_templates.get(template_def['id']) or db_templates.get(template_def['id'])
+            custom_templates.get(template_def['id']) or get_user_template(user_id, template_def['id'])
         )
         for template_def in BASE_SMS_TEMPLATES
     ]
@@ -102,19 +98,7 @@ def count_sms_characters(text):
     Count SMS characters where Bengali characters count as 2.3x English
     Bengali Unicode ranges: 0x0980-0x09FF
     """
-    bengali_count = 0
-    english_count = 0
-    
-    for char in text:
-        # Check if character is Bengali (Unicode range 0x0980-0x09FF)
-        if '\u0980' <= char <= '\u09FF':
-            bengali_count += 1
-        else:
-            english_count += 1
-    
-    # Total weighted character count (Bengali = 2.3x English)
-    total_weighted = (bengali_count * 2.3) + english_count
-    return int(total_weighted)
+    return weighted_length(text)
 
 def calculate_sms_cost(message):
     """
@@ -123,55 +107,7 @@ def calculate_sms_cost(message):
     - Bangla only (65 chars = 1 SMS, considering 2.3x multiplier)
     - Mixed (100 chars weighted = 1 SMS)
     """
-    bengali_count = 0
-    english_count = 0
-    
-    for char in message:
-        if '\u0980' <= char <= '\u09FF':
-            bengali_count += 1
-        else:
-            english_count += 1
-    
-    # Determine message type
-    if bengali_count == 0:
-        # English only: 120 chars = 1 SMS
-        sms_count = max(1, (english_count + 119) // 120)
-    elif english_count == 0:
-        # Bangla only: 65 chars = 1 SMS
-        sms_count = max(1, (bengali_count + 64) // 65)
-    else:
-        # Mixed: 100 weighted chars = 1 SMS
-        weighted_total = (bengali_count * 2.3) + english_count
-        sms_count = max(1, int((weighted_total + 99) // 100))
-    
-    return sms_count
-
-def deduct_sms_balance(sms_count):
-    """Deduct SMS count from local balance in settings"""
-    try:
-        from models import Settings
-        
-        balance_setting = Settings.query.filter_by(key='sms_balance').first()
-        if not balance_setting:
-            # Initialize with 0 balance (super admin will add balance)
-            balance_setting = Settings(
-                key='sms_balance',
-                value={'balance': 0},
-                category='sms',
-                description='Current SMS balance (managed by super admin)'
-            )
-            db.session.add(balance_setting)
-        
-        current_balance = balance_setting.value.get('balance', 0) if balance_setting.value else 0
-        new_balance = max(0, current_balance - sms_count)
-        
-        balance_setting.value = {'balance': new_balance}
-        db.session.commit()
-        
-        return new_balance
-    except Exception as e:
-        print(f"Error deducting balance: {e}")
-        return 0
+    return sms_cost(message)
 
 def validate_phone_number(phone):
     """Validate and format phone number"""
@@ -191,87 +127,12 @@ def validate_phone_number(phone):
     return None
 
 def send_sms_via_api(phone, message):
-    """Send SMS using BulkSMSBD API - Hardcoded Configuration"""
-    try:
-        # Hardcoded SMS API Configuration - DO NOT CHANGE
-        api_key = 'gsOKLO6XtKsANCvgPHNt'
-        sender_id = '8809617628909'
-        api_url = 'http://bulksmsbd.net/api/smsapi'
-        
-        # Format phone number - remove any spaces or special characters
-        formatted_phone = phone.strip().replace(' ', '').replace('-', '').replace('+', '')
-        
-        # Ensure phone starts with 88 for Bangladesh
-        if formatted_phone.startswith('0'):
-            formatted_phone = '88' + formatted_phone
-        elif not formatted_phone.startswith('88'):
-            formatted_phone = '88' + formatted_phone
-        
-        # Build URL with GET parameters
-        params = {
-            'api_key': api_key,
-            'type': 'text',
-            'number': formatted_phone,
-            'senderid': sender_id,
-            'message': message
-        }
-        
-        print(f"📤 Sending SMS to {formatted_phone}...")
-        print(f"🔗 URL: {api_url}")
-        print(f"📋 Params: {params}")
-        
-        # Send SMS using GET request
-        response = requests.get(api_url, params=params, timeout=30)
-        
-        print(f"📡 Response Status: {response.status_code}")
-        print(f"📄 Response Text: {response.text}")
-        
-        if response.status_code == 200:
-            try:
-                # Parse JSON response
-                response_data = response.json()
-                response_code = response_data.get('response_code')
-                success_message = response_data.get('success_message', '')
-                error_message = response_data.get('error_message', '')
-                
-                print(f"📊 Response Code: {response_code}")
-                
-                # BulkSMSBD success codes (typically 200 or 202)
-                if response_code in [200, 202]:
-                    print(f"✅ SMS sent successfully to {formatted_phone}")
-                    return {
-                        'success': True,
-                        'message_id': success_message,
-                        'cost': 1
-                    }
-                else:
-                    print(f"❌ SMS API error (code {response_code}): {error_message}")
-                    return {
-                        'success': False,
-                        'error': error_message or f"API Error Code: {response_code}"
-                    }
-            except ValueError:
-                # Not JSON response - treat as error
-                print(f"❌ Invalid JSON response: {response.text}")
-                return {
-                    'success': False,
-                    'error': 'Invalid API response format'
-                }
-        else:
-            error_msg = f'HTTP {response.status_code}: {response.text}'
-            print(f"❌ SMS API HTTP error: {error_msg}")
-            return {'success': False, 'error': error_msg}
-    
-    except requests.exceptions.Timeout:
-        print(f"❌ SMS API timeout for {phone}")
-        return {'success': False, 'error': 'SMS API timeout'}
-    except Exception as e:
-        print(f"❌ SMS API exception: {str(e)}")
-        return {'success': False, 'error': str(e)}
-    except requests.exceptions.ConnectionError:
-        return {'success': False, 'error': 'SMS API connection error'}
-    except Exception as e:
-        return {'success': False, 'error': f'SMS API error: {str(e)}'}
+    """Send SMS using BulkSMSBD API through the pooled gateway client"""
+    return sms_gateway.send_sms(phone, message)
+
+def send_sms_many_via_api(phones, message):
+    """Send the same SMS to several numbers in one BulkSMSBD request"""
+    return sms_gateway.send_sms_to_many(phones, message)
 
 @sms_bp.route('/send', methods=['POST'])
 @login_required
@@ -325,23 +186,24 @@ def send_sms():
         failed_count = 0
         sms_logs = []
         
-        for phone in phone_numbers:
+        # Find users by phone number in one query
+        user_ids_by_phone = dict(db.session.query(User.phoneNumber, User.id).filter(
+            User.phoneNumber.in_(phone_numbers)
+        ).all())
+        
+        # One request per chunk of numbers, concurrently under the gateway's rate limit
+        results = send_grouped([(phone, message) for phone in phone_numbers], send_many=send_sms_many_via_api)
+        
+        for phone, result in zip(phone_numbers, results):
             # Create SMS log entry
             sms_log = SmsLog(
                 phone_number=phone,
                 message=message,
                 sent_by=current_user.id,
+                user_id=user_ids_by_phone.get(phone),
                 status=SmsStatus.PENDING
             )
             
-            # Find user by phone number
-            user = User.query.filter_by(phone=phone).first()
-            if user:
-                sms_log.user_id = user.id
-            
-            # Send SMS
-            result = send_sms_via_api(phone, message)
-            
             if result['success']:
                 sms_log.status = SmsStatus.SENT
                 sms_log.sent_at = datetime.utcnow()
@@ -438,23 +300,24 @@ def send_batch_sms():
         sent_count = 0
         failed_count = 0
         
-        for phone in phone_numbers:
+        # Find users by phone number in one query
+        user_ids_by_phone = dict(db.session.query(User.phoneNumber, User.id).filter(
+            User.phoneNumber.in_(phone_numbers)
+        ).all())
+        
+        # One request per chunk of numbers, concurrently under the gateway's rate limit
+        results = send_grouped([(phone, message) for phone in phone_numbers], send_many=send_sms_many_via_api)
+        
+        for phone, result in zip(phone_numbers, results):
             # Create SMS log entry
             sms_log = SmsLog(
                 phone_number=phone,
                 message=message,
                 sent_by=current_user.id,
+                user_id=user_ids_by_phone.get(phone),
                 status=SmsStatus.PENDING
             )
             
-            # Find user by phone number
-            user = User.query.filter_by(phone=phone).first()
-            if user:
-                sms_log.user_id = user.id
-            
-            # Send SMS
-            result = send_sms_via_api(phone, message)
-            
             if result['success']:
                 sms_log.status = SmsStatus.SENT
                 sms_log.sent_at = datetime.utcnow()
@@ -580,6 +443,22 @@ def get_sms_logs():
     except Exception as e:
         return error_response(f'Failed to retrieve SMS logs: {str(e)}', 500)
 
+@sms_bp.route('/outbox', methods=['GET'])
+@login_required
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
+def get_sms_outbox():
+    """Delivery status of queued SMS (teachers see their own messages)"""
+    try:
+        current_user = get_current_user()
+        status = request.args.get('status')
+        limit = min(request.args.get('limit', 50, type=int), 200)
+
+        sent_by = current_user.id if current_user.role == UserRole.TEACHER else request.args.get('sent_by', type=int)
+        return success_response('SMS outbox retrieved successfully', get_outbox_summary(sent_by, status, limit))
+
+    except Exception as e:
+        return error_response(f'Failed to retrieve SMS outbox: {str(e)}', 500)
+
 @sms_bp.route('/templates', methods=['GET'])
 @login_required
 @require_role(UserRole.TEACHER, UserRole.SUPER_USER)
@@ -640,6 +519,7 @@ def update_sms_template(template_id):
             db.session.add(template)
         
         db.session.commit()
+        invalidate_templates()
         
         # Also update session for immediate use
         custom_templates = session.get('custom_templates', {})
@@ -698,28 +578,15 @@ def validate_sms_message():
 def get_sms_balance():
     """Get SMS balance - returns teacher's personal balance or system balance for super admin"""
     try:
-        from models import Settings
-        
         current_user = get_current_user()
                 
         # For teachers, return their personal SMS count
         if current_user.role == UserRole.TEACHER:
             balance = current_user.sms_count or 0
         else:
-            # For super admin, return system-wide balance from settings
-            balance_setting = Settings.query.filter_by(key='sms_balance').first()
-            if not balance_setting:
-                # Initialize with 0 balance (super admin will add balance)
-                balance_setting = Settings(
-                    key='sms_balance',
-                    value={'balance': 0},
-                    category='sms',
-                    description='Current SMS balance (managed by super admin)'
-                )
-                db.session.add(balance_setting)
-                db.session.commit()
-            
-            balance = balance_setting.value.get('balance', 0) if balance_setting.value else 0
+            # For super admin, return the system-wide balance from the credit ledger
+            balance = get_system_sms_balance()['balance']
+            db.session.commit()
         
         total_sent = SmsLog.query.filter(
             SmsLog.sent_by == current_user.id,
@@ -759,24 +626,10 @@ def get_personal_sms_balance():
 
 @sms_bp.route('/balance-check', methods=['GET'])
 def get_sms_balance_noauth():
-    """Get SMS balance from local settings (no auth required)"""
+    """Get SMS balance from the local credit ledger (no auth required)"""
     try:
-        from models import Settings
-        
-        # Get balance from settings
-        balance_setting = Settings.query.filter_by(key='sms_balance').first()
-        if not balance_setting:
-            # Initialize with 0 balance (super admin will add balance)
-            balance_setting = Settings(
-                key='sms_balance',
-                value={'balance': 0},
-                category='sms',
-                description='Current SMS balance (managed by super admin)'
-            )
-            db.session.add(balance_setting)
-            db.session.commit()
-        
-        balance = balance_setting.value.get('balance', 0) if balance_setting.value else 0
+        balance = get_system_sms_balance()['balance']
+        db.session.commit()
 
         # Get Sample Teacher for stats
         teacher = User.query.filter_by(first_name='Sample', last_name='Teacher', role=UserRole.TEACHER).first()
@@ -805,8 +658,6 @@ def get_sms_balance_noauth():
 def add_sms_balance():
     """Add SMS balance to system-wide balance (Super user only)"""
     try:
-        from models import Settings
-        
         data = request.get_json()
         amount = data.get('amount')
 
@@ -821,29 +672,17 @@ def add_sms_balance():
         if amount <= 0:
             return error_response('Amount must be a positive integer', 400)
 
-        # Get or create SMS balance setting
-        balance_setting = Settings.query.filter_by(key='sms_balance').first()
-        if not balance_setting:
-            balance_setting = Settings(
-                key='sms_balance',
-                value={'balance': 0},
-                category='sms',
-                description='Current SMS balance (managed by super admin)'
-            )
-            db.session.add(balance_setting)
-        
-        # Add to current balance
-        current_balance = balance_setting.value.get('balance', 0) if balance_setting.value else 0
-        new_balance = current_balance + amount
-        
-        balance_setting.value = {'balance': new_balance}
+        current_user = get_current_user()
+
+        # Credit the ledger; the balance moves in the same transaction
+        current_balance = get_system_sms_balance()['balance']
+        add_credits(amount, created_by=current_user.id, memo='Added by super user')
         db.session.commit()
 
-        current_user = get_current_user()
         return success_response('SMS balance added successfully', {
             'previous_balance': current_balance,
             'added_amount': amount,
-            'new_balance': new_balance,
+            'new_balance': get_system_sms_balance()['balance'],
             'updated_by': current_user.full_name
         })
 
@@ -1090,95 +929,39 @@ def send_bulk_sms():
         if not valid_recipients:
             return error_response('No recipients have valid phone numbers', 400)
 
-        # Send SMS to each recipient (no balance check - API handles it)
-        sent_count = 0
-        failed_count = 0
-        failed_recipients = []
-
+        # Queue one message per recipient (no balance check - API handles it);
+        # the outbox worker sends them and writes the SMS logs
+        queued_items = []
+        template = compile_template(base_message)
+        today = datetime.now().strftime('%d/%m/%Y')
         for student, phone in valid_recipients:
-            try:
-                message_to_send = base_message
-                message_to_send = message_to_send.replace('{student_name}', (student.first_name or ''))
-                message_to_send = message_to_send.replace('{batch_name}', batch.name or '')
-                message_to_send = message_to_send.replace('{date}', datetime.now().strftime('%d/%m/%Y'))
-                message_to_send = message_to_send.replace('{total}', str(getattr(student, 'total_marks', '')))
-                message_to_send = message_to_send.replace('{marks}', str(getattr(student, 'obtained_marks', '')))
-                message_to_send = message_to_send.replace('{subject}', getattr(student, 'subject', ''))
-
-                sms_response = send_sms_via_api(phone, message_to_send)
-
-                if sms_response.get('success'):
-                    # Calculate SMS cost based on message content
-                    sms_cost = calculate_sms_cost(message_to_send)
-                    
-                    sms_log = SmsLog(
-                        user_id=student.id,
-                        phone_number=phone,
-                        message=message_to_send,
-                        status=SmsStatus.SENT,
-                        api_response=sms_response,
-                        sent_by=current_user.id,
-                        cost=sms_cost,
-                        sent_at=datetime.utcnow()
-                    )
-                    db.session.add(sms_log)
-                    
-                    # Deduct from local balance
-                    deduct_sms_balance(sms_cost)
-                    sent_count += 1
-                else:
-                    sms_log = SmsLog(
-                        user_id=student.id,
-                        phone_number=phone,
-                        message=message_to_send,
-                        status=SmsStatus.FAILED,
-                        api_response=sms_response,
-                        sent_by=current_user.id,
-                        cost=0,
-                        sent_at=datetime.utcnow()
-                    )
-                    db.session.add(sms_log)
-                    failed_count += 1
-                    failed_recipients.append(student.full_name)
-
-            except Exception as e:
-                sms_log = SmsLog(
-                    user_id=student.id,
-                    phone_number=phone,
-                    message=base_message,
-                    status=SmsStatus.FAILED,
-                    api_response={'error': str(e)},
-                    sent_by=current_user.id,
-                    cost=0,
-                    sent_at=datetime.utcnow()
-                )
-                db.session.add(sms_log)
-                failed_count += 1
-                failed_recipients.append(student.full_name)
-
-        if invalid_recipients:
-            failed_recipients.extend([f'{name} (invalid phone)' for name in invalid_recipients])
+            message_to_send = template.render({
+                'student_name': student.first_name or '',
+                'batch_name': batch.name or '',
+                'date': today,
+                'total': getattr(student, 'total_marks', ''),
+                'marks': getattr(student, 'obtained_marks', ''),
+                'subject': getattr(student, 'subject', '')
+            })
+            queued_items.append(enqueue_sms(phone, message_to_send, user_id=student.id,
+                                            sent_by=current_user.id, category='bulk'))
 
+        # One credit reservation for the campaign, settled when it finishes
+        reserve_campaign(queued_items, created_by=current_user.id, reference='outbox:bulk')
         db.session.commit()
+        notify_outbox()
 
+        queued_count = len(valid_recipients)
         response_data = {
-            'sent': sent_count,
-            'failed': failed_count,
-            'total_recipients': len(valid_recipients),
+            'queued': queued_count,
+            'total_recipients': queued_count,
             'remaining_balance': current_user.sms_count or 0,
-            'failed_recipients': failed_recipients or None,
+            'failed_recipients': [f'{name} (invalid phone)' for name in invalid_recipients] or None,
             'invalid_contacts': invalid_recipients or None,
             'used_custom_message': use_custom_message
         }
 
-        if sent_count > 0 and failed_count == 0:
-            message_text = f'Successfully sent SMS to all {sent_count} recipients'
-        elif sent_count > 0 and failed_count > 0:
-            message_text = f'Sent SMS to {sent_count} recipients, {failed_count} failed'
-        else:
-            message_text = f'Failed to send SMS to all {failed_count} recipients'
-
-        return success_response(message_text, response_data)
+        return success_response(f'Queued SMS for {queued_count} recipients', response_data)
         
     except Exception as e:
         db.session.rollback()
@@ -1256,54 +1039,60 @@ def send_bulk_sms_noauth():
         if not valid_recipients:
             return error_response('No recipients have valid phone numbers', 400)
 
-        # Send SMS to each recipient (no balance check - API handles it)
+        # Send SMS to each recipient against a credit reservation;
+        # identical messages share multi-number requests
         sent_count = 0
         failed_count = 0
 
+        calls = []
+        template = compile_template(base_message)
+        today = datetime.now().strftime('%d/%m/%Y')
         for student, phone in valid_recipients:
-            try:
-                message_to_send = base_message
-                message_to_send = message_to_send.replace('{student_name}', (student.first_name or ''))
-                message_to_send = message_to_send.replace('{batch_name}', batch.name or '')
-                message_to_send = message_to_send.replace('{date}', datetime.now().strftime('%d/%m/%Y'))
+            message_to_send = template.render({
+                'student_name': student.first_name or '',
+                'batch_name': batch.name or '',
+                'date': today
+            })
+            calls.append((phone, message_to_send))
 
-                sms_response = send_sms_via_api(phone, message_to_send)
+        # Hold the campaign's credits before sending; settled once below
+        reservation = reserve_credits(sum(calculate_sms_cost(message) for _, message in calls),
+                                      reference='send-bulk-noauth', created_by=current_user.id)
+        db.session.commit()
 
+        total_cost = 0
+        try:
+            results = send_grouped(calls, send_many=send_sms_many_via_api)
+
+            for (student, _), (phone, message_to_send), sms_response in zip(valid_recipients, calls, results):
                 if sms_response.get('success'):
                     # Calculate SMS cost based on message content
                     sms_cost = calculate_sms_cost(message_to_send)
-                    
-                    sms_log = SmsLog(
-                        user_id=student.id,
-                        phone_number=phone,
-                        message=message_to_send,
-                        status=SmsStatus.SENT,
-                        api_response=sms_response,
-                        sent_by=current_user.id,
-                        cost=sms_cost,
-                        sent_at=datetime.utcnow()
-                    )
-                    db.session.add(sms_log)
-                    
-                    # Deduct from local balance
-                    deduct_sms_balance(sms_cost)
+                    total_cost += sms_cost
                     sent_count += 1
                 else:
-                    sms_log = SmsLog(
-                        user_id=student.id,
-                        phone_number=phone,
-                        message=message_to_send,
-                        status=SmsStatus.FAILED,
-                        api_response=sms_response,
-                        sent_by=current_user.id,
-                        cost=0,
-                        sent_at=datetime.utcnow()
-                    )
-                    db.session.add(sms_log)
+                    sms_cost = 0
                     failed_count += 1
-            except Exception as e:
-                failed_count += 1
 
+                db.session.add(SmsLog(
+                    user_id=student.id,
+                    phone_number=phone,
+                    message=message_to_send,
+                    status=SmsStatus.SENT if sms_response.get('success') else SmsStatus.FAILED,
+                    api_response=sms_response,
+                    sent_by=current_user.id,
+                    cost=sms_cost,
+                    sent_at=datetime.utcnow()
+                ))
+        except Exception:
+            # Never leave the credits held: charge only what was confirmed sent
+            db.session.rollback()
+            settle_reservation(reservation.id, total_cost)
+            db.session.commit()
+            raise
+
+        # Settle the reservation with what was actually sent
+        settle_reservation(reservation.id, total_cost)
         db.session.commit()
 
         response_data = {
@@ -3,9 +3,10 @@ SMS Template Management Routes
 Manage SMS templates for various notifications
 """
 from flask import Blueprint, request, jsonify, session
-from models import db, Settings, User
+from models import db, Settings, User, UserRole
 from utils.auth import login_required, require_role, get_current_user
 from utils.response import success_response, error_response
+from services.sms_template_registry import get_saved_templates, invalidate_templates
 from datetime import datetime
 import logging
 
@@ -15,14 +16,13 @@ sms_templates_bp = Blueprint('sms_templates', __name__)
 
 @sms_templates_bp.route('', methods=['GET'])
 @login_required
-@require_role('TEACHER', 'SUPER_USER')
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
 def get_templates():
     """Get all SMS templates"""
     try:
-        # Get templates from database (permanent storage for all teachers)
-        db_templates = Settings.query.filter(
-            Settings.key.like('sms_template_%')
-        ).all()
+        # Templates saved in the database (permanent storage for all teachers),
+        # loaded once per worker by the template registry
+        saved_templates = get_saved_templates()
         
         # Hardcoded short templates (not editable)
         hardcoded_templates = {
@@ -88,10 +88,8 @@ def get_templates():
         all_templates = {**hardcoded_templates, **templates}
         
         # Update with saved templates from database (for ALL editable templates)
-        for db_template in db_templates:
-            template_type = db_template.key.replace('sms_template_', '')
+        for template_type, saved_message in saved_templates.items():
             if template_type in all_templates and all_templates[template_type].get('editable', True):
-                saved_message = db_template.value.get('message', '') if db_template.value else ''
                 all_templates[template_type]['saved'] = saved_message
                 all_templates[template_type]['current'] = saved_message  # Show database value as current
         
@@ -103,7 +101,7 @@ def get_templates():
 
 @sms_templates_bp.route('/<template_type>', methods=['POST', 'PUT'])
 @login_required
-@require_role('TEACHER', 'SUPER_USER')
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
 def update_template(template_type):
     """Update SMS template permanently in database"""
     try:
@@ -158,6 +156,7 @@ def update_template(template_type):
             db.session.add(template_setting)
         
         db.session.commit()
+        invalidate_templates()
         
         return success_response('Template saved permanently to database', {
             'template_type': template_type,
@@ -174,7 +173,7 @@ def update_template(template_type):
 
 @sms_templates_bp.route('/<template_type>/save', methods=['POST', 'PUT'])
 @login_required
-@require_role('TEACHER', 'SUPER_USER')
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
 def save_template(template_type):
     """Save SMS template to database permanently"""
     try:
@@ -210,6 +209,7 @@ def save_template(template_type):
             db.session.add(template_setting)
         
         db.session.commit()
+        invalidate_templates()
         
         return success_response('Template saved successfully', {
             'template_type': template_type,
@@ -223,7 +223,7 @@ def save_template(template_type):
 
 @sms_templates_bp.route('/<template_type>/reset', methods=['POST'])
 @login_required
-@require_role('TEACHER', 'SUPER_USER')
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
 def reset_template(template_type):
     """Reset SMS template to default by removing from database"""
     try:
@@ -234,6 +234,7 @@ def reset_template(template_type):
         if template_setting:
             db.session.delete(template_setting)
             db.session.commit()
+            invalidate_templates()
         
         # Get default templates
         default_templates = {
@@ -259,7 +260,7 @@ def reset_template(template_type):
 
 @sms_templates_bp.route('/validate-message', methods=['POST'])
 @login_required
-@require_role('TEACHER', 'SUPER_USER')
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
 def validate_message():
     """Validate SMS message character count"""
     try:
@@ -295,7 +296,7 @@ def validate_message():
 
 @sms_templates_bp.route('/preview', methods=['POST'])
 @login_required
-@require_role('TEACHER', 'SUPER_USER')
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
 def preview_template():
     """Preview SMS template with accurate SMS count calculation"""
     try:
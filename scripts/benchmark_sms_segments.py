@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of SMS length and cost calculation
+Compares the per-character loops the routes and SMSService used to run with
+services.sms_segments, uncached and memoized, on a campaign-sized workload.
+
+Usage: python scripts/benchmark_sms_segments.py [recipients]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.sms_segments import segment_message
+
+
+# Previous implementations, kept here as the baseline
+def legacy_count_sms_characters(text):
+    bengali_count = 0
+    english_count = 0
+    for char in text:
+        if '\u0980' <= char <= '\u09FF':
+            bengali_count += 1
+        else:
+            english_count += 1
+    return int((bengali_count * 2.3) + english_count)
+
+
+def legacy_calculate_sms_cost(message):
+    bengali_count = 0
+    english_count = 0
+    for char in message:
+        if '\u0980' <= char <= '\u09FF':
+            bengali_count += 1
+        else:
+            english_count += 1
+    if bengali_count == 0:
+        return max(1, (english_count + 119) // 120)
+    if english_count == 0:
+        return max(1, (bengali_count + 64) // 65)
+    return max(1, int((bengali_count * 2.3 + english_count + 99) // 100))
+
+
+def legacy_service_sms_count(text):
+    char_count = len(text)
+    try:
+        text.encode('ascii')
+        is_unicode = False
+    except UnicodeEncodeError:
+        is_unicode = True
+    has_bangla = any('\u0980' <= char <= '\u09FF' for char in text)
+    if not is_unicode:
+        return 1 if char_count <= 160 else (char_count // 153) + (1 if char_count % 153 else 0)
+    if has_bangla:
+        bangla_count = sum(1 for char in text if '\u0980' <= char <= '\u09FF')
+        weighted_count = int(bangla_count * 2.2 + char_count - bangla_count)
+        return 1 if weighted_count <= 100 else (weighted_count // 100) + (1 if weighted_count % 100 else 0)
+    return 1 if char_count <= 70 else (char_count // 67) + (1 if char_count % 67 else 0)
+
+
+def campaign(recipients):
+    """Rendered texts of an attendance and an exam result campaign: few distinct texts, many sends"""
+    texts = []
+    for i in range(recipients):
+        texts.append(f'Dear Parent, Student{i % 40:03d} was ABSENT today in HSC Physics on 03/03/2025. '
+                     f'Please ensure regular attendance.')
+        texts.append(f'প্রিয় অভিভাবক, Student{i % 40:03d} গণিত পরীক্ষায় {i % 100}/100 নম্বর পেয়েছে। '
+                     f'তারিখ: 03/03/2025')
+    return texts
+
+
+def legacy(texts):
+    for text in texts:
+        legacy_count_sms_characters(text)
+        legacy_calculate_sms_cost(text)
+        legacy_service_sms_count(text)
+
+
+def unified_uncached(texts):
+    for text in texts:
+        segment_message.__wrapped__(text)
+
+
+def unified_memoized(texts):
+    for text in texts:
+        segment_message(text).sms_count
+
+
+def main():
+    recipients = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    texts = campaign(recipients)
+    runs = 20
+
+    print(f"SMS segmentation: {len(texts)} messages ({len(set(texts))} distinct), best of 5 x {runs} runs")
+    print("=" * 60)
+    baseline = None
+    for name, func in (('legacy loops (3 functions)', legacy),
+                       ('sms_segments, uncached', unified_uncached),
+                       ('sms_segments, memoized', unified_memoized)):
+        segment_message.cache_clear()
+        best = min(timeit.repeat(lambda: func(texts), number=runs, repeat=5)) / runs
+        baseline = baseline or best
+        print(f"{name:30s} {best * 1000:8.2f} ms/campaign   {baseline / best:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Attendance Calendar
+Working days and holidays per batch and month.
+
+Working days are Monday to Friday minus holidays. The weekday layout of a
+month never changes, so it is memoized for the life of the process; the
+holidays of a batch month are loaded in one query and memoized for the rest
+of the request, so callers can ask for the same month repeatedly for free.
+"""
+import calendar
+from collections import namedtuple
+from datetime import date, timedelta
+from functools import lru_cache
+
+from flask import g, has_app_context
+from sqlalchemy import or_
+
+from models import Holiday
+
+# Monday (0) to Friday (4) are attendance days
+WORKING_WEEKDAYS = frozenset(range(5))
+
+MonthCalendar = namedtuple('MonthCalendar', ['year', 'month', 'working_days', 'working_dates', 'holidays'])
+
+
+@lru_cache(maxsize=None)
+def get_month_weekdays(year, month):
+    """All Monday to Friday dates of a month"""
+    days_in_month = calendar.monthrange(year, month)[1]
+    return tuple(
+        day for day in (date(year, month, d) for d in range(1, days_in_month + 1))
+        if day.weekday() in WORKING_WEEKDAYS
+    )
+
+
+def get_holidays(batch_id, start_date, end_date):
+    """{date: name} of holidays for a batch (including all-batch holidays) in a range"""
+    query = Holiday.query.filter(Holiday.date >= start_date, Holiday.date <= end_date)
+    if batch_id is None:
+        query = query.filter(Holiday.batch_id.is_(None))
+    else:
+        query = query.filter(or_(Holiday.batch_id.is_(None), Holiday.batch_id == batch_id))
+
+    holidays = {}
+    for holiday in query.order_by(Holiday.batch_id.isnot(None)).all():
+        holidays[holiday.date] = holiday.name  # Batch-specific names win over all-batch ones
+    return holidays
+
+
+def get_month_calendar(batch_id, year, month):
+    """MonthCalendar with the working days and holidays of a batch month"""
+    cache = g.setdefault('_attendance_calendars', {}) if has_app_context() else {}
+    key = (batch_id, year, month)
+    if key not in cache:
+        days_in_month = calendar.monthrange(year, month)[1]
+        holidays = get_holidays(batch_id, date(year, month, 1), date(year, month, days_in_month))
+        working_dates = tuple(day for day in get_month_weekdays(year, month) if day not in holidays)
+        cache[key] = MonthCalendar(year, month, len(working_dates), working_dates, holidays)
+    return cache[key]
+
+
+def get_month_calendars(keys):
+    """
+    {(batch_id, year, month): MonthCalendar} for many batch months with one
+    holiday query covering all of them.
+    """
+    keys = set(keys)
+    cache = g.setdefault('_attendance_calendars', {}) if has_app_context() else {}
+    missing = [key for key in keys if key not in cache]
+    if missing:
+        start_date = min(date(year, month, 1) for _, year, month in missing)
+        end_year, end_month = max((year, month) for _, year, month in missing)
+        end_date = date(end_year, end_month, calendar.monthrange(end_year, end_month)[1])
+        batch_ids = {batch_id for batch_id, _, _ in missing if batch_id is not None}
+
+        holidays = Holiday.query.filter(
+            Holiday.date >= start_date,
+            Holiday.date <= end_date,
+            or_(Holiday.batch_id.is_(None), Holiday.batch_id.in_(batch_ids))
+        ).order_by(Holiday.batch_id.isnot(None)).all()
+
+        for batch_id, year, month in missing:
+            month_holidays = {
+                holiday.date: holiday.name for holiday in holidays
+                if (holiday.date.year, holiday.date.month) == (year, month)
+                and holiday.batch_id in (None, batch_id)
+            }
+            working_dates = tuple(day for day in get_month_weekdays(year, month) if day not in month_holidays)
+            cache[(batch_id, year, month)] = MonthCalendar(year, month, len(working_dates),
+                                                           working_dates, month_holidays)
+    return {key: cache[key] for key in keys}
+
+
+def count_working_days(batch_id, start_date, end_date):
+    """Working days of a batch between two dates (inclusive)"""
+    total = 0
+    current = date(start_date.year, start_date.month, 1)
+    while current <= end_date:
+        month_calendar = get_month_calendar(batch_id, current.year, current.month)
+        total += sum(1 for day in month_calendar.working_dates if start_date <= day <= end_date)
+        current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return total
+
+
+def invalidate_month_calendar(year, month):
+    """Drop request-memoized calendars of a month after its holidays change"""
+    if has_app_context():
+        cache = g.get('_attendance_calendars', {})
+        for key in [key for key in cache if key[1:] == (year, month)]:
+            del cache[key]
@@ -0,0 +1,98 @@
+"""
+Bonus Marks
+Teacher-added bonus marks stored per (monthly exam, student).
+
+Bonus marks used to live as one JSON blob per exam in Settings under
+"monthly_exam_bonus_{exam_id}"; migrate_settings_bonus_marks() moves them
+into the monthly_bonus_marks table.
+"""
+import logging
+from datetime import datetime
+
+from models import db, MonthlyBonusMark, MonthlyExam, Settings
+from services.marks_store import parse_user_id
+
+logger = logging.getLogger(__name__)
+
+# Settings keys of the legacy per-exam bonus blobs
+LEGACY_BONUS_KEY_PREFIX = 'monthly_exam_bonus_'
+
+
+def get_exam_bonus_marks(monthly_exam_id, user_ids=None):
+    """user_id -> bonus marks for every student of an exam (or only `user_ids`), in one query"""
+    query = db.session.query(MonthlyBonusMark.user_id, MonthlyBonusMark.bonus_marks).filter(
+        MonthlyBonusMark.monthly_exam_id == monthly_exam_id
+    )
+    if user_ids is not None:
+        query = query.filter(MonthlyBonusMark.user_id.in_(list(user_ids)))
+    rows = query.all()
+    return {user_id: bonus_marks for user_id, bonus_marks in rows}
+
+
+def save_bonus_marks(monthly_exam_id, bonus_by_user, updated_by=None):
+    """
+    Insert or update bonus marks for many students.
+
+    bonus_by_user maps user_id -> bonus marks. Does not commit.
+    """
+    if not bonus_by_user:
+        return 0
+    now = datetime.utcnow()
+    existing = {
+        bonus.user_id: bonus
+        for bonus in MonthlyBonusMark.query.filter(
+            MonthlyBonusMark.monthly_exam_id == monthly_exam_id,
+            MonthlyBonusMark.user_id.in_(list(bonus_by_user))
+        ).all()
+    }
+    for user_id, bonus_marks in bonus_by_user.items():
+        bonus = existing.get(user_id)
+        if bonus:
+            bonus.bonus_marks = bonus_marks
+            bonus.updated_by = updated_by
+            bonus.updated_at = now
+        else:
+            db.session.add(MonthlyBonusMark(
+                monthly_exam_id=monthly_exam_id,
+                user_id=user_id,
+                bonus_marks=bonus_marks,
+                updated_by=updated_by
+            ))
+    return len(bonus_by_user)
+
+
+def migrate_settings_bonus_marks():
+    """
+    Move legacy Settings bonus blobs into monthly_bonus_marks.
+
+    Existing table rows win over the blob. Blobs are deleted once copied, so
+    running this again is a no-op. Commits. Returns (exams, rows) migrated.
+    """
+    settings = Settings.query.filter(Settings.key.like(f'{LEGACY_BONUS_KEY_PREFIX}%')).all()
+    exam_ids = {row[0] for row in db.session.query(MonthlyExam.id).all()}
+
+    exams_migrated = rows_migrated = 0
+    for setting in settings:
+        exam_id = parse_user_id(setting.key[len(LEGACY_BONUS_KEY_PREFIX):])
+        if exam_id not in exam_ids:
+            logger.warning(f"Skipping {setting.key}: monthly exam not found")
+            continue
+
+        already_saved = set(get_exam_bonus_marks(exam_id))
+        bonus_by_user = {}
+        for raw_user_id, raw_bonus in (setting.value or {}).items():
+            user_id = parse_user_id(raw_user_id)
+            try:
+                bonus_marks = float(raw_bonus)
+            except (TypeError, ValueError):
+                logger.warning(f"Skipping bonus {raw_bonus!r} for user {raw_user_id} in {setting.key}")
+                continue
+            if user_id and user_id not in already_saved:
+                bonus_by_user[user_id] = bonus_marks
+
+        rows_migrated += save_bonus_marks(exam_id, bonus_by_user, setting.updated_by)
+        db.session.delete(setting)
+        exams_migrated += 1
+
+    db.session.commit()
+    return exams_migrated, rows_migrated
@@ -0,0 +1,153 @@
+"""
+Monthly Exam Analytics
+Performance statistics computed with grouped SQL aggregates.
+
+Results are cached per exam and reused until the exam's marks fingerprint
+(row count, latest update and marks total) or its pass settings change. A
+recompute is coalesced across workers and its result shared between them.
+"""
+import logging
+import threading
+
+from sqlalchemy import func, case, distinct, and_
+
+from models import db, MonthlyMark, IndividualExam
+from services.single_flight import shared_result, make_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Score distribution buckets of 10 percentage points; 100% falls in 90-100
+HISTOGRAM_BUCKETS = 10
+
+# Cached analytics per exam, shared by requests in this worker
+ANALYTICS_CACHE_SIZE = 64
+
+_lock = threading.Lock()
+_cache = {}  # exam_id -> (fingerprint, data)
+
+
+def get_marks_fingerprint(exam_id):
+    """Cheap aggregate that changes whenever the exam's marks are written"""
+    count, last_update, marks_total = db.session.query(
+        func.count(MonthlyMark.id),
+        func.max(MonthlyMark.updated_at),
+        func.sum(MonthlyMark.marks_obtained)
+    ).filter(MonthlyMark.monthly_exam_id == exam_id).one()
+    return count, last_update.isoformat() if last_update else None, marks_total
+
+
+def _bucket_expression():
+    percentage = MonthlyMark.percentage
+    whens = [(percentage >= bucket * 10, bucket) for bucket in range(HISTOGRAM_BUCKETS - 1, 0, -1)]
+    return case(*whens, else_=0)
+
+
+def compute_exam_analytics(monthly_exam):
+    """Aggregate statistics for an exam, or None when it has no marks"""
+    exam_id = monthly_exam.id
+    present = MonthlyMark.is_absent.isnot(True)
+    pass_threshold = (monthly_exam.pass_marks / monthly_exam.total_marks) * 100
+    passed = case((and_(present, MonthlyMark.percentage >= pass_threshold), 1), else_=0)
+    absent = case((MonthlyMark.is_absent == True, 1), else_=0)
+
+    overall = db.session.query(
+        func.count(MonthlyMark.id),
+        func.count(distinct(MonthlyMark.user_id)),
+        func.avg(case((present, MonthlyMark.percentage))),
+        func.max(case((present, MonthlyMark.percentage))),
+        func.min(case((present, MonthlyMark.percentage))),
+        func.count(case((present, 1))),
+        func.sum(passed),
+        func.sum(absent)
+    ).filter(MonthlyMark.monthly_exam_id == exam_id).one()
+
+    mark_count, total_students, avg_pct, max_pct, min_pct, present_count, passed_count, absent_count = overall
+    if not mark_count:
+        return None
+    passed_count = passed_count or 0
+
+    subject_rows = db.session.query(
+        IndividualExam.subject,
+        func.count(MonthlyMark.id),
+        func.count(case((present, 1))),
+        func.avg(case((present, MonthlyMark.percentage))),
+        func.max(case((present, MonthlyMark.percentage))),
+        func.min(case((present, MonthlyMark.percentage))),
+        func.sum(passed),
+        func.sum(absent)
+    ).join(
+        IndividualExam, MonthlyMark.individual_exam_id == IndividualExam.id
+    ).filter(
+        MonthlyMark.monthly_exam_id == exam_id
+    ).group_by(IndividualExam.subject).all()
+
+    subject_analytics = {}
+    for subject, count, students_count, avg_s, max_s, min_s, pass_s, absent_s in subject_rows:
+        if not students_count:
+            continue
+        subject_analytics[subject] = {
+            'average': avg_s,
+            'highest': max_s,
+            'lowest': min_s,
+            'students_count': students_count,
+            'pass_count': pass_s or 0,
+            'absent_count': absent_s or 0,
+            'total_entries': count
+        }
+
+    grade = func.coalesce(MonthlyMark.grade, 'F')
+    grade_distribution = dict(db.session.query(
+        grade, func.count(MonthlyMark.id)
+    ).filter(
+        MonthlyMark.monthly_exam_id == exam_id, present
+    ).group_by(grade).all())
+
+    bucket = _bucket_expression().label('bucket')
+    bucket_counts = dict(db.session.query(
+        bucket, func.count(MonthlyMark.id)
+    ).filter(
+        MonthlyMark.monthly_exam_id == exam_id, present
+    ).group_by(bucket).all())
+    score_distribution = [{
+        'range': f'{b * 10}-{b * 10 + 9}' if b < HISTOGRAM_BUCKETS - 1 else f'{b * 10}-100',
+        'min_percentage': b * 10,
+        'count': bucket_counts.get(b, 0)
+    } for b in range(HISTOGRAM_BUCKETS)]
+
+    return {
+        'overall_statistics': {
+            'total_students': total_students,
+            'average_percentage': round(avg_pct or 0, 2),
+            'highest_percentage': round(max_pct or 0, 2),
+            'lowest_percentage': round(min_pct or 0, 2),
+            'pass_percentage': round((passed_count / total_students * 100), 2) if total_students > 0 else 0
+        },
+        'performance_breakdown': {
+            'passed': passed_count,
+            'failed': present_count - passed_count,
+            'absent': absent_count or 0,
+            'total': total_students
+        },
+        'grade_distribution': grade_distribution,
+        'subject_wise_performance': subject_analytics,
+        'score_distribution': score_distribution
+    }
+
+
+def cached_exam_analytics(monthly_exam):
+    """Cached analytics for an exam; recomputed after its marks change"""
+    fingerprint = (get_marks_fingerprint(monthly_exam.id),
+                   monthly_exam.pass_marks, monthly_exam.total_marks)
+
+    cached = _cache.get(monthly_exam.id)
+    if cached and cached[0] == fingerprint:
+        return cached[1]
+
+    # Workers share one computation per fingerprint instead of each running the aggregates
+    data = shared_result(f'exam_analytics_{monthly_exam.id}', make_fingerprint(*fingerprint),
+                         lambda: compute_exam_analytics(monthly_exam))
+    with _lock:
+        if len(_cache) >= ANALYTICS_CACHE_SIZE and monthly_exam.id not in _cache:
+            _cache.pop(next(iter(_cache)))
+        _cache[monthly_exam.id] = (fingerprint, data)
+    return data
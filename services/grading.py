@@ -0,0 +1,22 @@
+"""
+Grading
+Letter grade and GPA of a percentage, shared by mark entry and rankings.
+"""
+
+
+def calculate_grade_and_gpa(percentage):
+    """Calculate grade and GPA based on percentage"""
+    if percentage >= 80:
+        return 'A+', 5.00
+    elif percentage >= 70:
+        return 'A', 4.00
+    elif percentage >= 60:
+        return 'A-', 3.50
+    elif percentage >= 50:
+        return 'B', 3.00
+    elif percentage >= 40:
+        return 'C', 2.00
+    elif percentage >= 33:
+        return 'D', 1.00
+    else:
+        return 'F', 0.00
@@ -0,0 +1,165 @@
+"""
+Homepage Top Performers Snapshot
+Precomputed JSON for the public homepage-top-performers endpoint.
+
+The response body is built once from the saved final rankings and written to
+a file next to the app instance with its ETag. Every worker serves the cached
+bytes and only re-reads the file when its mtime changes, so anonymous landing
+page traffic never reaches the database. Writes that change featured exams or
+their final rankings call rebuild_homepage_snapshot() after committing.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func
+
+from models import db, MonthlyExam, MonthlyRanking, Batch, User
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILENAME = 'homepage_top_performers.json'
+TOP_PERFORMERS_COUNT = 3
+
+_lock = threading.Lock()
+_cache = {}  # path -> (mtime_ns, body, etag)
+
+
+def get_snapshot_path():
+    return current_app.config.get('HOMEPAGE_SNAPSHOT_PATH') or os.path.join(
+        current_app.instance_path, SNAPSHOT_FILENAME)
+
+
+def build_homepage_payload():
+    """Featured exams with their top 3 final rankings, in two queries"""
+    featured_exams = db.session.query(
+        MonthlyExam.id, MonthlyExam.title, MonthlyExam.month, MonthlyExam.year, Batch.name
+    ).outerjoin(
+        Batch, MonthlyExam.batch_id == Batch.id
+    ).filter(
+        MonthlyExam.show_on_homepage == True
+    ).order_by(MonthlyExam.id).all()
+
+    if not featured_exams:
+        return 'No featured exams', {'featured_results': []}
+
+    row_number = func.row_number().over(
+        partition_by=MonthlyRanking.monthly_exam_id,
+        order_by=(MonthlyRanking.position.asc(), MonthlyRanking.id.asc())
+    ).label('row_number')
+    ranked = db.session.query(
+        MonthlyRanking.monthly_exam_id.label('exam_id'),
+        MonthlyRanking.position,
+        MonthlyRanking.roll_number,
+        MonthlyRanking.final_total,
+        MonthlyRanking.max_possible_total,
+        MonthlyRanking.percentage,
+        MonthlyRanking.grade,
+        User.first_name,
+        User.last_name,
+        User.phoneNumber,
+        row_number
+    ).join(
+        User, MonthlyRanking.user_id == User.id
+    ).filter(
+        MonthlyRanking.monthly_exam_id.in_([exam.id for exam in featured_exams]),
+        MonthlyRanking.is_final == True
+    ).subquery()
+
+    top_rows = db.session.query(ranked).filter(
+        ranked.c.row_number <= TOP_PERFORMERS_COUNT
+    ).order_by(ranked.c.exam_id, ranked.c.row_number).all()
+
+    top_by_exam = {}
+    for row in top_rows:
+        top_by_exam.setdefault(row.exam_id, []).append({
+            'position': row.position,
+            'student_name': f"{row.first_name} {row.last_name}",
+            'student_phone': row.phoneNumber,
+            'roll_number': row.roll_number,
+            'total_marks': row.final_total,
+            'total_possible': row.max_possible_total,
+            'percentage': round(row.percentage, 2) if row.percentage else 0,
+            'grade': row.grade
+        })
+
+    featured_results = [{
+        'exam_id': exam_id,
+        'exam_title': title,
+        'month': month,
+        'year': year,
+        'batch_name': batch_name or 'N/A',
+        'top_students': top_by_exam[exam_id]
+    } for exam_id, title, month, year, batch_name in featured_exams if exam_id in top_by_exam]
+
+    return 'Featured top performers retrieved', {
+        'featured_results': featured_results,
+        'count': len(featured_results)
+    }
+
+
+def _render(message, data):
+    body = json.dumps({
+        'success': True,
+        'message': message,
+        'timestamp': datetime.utcnow().isoformat(),
+        'data': data
+    }, separators=(',', ':')).encode('utf-8')
+    # The ETag ignores the timestamp so an unchanged rebuild keeps client caches valid
+    etag = hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+    return body, etag
+
+
+def rebuild_homepage_snapshot():
+    """Recompute the snapshot and publish it to every worker; returns (body, etag)"""
+    body, etag = _render(*build_homepage_payload())
+    path = get_snapshot_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    blob = json.dumps({'etag': etag, 'body': body.decode('utf-8')}).encode('utf-8')
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.homepage-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    with _lock:
+        _cache[path] = (os.stat(path).st_mtime_ns, body, etag)
+    return body, etag
+
+
+def refresh_homepage_snapshot():
+    """Rebuild after a committed write, logging instead of failing the caller"""
+    try:
+        rebuild_homepage_snapshot()
+    except Exception as e:
+        logger.error(f"Error rebuilding homepage snapshot: {e}")
+
+
+def get_homepage_snapshot():
+    """Return (body, etag), reading the snapshot file only when it changed"""
+    path = get_snapshot_path()
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return rebuild_homepage_snapshot()
+
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime_ns:
+        return cached[1], cached[2]
+
+    with open(path, 'rb') as f:
+        stored = json.loads(f.read())
+    body, etag = stored['body'].encode('utf-8'), stored['etag']
+    with _lock:
+        _cache[path] = (mtime_ns, body, etag)
+    return body, etag
@@ -0,0 +1,158 @@
+"""
+Background Jobs
+Run long tasks outside the HTTP request and expose their progress.
+
+Jobs are rows in background_jobs so any worker can answer a progress poll.
+A job's active_key is unique while it is queued or running, which keeps a
+double-click from starting the same work twice. The task itself runs in a
+daemon thread of the worker that accepted it, inside its own app context.
+"""
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from models import db, BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# A queued/running job not updated for this long is treated as abandoned
+# (e.g. its worker was restarted) and no longer blocks a new run
+JOB_STALE_AFTER = timedelta(minutes=15)
+
+
+class JobContext:
+    """Handle passed to a running task for progress reporting"""
+
+    def __init__(self, job):
+        self.job = job
+
+    def update(self, progress, message=None, commit=True):
+        self.job.progress = max(0, min(100, int(progress)))
+        if message is not None:
+            self.job.message = message[:255]
+        self.job.updated_at = datetime.utcnow()
+        if commit:
+            db.session.commit()
+
+    def complete(self, result=None, message='Completed'):
+        """Mark the job finished; committed with the task's own final writes"""
+        self.job.status = 'completed'
+        self.job.result = result
+        self.job.active_key = None
+        self.job.finished_at = datetime.utcnow()
+        self.update(100, message, commit=False)
+
+
+def serialize_job(job):
+    return {
+        'job_id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'result': job.result,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def get_job(job_id):
+    return db.session.get(BackgroundJob, job_id)
+
+
+def _release_abandoned(job_key):
+    cutoff = datetime.utcnow() - JOB_STALE_AFTER
+    abandoned = BackgroundJob.query.filter(
+        BackgroundJob.active_key == job_key,
+        BackgroundJob.updated_at < cutoff
+    ).first()
+    if abandoned:
+        abandoned.status = 'failed'
+        abandoned.error = 'Job was abandoned before it finished'
+        abandoned.active_key = None
+        abandoned.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def _execute(job_id, task, args):
+    job = get_job(job_id)
+    if job is None:
+        return
+    context = JobContext(job)
+    try:
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        context.update(0, 'Started')
+
+        task(context, *args)
+
+        if job.status != 'completed':
+            context.complete()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Background job {job_id} ({job.job_type}) failed: {e}", exc_info=True)
+        job = get_job(job_id)
+        job.status = 'failed'
+        job.error = str(e)
+        job.active_key = None
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def _run_in_thread(app, job_id, task, args):
+    with app.app_context():
+        try:
+            _execute(job_id, task, args)
+        finally:
+            db.session.remove()
+
+
+def enqueue_job(job_type, job_key, task, args=(), created_by=None):
+    """
+    Start task(context, *args) in the background unless the same key is active.
+
+    Returns (job, created). When a job with the same key is already queued or
+    running, that job is returned with created=False.
+    """
+    _release_abandoned(job_key)
+
+    job = BackgroundJob(
+        id=uuid.uuid4().hex,
+        job_type=job_type,
+        job_key=job_key,
+        active_key=job_key,
+        status='queued',
+        message='Queued',
+        created_by=created_by
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        existing = BackgroundJob.query.filter_by(active_key=job_key).first()
+        if existing:
+            return existing, False
+        raise
+
+    app = current_app._get_current_object()
+    if app.config.get('JOBS_RUN_INLINE'):
+        _execute(job.id, task, args)
+    else:
+        threading.Thread(
+            target=_run_in_thread,
+            args=(app, job.id, task, args),
+            name=f'job-{job_type}-{job.id[:8]}',
+            daemon=True
+        ).start()
+
+    return job, True
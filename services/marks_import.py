@@ -0,0 +1,200 @@
+"""
+Marks Sheet Import
+Streaming CSV/XLSX import of individual exam marks.
+
+Rows are read one at a time from the uploaded file, matched to students by
+roll number or phone through lookup maps built once per sheet, validated with
+the same rules as manual marks entry and written in chunks through the bulk
+upsert. Only the per-row error report is kept in memory.
+"""
+import csv
+import io
+import logging
+import re
+
+from services.ranking_engine import get_batch_students
+from services.roll_numbers import get_roll_numbers
+from services.marks_store import validate_mark_entry, build_mark_row, upsert_monthly_marks
+
+logger = logging.getLogger(__name__)
+
+# Rows written per upsert statement while streaming
+IMPORT_CHUNK_SIZE = 500
+
+# Accepted spellings of the sheet's column headers
+HEADER_ALIASES = {
+    'roll': 'roll_number', 'roll_no': 'roll_number', 'roll_number': 'roll_number',
+    'phone': 'phone', 'phone_number': 'phone', 'mobile': 'phone', 'phonenumber': 'phone',
+    'marks': 'marks_obtained', 'mark': 'marks_obtained', 'marks_obtained': 'marks_obtained',
+}
+
+
+def normalize_header(value):
+    key = re.sub(r'[^a-z0-9]+', '_', str(value or '').strip().lower()).strip('_')
+    return HEADER_ALIASES.get(key, key)
+
+
+def normalize_phone(value):
+    """Reduce a phone number to its 11-digit local form (01XXXXXXXXX)"""
+    digits = re.sub(r'\D', '', str(value or ''))
+    if len(digits) == 10 and digits.startswith('1'):
+        digits = '0' + digits  # Leading zero dropped by spreadsheet number cells
+    if len(digits) >= 11:
+        digits = digits[-11:]
+    return digits if len(digits) == 11 and digits.startswith('01') else None
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _iter_csv(stream):
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(text_stream)
+        header = next(reader, None)
+        if header is None:
+            return
+        yield [normalize_header(h) for h in header]
+        for row in reader:
+            yield row
+    finally:
+        text_stream.detach()
+
+
+def _iter_xlsx(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('XLSX import requires openpyxl; upload a CSV file instead')
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield [normalize_header(h) for h in header]
+        for row in rows:
+            yield [_cell_text(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def iter_sheet_rows(file_storage):
+    """
+    Yield (row_number, {column: text}) for every data row of an uploaded sheet.
+
+    Raises ValueError for unsupported files or missing columns.
+    """
+    filename = (file_storage.filename or '').lower()
+    if filename.endswith('.csv'):
+        rows = _iter_csv(file_storage.stream)
+    elif filename.endswith('.xlsx'):
+        rows = _iter_xlsx(file_storage.stream)
+    else:
+        raise ValueError('Only .csv and .xlsx files are supported')
+
+    header = next(rows, None)
+    if not header:
+        raise ValueError('The uploaded sheet is empty')
+    if 'marks_obtained' not in header:
+        raise ValueError('The sheet needs a "marks" column')
+    if 'roll_number' not in header and 'phone' not in header:
+        raise ValueError('The sheet needs a "roll" or "phone" column')
+
+    for row_number, row in enumerate(rows, start=2):
+        values = {column: _cell_text(row[idx]) if idx < len(row) else ''
+                  for idx, column in enumerate(header)}
+        if not any(values.values()):
+            continue  # Skip blank lines
+        yield row_number, values
+
+
+def build_student_lookup(monthly_exam):
+    """
+    Map roll numbers and phone numbers to the batch's students.
+
+    Roll numbers come from this exam's rankings, falling back to the
+    previous month's final rankings, as in the comprehensive ranking.
+    """
+    students = {student.id: student for student in get_batch_students(monthly_exam.batch_id)}
+
+    roll_numbers = get_roll_numbers(monthly_exam)
+    by_roll = {str(roll_numbers[user_id]): student
+               for user_id, student in students.items() if roll_numbers.get(user_id)}
+
+    by_phone = {}
+    for student in students.values():
+        for phone in {normalize_phone(student.phoneNumber), normalize_phone(student.guardian_phone)}:
+            if phone:
+                by_phone.setdefault(phone, []).append(student)
+
+    return by_roll, by_phone
+
+
+def match_student(values, by_roll, by_phone):
+    """Return (student, error) for one sheet row"""
+    roll_number = values.get('roll_number', '')
+    if roll_number:
+        student = by_roll.get(roll_number.split('.')[0])
+        if student:
+            return student, None
+        if not values.get('phone'):
+            return None, f"no student with roll number {roll_number}"
+
+    phone = normalize_phone(values.get('phone'))
+    if not phone:
+        return None, "roll number or a valid phone number is required"
+    matches = by_phone.get(phone, [])
+    if not matches:
+        return None, f"no student with phone {phone}"
+    if len(matches) > 1:
+        return None, f"phone {phone} matches {len(matches)} students; use the roll number"
+    return matches[0], None
+
+
+def import_marks_sheet(file_storage, monthly_exam, individual_exam):
+    """
+    Stream a marks sheet into monthly_marks.
+
+    Does not commit. Returns a report dict with the imported count and
+    per-row errors.
+    """
+    by_roll, by_phone = build_student_lookup(monthly_exam)
+
+    imported_count = 0
+    total_rows = 0
+    errors = []
+    pending = []
+
+    for row_number, values in iter_sheet_rows(file_storage):
+        total_rows += 1
+        student, error = match_student(values, by_roll, by_phone)
+        if not error:
+            entry = {'user_id': student.id, 'marks_obtained': values.get('marks_obtained')}
+            _, marks_obtained, error = validate_mark_entry(entry, individual_exam, {student.id: student})
+        if error:
+            errors.append({'row': row_number, 'error': error})
+            continue
+
+        pending.append(build_mark_row(monthly_exam.id, individual_exam, student.id, marks_obtained))
+        imported_count += 1
+
+        if len(pending) >= IMPORT_CHUNK_SIZE:
+            upsert_monthly_marks(pending)
+            pending = []
+
+    if pending:
+        upsert_monthly_marks(pending)
+
+    return {
+        'total_rows': total_rows,
+        'imported_count': imported_count,
+        'error_count': len(errors),
+        'errors': errors
+    }
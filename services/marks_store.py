@@ -0,0 +1,166 @@
+"""
+Monthly Marks Store
+Validation and bulk upsert of individual exam marks.
+
+A marks sheet is saved with one IN query for the students, one query for the
+marks that already exist, and a dialect-aware INSERT ... ON CONFLICT against
+the unique_monthly_mark constraint instead of two queries per row.
+"""
+import logging
+import sqlite3
+from datetime import datetime
+
+from models import db, MonthlyMark, User
+from services.grading import calculate_grade_and_gpa
+
+logger = logging.getLogger(__name__)
+
+# Columns of the unique_monthly_mark constraint
+MARK_KEY_COLUMNS = ('monthly_exam_id', 'individual_exam_id', 'user_id')
+
+# Columns overwritten when a mark already exists
+MARK_UPDATE_COLUMNS = ('marks_obtained', 'total_marks', 'percentage', 'grade', 'gpa',
+                       'is_absent', 'remarks', 'updated_at')
+
+# SQLite builds before 3.32 allow at most 999 bound parameters per statement
+SQLITE_MAX_PARAMS = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+
+
+def parse_user_id(value):
+    """Coerce a user ID from request data to int, or None"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_students_by_id(user_ids):
+    """Fetch all referenced users in one IN query"""
+    ids = {uid for uid in (parse_user_id(u) for u in user_ids) if uid is not None}
+    if not ids:
+        return {}
+    return {user.id: user for user in User.query.filter(User.id.in_(ids)).all()}
+
+
+def load_existing_mark_user_ids(monthly_exam_id, individual_exam_id, user_ids):
+    """IDs of the students that already have a mark for this paper"""
+    if not user_ids:
+        return set()
+    rows = db.session.query(MonthlyMark.user_id).filter(
+        MonthlyMark.monthly_exam_id == monthly_exam_id,
+        MonthlyMark.individual_exam_id == individual_exam_id,
+        MonthlyMark.user_id.in_(list(user_ids))
+    ).all()
+    return {row[0] for row in rows}
+
+
+def validate_mark_entry(student_entry, individual_exam, students_by_id):
+    """
+    Validate one row of a marks sheet.
+
+    Returns (student, marks_obtained, None) on success or (None, None, error).
+    """
+    if not isinstance(student_entry, dict):
+        return None, None, "Must be an object"
+
+    user_id = student_entry.get('user_id')
+    marks_obtained = student_entry.get('marks_obtained')
+
+    if not user_id:
+        return None, None, "user_id is required"
+
+    if marks_obtained is None or marks_obtained == '':
+        return None, None, "marks_obtained is required"
+
+    try:
+        marks_obtained = float(marks_obtained)
+    except (ValueError, TypeError):
+        return None, None, f"invalid marks format ({marks_obtained})"
+    if marks_obtained < 0:
+        return None, None, "marks cannot be negative"
+    if marks_obtained > individual_exam.marks:
+        return None, None, f"marks ({marks_obtained}) cannot exceed total marks ({individual_exam.marks})"
+
+    student = students_by_id.get(parse_user_id(user_id))
+    if not student:
+        return None, None, f"student not found (ID: {user_id})"
+
+    return student, marks_obtained, None
+
+
+def build_mark_row(monthly_exam_id, individual_exam, user_id, marks_obtained, now=None):
+    """Column values for one monthly_marks row"""
+    now = now or datetime.utcnow()
+    percentage = (marks_obtained / individual_exam.marks) * 100 if individual_exam.marks > 0 else 0
+    grade, gpa = calculate_grade_and_gpa(percentage)
+    return {
+        'monthly_exam_id': monthly_exam_id,
+        'individual_exam_id': individual_exam.id,
+        'user_id': user_id,
+        'marks_obtained': marks_obtained,
+        'total_marks': individual_exam.marks,
+        'percentage': percentage,
+        'grade': grade,
+        'gpa': gpa,
+        'is_absent': False,  # No absent option
+        'remarks': '',       # No remarks option
+        'created_at': now,
+        'updated_at': now
+    }
+
+
+def _upsert_statement(dialect_name, rows):
+    table = MonthlyMark.__table__
+
+    if dialect_name in ('sqlite', 'postgresql'):
+        if dialect_name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=list(MARK_KEY_COLUMNS),
+            set_={column: stmt.excluded[column] for column in MARK_UPDATE_COLUMNS}
+        )
+
+    if dialect_name in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(rows)
+        return stmt.on_duplicate_key_update(
+            {column: stmt.inserted[column] for column in MARK_UPDATE_COLUMNS}
+        )
+
+    return None
+
+
+def upsert_monthly_marks(rows):
+    """
+    Insert or update monthly_marks rows keyed by unique_monthly_mark.
+
+    Does not commit. Rows sharing a key collapse to the last one.
+    """
+    rows = list({tuple(row[c] for c in MARK_KEY_COLUMNS): row for row in rows}.values())
+    if not rows:
+        return 0
+
+    dialect_name = db.session.get_bind().dialect.name
+
+    if _upsert_statement(dialect_name, rows[:1]) is None:
+        # Unknown dialect: fall back to ORM merge by natural key
+        for row in rows:
+            mark = MonthlyMark.query.filter_by(**{c: row[c] for c in MARK_KEY_COLUMNS}).first()
+            if mark:
+                for column in MARK_UPDATE_COLUMNS:
+                    setattr(mark, column, row[column])
+            else:
+                db.session.add(MonthlyMark(**row))
+        return len(rows)
+
+    chunk_size = len(rows)
+    if dialect_name == 'sqlite':
+        chunk_size = max(1, SQLITE_MAX_PARAMS // len(rows[0]))
+
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(_upsert_statement(dialect_name, rows[start:start + chunk_size]))
+
+    return len(rows)
@@ -0,0 +1,251 @@
+"""
+Month-End Close
+One job that closes a month for every active batch.
+
+For each batch the steps run in order: save final rankings of the month's
+exams, publish their results, queue the result SMS and summarize fee dues.
+Batches are closed in parallel by a pool of worker threads, each with its own
+app context and database session. Every step's outcome and timing is stored
+in month_end_steps, so re-running the close skips completed steps and only
+retries what failed or has not run yet.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func
+
+from models import db, Batch, MonthlyExam, MonthEndStep, Fee, FeeStatus, User, UserRole
+from services.jobs import enqueue_job
+from services.homepage_snapshot import refresh_homepage_snapshot
+from services.ranking_engine import get_month_bounds
+from services.ranking_jobs import save_final_rankings
+from services.sms_outbox import enqueue_sms, notify_outbox, reserve_campaign
+
+logger = logging.getLogger(__name__)
+
+JOB_TYPE_MONTH_END = 'month_end_close'
+
+STEP_GENERATE_RANKING = 'generate_ranking'
+STEP_PUBLISH_RESULTS = 'publish_results'
+STEP_SEND_RESULT_SMS = 'send_result_sms'
+STEP_FEE_DUES = 'fee_dues'
+
+MONTH_END_STEPS = (STEP_GENERATE_RANKING, STEP_PUBLISH_RESULTS, STEP_SEND_RESULT_SMS, STEP_FEE_DUES)
+
+
+def _month_exams(batch, year, month):
+    return MonthlyExam.query.filter_by(batch_id=batch.id, year=year, month=month).order_by(MonthlyExam.id).all()
+
+
+def generate_rankings_step(batch, year, month, options):
+    exams = _month_exams(batch, year, month)
+    for monthly_exam in exams:
+        save_final_rankings(monthly_exam)
+    return {'exams': len(exams)}
+
+
+def publish_results_step(batch, year, month, options):
+    published = []
+    for monthly_exam in _month_exams(batch, year, month):
+        if not monthly_exam.show_results:
+            monthly_exam.show_results = True
+            monthly_exam.result_published_at = datetime.utcnow()
+            published.append(monthly_exam.id)
+    return {'published': published}
+
+
+def send_result_sms_step(batch, year, month, options):
+    exams = [exam for exam in _month_exams(batch, year, month) if exam.show_results]
+    if not exams:
+        return {'queued': 0}
+    students = User.query.join(User.batches).filter(
+        Batch.id == batch.id,
+        User.role == UserRole.STUDENT,
+        User.is_active == True,
+        User.is_archived == False
+    ).all()
+    # Queued and reserved in the step's transaction: a re-run after a failure queues nothing twice
+    queued_items = []
+    for monthly_exam in exams:
+        message = f"প্রিয় শিক্ষার্থী, {monthly_exam.title} এর ফলাফল প্রকাশিত হয়েছে। আপনার ফলাফল দেখতে লগইন করুন।"
+        for student in students:
+            if student.phoneNumber:
+                queued_items.append(enqueue_sms(student.phoneNumber, message, user_id=student.id,
+                                                sent_by=options.get('created_by'), category='result'))
+    reserve_campaign(queued_items, created_by=options.get('created_by'),
+                     reference=f'month_end:{year}-{month:02d}:{batch.id}')
+    return {'queued': len(queued_items)}
+
+
+def fee_dues_step(batch, year, month, options):
+    _, month_end = get_month_bounds(year, month)
+    outstanding = Fee.amount + func.coalesce(Fee.exam_fee, 0) + func.coalesce(Fee.others_fee, 0) \
+        + func.coalesce(Fee.late_fee, 0) - func.coalesce(Fee.discount, 0)
+    students, fees, amount = db.session.query(
+        func.count(func.distinct(Fee.user_id)), func.count(Fee.id), func.coalesce(func.sum(outstanding), 0)
+    ).filter(
+        Fee.batch_id == batch.id,
+        Fee.status != FeeStatus.PAID,
+        Fee.due_date <= month_end
+    ).one()
+    return {'students_with_dues': students, 'unpaid_fees': fees, 'amount_due': float(amount)}
+
+
+STEP_RUNNERS = {
+    STEP_GENERATE_RANKING: generate_rankings_step,
+    STEP_PUBLISH_RESULTS: publish_results_step,
+    STEP_SEND_RESULT_SMS: send_result_sms_step,
+    STEP_FEE_DUES: fee_dues_step
+}
+
+
+def get_completed_steps(year, month):
+    """{(batch_id, step)} already completed for a month, in one query"""
+    rows = db.session.query(MonthEndStep.batch_id, MonthEndStep.step).filter_by(
+        year=year, month=month, status='completed'
+    ).all()
+    return {(batch_id, step) for batch_id, step in rows}
+
+
+def _record_step(batch_id, year, month, step, status, duration_ms, result=None, error=None, job_id=None):
+    record = MonthEndStep.query.filter_by(year=year, month=month, batch_id=batch_id, step=step).first()
+    if record is None:
+        record = MonthEndStep(year=year, month=month, batch_id=batch_id, step=step)
+        db.session.add(record)
+    record.status = status
+    record.duration_ms = duration_ms
+    record.result = result
+    record.error = error
+    record.job_id = job_id
+    record.finished_at = datetime.utcnow()
+
+
+def close_batch(batch_id, year, month, steps, completed, options, job_id=None):
+    """
+    Run the month-end steps for one batch, each committed on its own.
+
+    A failed step stops the batch; later steps wait for a re-run.
+    """
+    batch = db.session.get(Batch, batch_id)
+    started = time.perf_counter()
+    outcome = {'batch_id': batch_id, 'batch_name': batch.name, 'status': 'completed', 'steps': []}
+
+    for step in steps:
+        if (batch_id, step) in completed:
+            outcome['steps'].append({'step': step, 'status': 'skipped'})
+            continue
+
+        step_started = time.perf_counter()
+        try:
+            result = STEP_RUNNERS[step](batch, year, month, options)
+            duration_ms = int((time.perf_counter() - step_started) * 1000)
+            _record_step(batch_id, year, month, step, 'completed', duration_ms, result, job_id=job_id)
+            db.session.commit()
+            outcome['steps'].append({'step': step, 'status': 'completed', 'duration_ms': duration_ms,
+                                     'result': result})
+        except Exception as e:
+            db.session.rollback()
+            duration_ms = int((time.perf_counter() - step_started) * 1000)
+            logger.error(f"Month-end step {step} failed for batch {batch_id}: {e}", exc_info=True)
+            _record_step(batch_id, year, month, step, 'failed', duration_ms, error=str(e), job_id=job_id)
+            db.session.commit()
+            outcome['steps'].append({'step': step, 'status': 'failed', 'duration_ms': duration_ms,
+                                     'error': str(e)})
+            outcome['status'] = 'failed'
+            break
+
+    outcome['duration_ms'] = int((time.perf_counter() - started) * 1000)
+    return outcome
+
+
+def _close_batch_in_context(app, *args):
+    with app.app_context():
+        try:
+            return close_batch(*args)
+        finally:
+            db.session.remove()
+
+
+def _report_progress(context, done, total):
+    context.update(5 + 90 * done // total, f'Closed {done} of {total} batches')
+
+
+def _month_end_task(context, year, month, options):
+    steps = [step for step in MONTH_END_STEPS if step != STEP_SEND_RESULT_SMS or options.get('send_sms', True)]
+    batch_ids = [row[0] for row in db.session.query(Batch.id).filter(
+        Batch.is_active == True,
+        Batch.is_archived == False
+    ).order_by(Batch.id).all()]
+    completed = get_completed_steps(year, month)
+    context.update(5, f'Closing {len(batch_ids)} batches')
+
+    app = current_app._get_current_object()
+    workers = max(1, min(app.config.get('MONTH_END_WORKERS') or 1, len(batch_ids) or 1))
+    args = (year, month, steps, completed, options, context.job.id)
+    outcomes = []
+
+    if workers == 1:
+        for batch_id in batch_ids:
+            outcomes.append(close_batch(batch_id, *args))
+            _report_progress(context, len(outcomes), len(batch_ids))
+    else:
+        # Release the read transaction so worker sessions are not blocked by it
+        db.session.commit()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='month-end') as pool:
+            futures = [pool.submit(_close_batch_in_context, app, batch_id, *args) for batch_id in batch_ids]
+            for future in as_completed(futures):
+                outcomes.append(future.result())
+                _report_progress(context, len(outcomes), len(batch_ids))
+
+    outcomes.sort(key=lambda outcome: outcome['batch_id'])
+    # Final rankings and published results feed the homepage top performers
+    homepage_changed = any(step['status'] == 'completed' and step['step'] in (STEP_GENERATE_RANKING,
+                                                                               STEP_PUBLISH_RESULTS)
+                           for outcome in outcomes for step in outcome['steps'])
+    sms_queued = any(step['status'] == 'completed' and step['step'] == STEP_SEND_RESULT_SMS
+                     for outcome in outcomes for step in outcome['steps'])
+    failed = [outcome['batch_id'] for outcome in outcomes if outcome['status'] == 'failed']
+
+    context.complete({
+        'year': year,
+        'month': month,
+        'batches': outcomes,
+        'failed_batches': failed
+    }, f'Closed {len(outcomes) - len(failed)} of {len(outcomes)} batches'
+       + (f', {len(failed)} failed' if failed else ''))
+    db.session.commit()
+
+    if homepage_changed:
+        refresh_homepage_snapshot()
+    if sms_queued:
+        notify_outbox()
+
+
+def enqueue_month_end_close(year, month, send_sms=True, created_by=None):
+    """Start the month-end close for every active batch; one run per month at a time"""
+    return enqueue_job(
+        JOB_TYPE_MONTH_END,
+        f'{JOB_TYPE_MONTH_END}:{year}-{month:02d}',
+        _month_end_task,
+        args=(year, month, {'send_sms': send_sms, 'created_by': created_by}),
+        created_by=created_by
+    )
+
+
+def get_month_end_steps(year, month):
+    """Recorded step outcomes of a month, by batch"""
+    return [{
+        'batch_id': record.batch_id,
+        'step': record.step,
+        'status': record.status,
+        'duration_ms': record.duration_ms,
+        'result': record.result,
+        'error': record.error,
+        'job_id': record.job_id,
+        'finished_at': record.finished_at.isoformat() if record.finished_at else None
+    } for record in MonthEndStep.query.filter_by(year=year, month=month).order_by(
+        MonthEndStep.batch_id, MonthEndStep.id
+    ).all()]
@@ -0,0 +1,278 @@
+"""
+Monthly Ranking Engine
+Set-based computation of comprehensive monthly exam rankings.
+
+All inputs (papers, students, marks, attendance counts, bonus marks, existing
+rankings and previous-month final rankings) are loaded in a fixed number of grouped queries
+and the totals, grades and positions are computed in memory, so the query
+count does not grow with the size of the batch.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from models import (db, MonthlyExam, IndividualExam, MonthlyMark, MonthlyRanking,
+                    Batch, User, UserRole, Attendance, AttendanceStatus)
+from services.attendance_calendar import get_month_calendar
+from services.bonus_marks import get_exam_bonus_marks
+from services.grading import calculate_grade_and_gpa
+
+logger = logging.getLogger(__name__)
+
+# Percentage of a paper's full marks needed to count it as passed
+PAPER_PASS_RATIO = 0.4
+
+
+def get_month_bounds(year, month):
+    """Return the first and last date of a calendar month"""
+    month_start = datetime(year, month, 1).date()
+    if month == 12:
+        month_end = datetime(year + 1, 1, 1).date() - timedelta(days=1)
+    else:
+        month_end = datetime(year, month + 1, 1).date() - timedelta(days=1)
+    return month_start, month_end
+
+
+def get_previous_month(year, month):
+    """Return (year, month) of the month before the given one"""
+    if month > 1:
+        return year, month - 1
+    return year - 1, 12
+
+
+def get_batch_students(batch_id, user_ids=None):
+    """Active, non-archived students enrolled in a batch (optionally only user_ids)"""
+    query = User.query.join(
+        User.batches
+    ).filter(
+        User.role == UserRole.STUDENT,
+        User.is_active == True,
+        User.is_archived == False,
+        Batch.id == batch_id
+    )
+    if user_ids is not None:
+        query = query.filter(User.id.in_(list(user_ids)))
+    return query.all()
+
+
+def load_ranking_inputs(monthly_exam, user_ids=None):
+    """
+    Load everything the ranking needs for one monthly exam in grouped queries.
+
+    user_ids limits the per-student inputs to those students, for re-scoring
+    a few rows of an existing ranking.
+    """
+    exam_id = monthly_exam.id
+
+    def for_students(query, column):
+        return query if user_ids is None else query.filter(column.in_(list(user_ids)))
+
+    individual_exams = IndividualExam.query.filter_by(
+        monthly_exam_id=exam_id
+    ).order_by(IndividualExam.order_index).all()
+
+    students = get_batch_students(monthly_exam.batch_id, user_ids)
+
+    # (user_id, individual_exam_id) -> MonthlyMark, refreshed in case marks were
+    # just written with a bulk statement in this session
+    marks = {
+        (mark.user_id, mark.individual_exam_id): mark
+        for mark in for_students(MonthlyMark.query.filter_by(monthly_exam_id=exam_id), MonthlyMark.user_id)
+        .execution_options(populate_existing=True).all()
+    }
+
+    # Present-day counts for the exam's month, grouped per student
+    month_start, month_end = get_month_bounds(monthly_exam.year, monthly_exam.month)
+    attendance_counts = {}
+    if monthly_exam.start_date and monthly_exam.end_date:
+        attendance_counts = dict(
+            for_students(db.session.query(Attendance.user_id, func.count(Attendance.id)), Attendance.user_id)
+            .filter(
+                Attendance.batch_id == monthly_exam.batch_id,
+                Attendance.date >= month_start,
+                Attendance.date <= month_end,
+                Attendance.status == AttendanceStatus.PRESENT
+            )
+            .group_by(Attendance.user_id)
+            .all()
+        )
+
+    existing_rankings = {
+        ranking.user_id: ranking
+        for ranking in for_students(MonthlyRanking.query.filter_by(monthly_exam_id=exam_id),
+                                    MonthlyRanking.user_id).all()
+    }
+
+    bonus_marks = get_exam_bonus_marks(exam_id, user_ids)
+
+    # Final rankings of the same batch's previous month, resolved with one join
+    prev_year, prev_month = get_previous_month(monthly_exam.year, monthly_exam.month)
+    previous_rankings = {
+        ranking.user_id: ranking
+        for ranking in for_students(MonthlyRanking.query, MonthlyRanking.user_id).join(
+            MonthlyExam, MonthlyRanking.monthly_exam_id == MonthlyExam.id
+        ).filter(
+            MonthlyExam.batch_id == monthly_exam.batch_id,
+            MonthlyExam.month == prev_month,
+            MonthlyExam.year == prev_year,
+            MonthlyRanking.is_final == True
+        ).all()
+    }
+
+    return {
+        'individual_exams': individual_exams,
+        'students': students,
+        'marks': marks,
+        'attendance_counts': attendance_counts,
+        'existing_rankings': existing_rankings,
+        'previous_rankings': previous_rankings,
+        'bonus_marks': bonus_marks,
+        'total_days': get_month_calendar(monthly_exam.batch_id, monthly_exam.year, monthly_exam.month).working_days
+        if monthly_exam.start_date and monthly_exam.end_date else 0
+    }
+
+
+def score_student(student, inputs):
+    """Compute one student's comprehensive ranking row from preloaded inputs"""
+    marks = inputs['marks']
+    individual_exams = inputs['individual_exams']
+    total_days = inputs['total_days']
+
+    individual_marks = {}
+    total_exam_marks = 0
+    total_possible_marks = 0
+    passed_exams = 0
+
+    for exam in individual_exams:
+        mark = marks.get((student.id, exam.id))
+
+        if mark:
+            paper_percentage = (mark.marks_obtained / mark.total_marks * 100) if mark.total_marks > 0 else 0
+            individual_marks[exam.id] = {
+                'exam_title': exam.title,
+                'subject': exam.subject,
+                'marks_obtained': mark.marks_obtained,
+                'total_marks': mark.total_marks,
+                'percentage': round(paper_percentage, 2),
+                'is_absent': mark.is_absent,
+                'grade': calculate_grade_and_gpa(paper_percentage)[0]
+            }
+            if not mark.is_absent:
+                total_exam_marks += mark.marks_obtained
+                if mark.marks_obtained >= (mark.total_marks * PAPER_PASS_RATIO):
+                    passed_exams += 1
+            total_possible_marks += mark.total_marks
+        else:
+            individual_marks[exam.id] = {
+                'exam_title': exam.title,
+                'subject': exam.subject,
+                'marks_obtained': 0,
+                'total_marks': exam.marks,
+                'percentage': 0,
+                'is_absent': True,
+                'grade': 'F'
+            }
+            total_possible_marks += exam.marks
+
+    # 1 attendance mark per present day in the exam's month
+    attendance_marks = inputs['attendance_counts'].get(student.id, 0)
+    max_attendance_marks = total_days
+    attendance_percentage = (attendance_marks / total_days * 100) if total_days > 0 else 0
+
+    # Final totals (no bonus - just exam marks + attendance marks)
+    final_total = total_exam_marks + attendance_marks
+    total_possible = total_possible_marks + max_attendance_marks
+    percentage = (final_total / total_possible * 100) if total_possible > 0 else 0
+
+    grade, gpa = calculate_grade_and_gpa(percentage)
+    exam_gpa = calculate_grade_and_gpa((total_exam_marks / total_possible_marks * 100) if total_possible_marks > 0 else 0)[1]
+
+    existing_ranking = inputs['existing_rankings'].get(student.id)
+    previous_ranking = inputs['previous_rankings'].get(student.id)
+
+    previous_position = None
+    previous_roll_number = None
+    if existing_ranking and existing_ranking.previous_position:
+        previous_position = existing_ranking.previous_position
+    if previous_ranking:
+        previous_position = previous_ranking.position
+        previous_roll_number = previous_ranking.roll_number
+
+    # Roll number: use existing, or inherit from previous month, or None
+    current_roll_number = None
+    if existing_ranking and existing_ranking.roll_number:
+        current_roll_number = existing_ranking.roll_number
+    elif previous_roll_number:
+        current_roll_number = previous_roll_number
+
+    return {
+        'user_id': student.id,
+        'student_name': student.full_name,
+        'student_phone': student.phoneNumber,
+        'roll_number': current_roll_number,
+        'individual_marks': individual_marks,
+        'total_exam_marks': total_exam_marks,
+        'total_possible_marks': total_possible_marks,
+        'attendance_marks': attendance_marks,
+        'max_attendance_marks': max_attendance_marks,
+        'total_attendance_days': total_days,
+        'attendance_percentage': round(attendance_percentage, 2),
+        'bonus_marks': inputs['bonus_marks'].get(student.id, 0),  # Shown only; not part of the totals
+        'final_total': final_total,
+        'total_possible': total_possible,
+        'percentage': round(percentage, 2),
+        'grade': grade,
+        'gpa': round(gpa, 2),
+        'exam_gpa': round(exam_gpa, 2),
+        'passed_exams': passed_exams,
+        'total_exams': len(individual_exams),
+        'previous_position': previous_position
+    }
+
+
+def ranking_sort_key(rank):
+    """Order by final percentage (desc), then total marks (desc), then name"""
+    return (-rank['percentage'], -rank['final_total'], rank['student_name'])
+
+
+def assign_positions(rankings):
+    """Sort rankings in place and set positions and position trends"""
+    rankings.sort(key=ranking_sort_key)
+
+    for idx, rank in enumerate(rankings):
+        set_position(rank, idx + 1)
+
+    return rankings
+
+
+def set_position(rank, current_position):
+    """Set a ranking row's position and its trend against the previous month"""
+    rank['current_position'] = current_position
+    rank['position'] = current_position  # For compatibility
+
+    if rank['previous_position']:
+        rank['position_change'] = rank['previous_position'] - current_position
+        if rank['position_change'] > 0:
+            rank['position_trend'] = 'up'
+        elif rank['position_change'] < 0:
+            rank['position_trend'] = 'down'
+        else:
+            rank['position_trend'] = 'same'
+    else:
+        rank['position_change'] = None
+        rank['position_trend'] = 'new'
+
+
+
+def build_comprehensive_rankings(monthly_exam):
+    """
+    Compute the comprehensive ranking for a monthly exam.
+
+    Returns (individual_exams, rankings) where rankings is the sorted list of
+    per-student rows with positions assigned.
+    """
+    inputs = load_ranking_inputs(monthly_exam)
+    rankings = [score_student(student, inputs) for student in inputs['students']]
+    assign_positions(rankings)
+    return inputs['individual_exams'], rankings
@@ -0,0 +1,88 @@
+"""
+Ranking Generation Jobs
+Save final monthly rankings in a background job instead of inside the request.
+"""
+import logging
+
+from models import db, MonthlyExam, MonthlyRanking
+from services.jobs import enqueue_job
+from services.homepage_snapshot import refresh_homepage_snapshot
+from services.ranking_snapshot import get_ranking_snapshot, mark_dependent_rankings_stale
+from services.roll_numbers import get_inherited_roll_numbers
+
+logger = logging.getLogger(__name__)
+
+JOB_TYPE_GENERATE_RANKING = 'generate_ranking'
+
+
+def save_final_rankings(monthly_exam, progress=None):
+    """
+    Replace the exam's saved rankings with the current comprehensive ranking.
+
+    Students keep their roll number from the previous month; new students get
+    their position in this ranking. Does not commit the ranking rows.
+    """
+    rankings = get_ranking_snapshot(monthly_exam)['rankings']
+    if progress:
+        progress.update(60, f'Calculated rankings for {len(rankings)} students')
+
+    prev_roll_map = get_inherited_roll_numbers(monthly_exam)
+
+    MonthlyRanking.query.filter_by(monthly_exam_id=monthly_exam.id).delete()
+
+    for idx, rank_data in enumerate(rankings):
+        user_id = rank_data['user_id']
+        db.session.add(MonthlyRanking(
+            monthly_exam_id=monthly_exam.id,
+            user_id=user_id,
+            position=rank_data['position'],
+            roll_number=prev_roll_map.get(user_id, idx + 1),
+            total_exam_marks=rank_data['total_exam_marks'],
+            total_possible_marks=rank_data['total_possible_marks'],
+            attendance_marks=rank_data['attendance_marks'],
+            bonus_marks=rank_data.get('bonus_marks', 0),  # Recorded; not added to final_total
+            final_total=rank_data['final_total'],
+            max_possible_total=rank_data['total_possible'],
+            percentage=rank_data['percentage'],
+            grade=rank_data['grade'],
+            gpa=rank_data['gpa'],
+            exam_gpa=rank_data['exam_gpa'],
+            previous_position=rank_data.get('previous_position'),
+            is_final=True
+        ))
+
+    mark_dependent_rankings_stale(monthly_exam)
+
+    return {
+        'rankings_count': len(rankings),
+        'exam_title': monthly_exam.title,
+        'total_students': len(rankings)
+    }
+
+
+def _generate_ranking_task(context, exam_id):
+    monthly_exam = db.session.get(MonthlyExam, exam_id)
+    if not monthly_exam:
+        raise ValueError('Monthly exam not found')
+
+    context.update(10, 'Calculating rankings')
+    result = save_final_rankings(monthly_exam, progress=context)
+
+    # Rankings and job completion land in the same commit
+    context.complete(result, 'Monthly rankings generated and saved successfully')
+    db.session.commit()
+
+    if monthly_exam.show_on_homepage:
+        refresh_homepage_snapshot()
+    logger.info(f"Generated {result['rankings_count']} rankings for monthly exam {exam_id}")
+
+
+def enqueue_ranking_generation(monthly_exam, created_by=None):
+    """Start ranking generation for an exam; returns (job, created)"""
+    return enqueue_job(
+        JOB_TYPE_GENERATE_RANKING,
+        f'{JOB_TYPE_GENERATE_RANKING}:{monthly_exam.id}',
+        _generate_ranking_task,
+        args=(monthly_exam.id,),
+        created_by=created_by
+    )
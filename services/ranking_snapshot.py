@@ -0,0 +1,192 @@
+"""
+Ranking Snapshot Store
+Persisted comprehensive rankings per monthly exam.
+
+Read endpoints serve the stored snapshot. Writes that affect a ranking (marks,
+attendance, bonus marks, roll numbers) mark the snapshot of the affected exam
+stale in the same transaction, and the next read recomputes only that exam.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, MonthlyExam, RankingSnapshot, User, UserRole, Batch
+from services.ranking_engine import build_comprehensive_rankings
+from services.single_flight import coalesce
+from services.subject_ranks import refresh_subject_ranks
+
+logger = logging.getLogger(__name__)
+
+
+def serialize_individual_exams(individual_exams):
+    """Paper metadata in the shape the ranking endpoints return"""
+    return [{'id': e.id, 'title': e.title, 'exam_title': e.title, 'subject': e.subject, 'marks': e.marks}
+            for e in individual_exams]
+
+
+# Per-paper fields sent for each student in the columnar format, in this order
+COLUMNAR_MARK_FIELDS = ('marks_obtained', 'total_marks', 'percentage', 'grade', 'is_absent')
+
+
+def to_columnar(individual_exams, rankings):
+    """
+    Compact form of a ranking payload for large batches.
+
+    Paper metadata is sent once in individual_exams. Each student is one row
+    of values in `columns` order; its `marks` column is a list aligned with
+    individual_exams, each entry holding the COLUMNAR_MARK_FIELDS values.
+    """
+    columns = [key for key in (rankings[0] if rankings else {}) if key != 'individual_marks']
+    rows = []
+    for rank in rankings:
+        # Keys are ints when freshly computed and strings once stored as JSON
+        marks = rank.get('individual_marks') or {}
+        paper_marks = []
+        for exam in individual_exams:
+            mark = marks.get(exam['id'], marks.get(str(exam['id'])))
+            paper_marks.append([mark.get(field) for field in COLUMNAR_MARK_FIELDS] if mark else None)
+        rows.append([rank.get(column) for column in columns] + [paper_marks])
+    return {
+        'columns': columns + ['marks'],
+        'mark_fields': list(COLUMNAR_MARK_FIELDS),
+        'rows': rows
+    }
+
+
+def get_batch_roster(batch_id):
+    """Sorted IDs of the active, non-archived students of a batch"""
+    rows = db.session.query(User.id).join(User.batches).filter(
+        User.role == UserRole.STUDENT,
+        User.is_active == True,
+        User.is_archived == False,
+        Batch.id == batch_id
+    ).all()
+    return sorted(row[0] for row in rows)
+
+
+def is_snapshot_fresh(snapshot, roster):
+    """True when a stored snapshot is current and covers exactly the roster"""
+    return (snapshot is not None and not snapshot.is_stale and snapshot.payload
+            and snapshot.payload.get('roster') == roster)
+
+
+def refresh_ranking_snapshot(monthly_exam, snapshot=None):
+    """Recompute and store the snapshot (and subject ranks) for one monthly exam"""
+    if snapshot is None:
+        snapshot = RankingSnapshot.query.filter_by(monthly_exam_id=monthly_exam.id).first()
+    seen_version = snapshot.version if snapshot else 0
+
+    refresh_subject_ranks(monthly_exam.id)
+    individual_exams, rankings = build_comprehensive_rankings(monthly_exam)
+    payload = {
+        'individual_exams': serialize_individual_exams(individual_exams),
+        'rankings': rankings,
+        'roster': sorted(r['user_id'] for r in rankings)
+    }
+
+    # Only store if nothing invalidated the snapshot while we were computing
+    try:
+        if snapshot:
+            RankingSnapshot.query.filter_by(id=snapshot.id, version=seen_version).update({
+                'payload': payload,
+                'is_stale': False,
+                'computed_at': datetime.utcnow(),
+                'updated_at': datetime.utcnow()
+            }, synchronize_session=False)
+        else:
+            db.session.add(RankingSnapshot(
+                monthly_exam_id=monthly_exam.id,
+                payload=payload,
+                is_stale=False,
+                computed_at=datetime.utcnow()
+            ))
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored the first snapshot concurrently
+        db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Could not store ranking snapshot for exam {monthly_exam.id}: {e}")
+
+    return payload
+
+
+def _read_snapshot_row(monthly_exam_id):
+    """
+    The stored snapshot as a plain row, bypassing the identity map, so a
+    waiting reader sees a recompute committed by another worker
+    """
+    table = RankingSnapshot.__table__
+    return db.session.execute(
+        select(table.c.payload, table.c.is_stale).where(table.c.monthly_exam_id == monthly_exam_id)
+    ).first()
+
+
+def get_ranking_snapshot(monthly_exam):
+    """
+    Return the stored ranking payload, recomputing it first if stale.
+
+    Concurrent readers of a stale snapshot are coalesced: one recomputes it
+    while the others wait for its result, or get the stale copy if it takes
+    longer than the single-flight wait.
+    """
+    snapshot = RankingSnapshot.query.filter_by(monthly_exam_id=monthly_exam.id).first()
+    roster = get_batch_roster(monthly_exam.batch_id)
+
+    if is_snapshot_fresh(snapshot, roster):
+        return snapshot.payload
+
+    first_check = [snapshot]
+
+    def load():
+        stored = first_check.pop() if first_check else _read_snapshot_row(monthly_exam.id)
+        return (stored.payload if stored else None), is_snapshot_fresh(stored, roster)
+
+    return coalesce(f'ranking_snapshot_{monthly_exam.id}', load,
+                    lambda: refresh_ranking_snapshot(monthly_exam, snapshot))
+
+
+def mark_rankings_stale(exam_ids):
+    """
+    Invalidate the snapshots of the given monthly exams.
+
+    Does not commit: call inside the transaction that performs the write.
+    """
+    exam_ids = [exam_id for exam_id in set(exam_ids) if exam_id]
+    if not exam_ids:
+        return 0
+    return RankingSnapshot.query.filter(
+        RankingSnapshot.monthly_exam_id.in_(exam_ids)
+    ).update({
+        'is_stale': True,
+        'version': RankingSnapshot.version + 1
+    }, synchronize_session=False)
+
+
+def mark_batch_rankings_stale(batch_id, year, month):
+    """Invalidate the snapshots of a batch's monthly exams for one month (every batch when batch_id is None)"""
+    query = db.session.query(MonthlyExam.id).filter_by(year=year, month=month)
+    if batch_id is not None:
+        query = query.filter_by(batch_id=batch_id)
+    return mark_rankings_stale([row[0] for row in query.all()])
+
+
+def mark_dependent_rankings_stale(monthly_exam):
+    """
+    Invalidate a monthly exam and the same batch's following month.
+
+    The following month inherits roll numbers and previous positions from
+    this exam's final rankings.
+    """
+    return mark_rankings_stale([monthly_exam.id] + get_following_month_exam_ids(monthly_exam))
+
+
+def get_following_month_exam_ids(monthly_exam):
+    """IDs of the same batch's monthly exams in the following month"""
+    next_year, next_month = (monthly_exam.year, monthly_exam.month + 1) if monthly_exam.month < 12 \
+        else (monthly_exam.year + 1, 1)
+    return [row[0] for row in db.session.query(MonthlyExam.id).filter_by(
+        batch_id=monthly_exam.batch_id, year=next_year, month=next_month
+    ).all()]
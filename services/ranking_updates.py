@@ -0,0 +1,136 @@
+"""
+Incremental Ranking Updates
+Re-rank one student after a single mark correction.
+
+Instead of recomputing the whole batch, only the corrected student is
+re-scored. Their row is moved to its new place in the stored, ordered ranking
+and only the rows between the old and the new place shift by one. Saved final
+rankings get the same shift with one UPDATE ... CASE. Anything that cannot be
+updated safely falls back to marking the snapshot stale, so the next read
+does a full recompute.
+"""
+import logging
+from bisect import bisect_left
+from datetime import datetime
+
+from sqlalchemy import case
+
+from models import db, MonthlyRanking, RankingSnapshot
+from services.marks_store import SQLITE_MAX_PARAMS
+from services.ranking_engine import load_ranking_inputs, score_student, ranking_sort_key, set_position
+from services.ranking_snapshot import (get_batch_roster, is_snapshot_fresh, mark_rankings_stale,
+                                       get_following_month_exam_ids)
+from services.subject_ranks import refresh_subject_ranks
+
+logger = logging.getLogger(__name__)
+
+
+def move_ranking_row(rankings, row):
+    """
+    Replace row's student in the sorted rankings with row, keeping the order.
+
+    Positions are renumbered only between the old and the new index. Returns
+    the rows whose position was set, or None if the student is not ranked.
+    """
+    old_index = next((idx for idx, rank in enumerate(rankings) if rank['user_id'] == row['user_id']), None)
+    if old_index is None:
+        return None
+
+    del rankings[old_index]
+    new_index = bisect_left(rankings, ranking_sort_key(row), key=ranking_sort_key)
+    rankings.insert(new_index, row)
+
+    moved = rankings[min(old_index, new_index):max(old_index, new_index) + 1]
+    for offset, rank in enumerate(moved, start=min(old_index, new_index) + 1):
+        set_position(rank, offset)
+    return moved
+
+
+def _update_final_rankings(monthly_exam, row, moved, old_positions):
+    """
+    Apply the shift to saved final rankings if they match the ranking it was
+    made from. Returns True when the final rankings were updated.
+    """
+    final_positions = dict(db.session.query(MonthlyRanking.user_id, MonthlyRanking.position).filter(
+        MonthlyRanking.monthly_exam_id == monthly_exam.id,
+        MonthlyRanking.is_final == True
+    ).all())
+    if not final_positions:
+        return False
+    if final_positions != old_positions:
+        logger.info(f"Final rankings of exam {monthly_exam.id} predate the snapshot; leaving them for regeneration")
+        return False
+
+    now = datetime.utcnow()
+    positions = {rank['user_id']: rank['position'] for rank in moved}
+    user_ids = list(positions)
+    chunk_size = max(1, (SQLITE_MAX_PARAMS - 10) // 3)
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        MonthlyRanking.query.filter(
+            MonthlyRanking.monthly_exam_id == monthly_exam.id,
+            MonthlyRanking.user_id.in_(chunk)
+        ).update({
+            'position': case({user_id: positions[user_id] for user_id in chunk}, value=MonthlyRanking.user_id),
+            'updated_at': now
+        }, synchronize_session=False)
+
+    MonthlyRanking.query.filter_by(monthly_exam_id=monthly_exam.id, user_id=row['user_id']).update({
+        'total_exam_marks': row['total_exam_marks'],
+        'total_possible_marks': row['total_possible_marks'],
+        'final_total': row['final_total'],
+        'max_possible_total': row['total_possible'],
+        'percentage': row['percentage'],
+        'grade': row['grade'],
+        'gpa': row['gpa'],
+        'exam_gpa': row['exam_gpa'],
+        'updated_at': now
+    }, synchronize_session=False)
+
+    # The following month reads previous positions from these rows
+    mark_rankings_stale(get_following_month_exam_ids(monthly_exam))
+    return True
+
+
+def update_student_ranking(monthly_exam, user_id):
+    """
+    Re-rank one student of a monthly exam after their marks changed.
+
+    Call after the mark is written, inside the same transaction; does not
+    commit. Returns {'old_position', 'position', 'final_updated'}, or None
+    when the snapshot was marked stale for a full recompute instead.
+    """
+    snapshot = RankingSnapshot.query.filter_by(monthly_exam_id=monthly_exam.id).first()
+    if not is_snapshot_fresh(snapshot, get_batch_roster(monthly_exam.batch_id)):
+        mark_rankings_stale([monthly_exam.id])
+        return None
+
+    inputs = load_ranking_inputs(monthly_exam, user_ids=[user_id])
+    if not inputs['students']:
+        mark_rankings_stale([monthly_exam.id])
+        return None
+    row = score_student(inputs['students'][0], inputs)
+
+    payload = snapshot.payload
+    rankings = [dict(rank) for rank in payload['rankings']]
+    old_positions = {rank['user_id']: rank['position'] for rank in rankings}
+    moved = move_ranking_row(rankings, row)
+    if moved is None:
+        mark_rankings_stale([monthly_exam.id])
+        return None
+
+    # Store only if nothing invalidated the snapshot since it was read
+    updated = RankingSnapshot.query.filter_by(id=snapshot.id, version=snapshot.version).update({
+        'payload': {**payload, 'rankings': rankings},
+        'updated_at': datetime.utcnow()
+    }, synchronize_session=False)
+    if not updated:
+        mark_rankings_stale([monthly_exam.id])
+        return None
+    refresh_subject_ranks(monthly_exam.id)
+
+    return {
+        'old_position': old_positions[user_id],
+        'position': row['position'],
+        'final_updated': _update_final_rankings(monthly_exam, row, moved, old_positions)
+    }
@@ -0,0 +1,174 @@
+"""
+Report Cards
+Render every student's monthly report card and stream them as one ZIP.
+
+Card data is loaded up front in a fixed number of queries and reduced to
+plain dicts. Rendering (Jinja2 to standalone, printable HTML) is spread over
+a process pool for large batches, and each rendered card is written into a
+ZIP that is streamed to the client chunk by chunk instead of being held in
+memory.
+"""
+import calendar
+import io
+import logging
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from models import db, MonthlyMark, MonthlyRanking, IndividualExam, User
+from services.attendance_calendar import get_month_calendar
+
+logger = logging.getLogger(__name__)
+
+REPORT_CARD_TEMPLATE = 'reports/monthly_report_card.html'
+
+# Batches smaller than this render in the request process; a pool costs more than it saves
+MIN_CARDS_FOR_POOL = 40
+
+# Cards handed to a pool worker at a time
+POOL_CHUNK_SIZE = 16
+
+_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'templates', 'templates')
+_environment = None
+
+
+def _get_template():
+    """Jinja template, loaded once per process (pool workers have no Flask app)"""
+    global _environment
+    if _environment is None:
+        _environment = Environment(loader=FileSystemLoader(_TEMPLATE_DIR),
+                                   autoescape=select_autoescape(['html']))
+    return _environment.get_template(REPORT_CARD_TEMPLATE)
+
+
+def report_card_filename(card):
+    name = re.sub(r'[^A-Za-z0-9]+', '_', card['student_name']).strip('_') or 'student'
+    roll = card['roll_number'] if card['roll_number'] is not None else card['user_id']
+    return f"{card['position']:03d}_{roll}_{name}.html"
+
+
+def render_report_card(card):
+    """Render one card; module-level so it can run in a pool worker"""
+    return report_card_filename(card), _get_template().render(card=card).encode('utf-8')
+
+
+def load_report_cards(monthly_exam):
+    """
+    Plain-dict card data for every student with a final ranking, by position.
+
+    Four queries regardless of batch size: papers, rankings with students,
+    marks, and the month's holidays.
+    """
+    exam_id = monthly_exam.id
+    papers = IndividualExam.query.filter_by(
+        monthly_exam_id=exam_id
+    ).order_by(IndividualExam.order_index).all()
+
+    rows = db.session.query(MonthlyRanking, User).join(
+        User, MonthlyRanking.user_id == User.id
+    ).filter(
+        MonthlyRanking.monthly_exam_id == exam_id,
+        MonthlyRanking.is_final == True
+    ).order_by(MonthlyRanking.position, User.first_name).all()
+
+    marks = {
+        (mark.user_id, mark.individual_exam_id): mark
+        for mark in MonthlyMark.query.filter_by(monthly_exam_id=exam_id).all()
+    }
+
+    working_days = get_month_calendar(monthly_exam.batch_id, monthly_exam.year, monthly_exam.month).working_days
+    common = {
+        'institute_name': current_app.config.get('APP_NAME', ''),
+        'exam_title': monthly_exam.title,
+        'month_name': calendar.month_name[monthly_exam.month],
+        'year': monthly_exam.year,
+        'batch_name': monthly_exam.batch.name if monthly_exam.batch else '',
+        'total_students': len(rows),
+        'working_days': working_days
+    }
+
+    cards = []
+    for ranking, student in rows:
+        paper_rows = []
+        for paper in papers:
+            mark = marks.get((student.id, paper.id))
+            paper_rows.append({
+                'title': paper.title,
+                'subject': paper.subject,
+                'marks_obtained': mark.marks_obtained if mark else 0,
+                'total_marks': paper.marks,
+                'grade': mark.grade if mark else None,
+                'is_absent': mark is None or bool(mark.is_absent)
+            })
+        cards.append({
+            **common,
+            'user_id': student.id,
+            'student_name': student.full_name,
+            'student_phone': student.phoneNumber,
+            'roll_number': ranking.roll_number,
+            'position': ranking.position,
+            'papers': paper_rows,
+            'total_exam_marks': ranking.total_exam_marks or 0,
+            'total_possible_marks': ranking.total_possible_marks or 0,
+            'attendance_days': ranking.attendance_marks or 0,
+            'final_total': ranking.final_total or 0,
+            'max_possible_total': ranking.max_possible_total or 0,
+            'percentage': ranking.percentage or 0,
+            'grade': ranking.grade,
+            'gpa': ranking.gpa,
+            'exam_gpa': ranking.exam_gpa
+        })
+    return cards
+
+
+def iter_rendered_cards(cards, workers):
+    """Yield (filename, bytes) in card order, using a process pool for large batches"""
+    if workers <= 1 or len(cards) < MIN_CARDS_FOR_POOL:
+        for card in cards:
+            yield render_report_card(card)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(render_report_card, cards, chunksize=POOL_CHUNK_SIZE)
+
+
+class _ZipChunkBuffer(io.RawIOBase):
+    """Write-only sink that hands ZipFile output back as chunks"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(files):
+    """Yield the bytes of a ZIP archive built from (filename, bytes) pairs"""
+    buffer = _ZipChunkBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, data in files:
+            archive.writestr(filename, data)
+            chunk = buffer.drain()
+            if chunk:
+                yield chunk
+    yield buffer.drain()
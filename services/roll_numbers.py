@@ -0,0 +1,151 @@
+"""
+Roll Numbers
+Batch-wide roll number inheritance and assignment.
+
+Inheritance for a whole batch is resolved with one join against the previous
+month's final rankings. Assignments are written with a single UPDATE ... CASE
+for the rankings that exist and one multi-row INSERT for the rest, so
+re-rolling a batch costs the same number of round trips at any size.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import case, insert, or_, and_
+
+from models import db, MonthlyExam, MonthlyRanking, user_batches
+from services.ranking_engine import get_previous_month
+from services.marks_store import SQLITE_MAX_PARAMS, parse_user_id
+
+logger = logging.getLogger(__name__)
+
+# Bound parameters used per row by the UPDATE ... CASE statement
+_PARAMS_PER_ROW = 3
+
+
+def get_inherited_roll_numbers(monthly_exam):
+    """user_id -> roll number from the same batch's previous month final rankings"""
+    prev_year, prev_month = get_previous_month(monthly_exam.year, monthly_exam.month)
+    rows = db.session.query(
+        MonthlyRanking.user_id, MonthlyRanking.roll_number
+    ).join(
+        MonthlyExam, MonthlyRanking.monthly_exam_id == MonthlyExam.id
+    ).filter(
+        MonthlyExam.batch_id == monthly_exam.batch_id,
+        MonthlyExam.year == prev_year,
+        MonthlyExam.month == prev_month,
+        MonthlyRanking.is_final == True,
+        MonthlyRanking.roll_number.isnot(None)
+    ).all()
+    return {user_id: roll_number for user_id, roll_number in rows}
+
+
+def get_roll_numbers(monthly_exam):
+    """
+    Effective roll numbers of the exam: its own assignments, falling back to
+    the previous month's final rankings. One query.
+    """
+    prev_year, prev_month = get_previous_month(monthly_exam.year, monthly_exam.month)
+    rows = db.session.query(
+        MonthlyRanking.user_id, MonthlyRanking.roll_number, MonthlyRanking.monthly_exam_id
+    ).join(
+        MonthlyExam, MonthlyRanking.monthly_exam_id == MonthlyExam.id
+    ).filter(
+        MonthlyRanking.roll_number.isnot(None),
+        or_(
+            MonthlyRanking.monthly_exam_id == monthly_exam.id,
+            and_(MonthlyExam.batch_id == monthly_exam.batch_id,
+                 MonthlyExam.year == prev_year,
+                 MonthlyExam.month == prev_month,
+                 MonthlyRanking.is_final == True)
+        )
+    ).all()
+
+    current, previous = {}, {}
+    for user_id, roll_number, exam_id in rows:
+        (current if exam_id == monthly_exam.id else previous)[user_id] = roll_number
+    return {**previous, **current}
+
+
+def get_batch_member_ids(batch_id, user_ids):
+    """The subset of user_ids enrolled in a batch, in one query"""
+    if not user_ids:
+        return set()
+    rows = db.session.query(user_batches.c.user_id).filter(
+        user_batches.c.batch_id == batch_id,
+        user_batches.c.user_id.in_(list(user_ids))
+    ).all()
+    return {row[0] for row in rows}
+
+
+def apply_roll_numbers(monthly_exam, roll_numbers, positions=None):
+    """
+    Write roll numbers (and optionally positions) for many students at once.
+
+    roll_numbers and positions map user_id -> value. Existing ranking rows are
+    updated with one UPDATE ... CASE; missing rows are inserted with one
+    multi-row INSERT. Does not commit. Returns the number of students written.
+    """
+    if not roll_numbers:
+        return 0
+    positions = positions or {}
+    exam_id = monthly_exam.id
+    now = datetime.utcnow()
+
+    existing_ids = {row[0] for row in db.session.query(MonthlyRanking.user_id).filter(
+        MonthlyRanking.monthly_exam_id == exam_id,
+        MonthlyRanking.user_id.in_(list(roll_numbers))
+    ).all()}
+
+    to_update = [user_id for user_id in roll_numbers if user_id in existing_ids]
+    chunk_size = max(1, (SQLITE_MAX_PARAMS - 10) // _PARAMS_PER_ROW)
+    for start in range(0, len(to_update), chunk_size):
+        chunk = to_update[start:start + chunk_size]
+        values = {
+            'roll_number': case({user_id: roll_numbers[user_id] for user_id in chunk},
+                                value=MonthlyRanking.user_id),
+            'updated_at': now
+        }
+        chunk_positions = {user_id: positions[user_id] for user_id in chunk if user_id in positions}
+        if chunk_positions:
+            values['position'] = case(chunk_positions, value=MonthlyRanking.user_id,
+                                      else_=MonthlyRanking.position)
+        MonthlyRanking.query.filter(
+            MonthlyRanking.monthly_exam_id == exam_id,
+            MonthlyRanking.user_id.in_(chunk)
+        ).update(values, synchronize_session=False)
+
+    new_rows = [{
+        'monthly_exam_id': exam_id,
+        'user_id': user_id,
+        'position': positions.get(user_id, 0),  # Updated when rankings are calculated
+        'roll_number': roll_number,
+        'created_at': now,
+        'updated_at': now
+    } for user_id, roll_number in roll_numbers.items() if user_id not in existing_ids]
+    if new_rows:
+        db.session.execute(insert(MonthlyRanking), new_rows)
+
+    # Rows loaded earlier in this session must not keep the old roll numbers
+    db.session.expire_all()
+    return len(roll_numbers)
+
+
+def parse_roll_assignments(monthly_exam, assignments):
+    """
+    Validate a list of {user_id, roll_number} against the exam's batch.
+
+    Entries without both values or for students outside the batch are skipped,
+    as they were before bulk assignment. Returns {user_id: roll_number}.
+    """
+    requested = {}
+    for assignment in assignments or []:
+        if not isinstance(assignment, dict):
+            continue
+        user_id = parse_user_id(assignment.get('user_id'))
+        roll_number = assignment.get('roll_number')
+        if not user_id or not roll_number:
+            continue
+        requested[user_id] = roll_number
+
+    members = get_batch_member_ids(monthly_exam.batch_id, requested)
+    return {user_id: roll for user_id, roll in requested.items() if user_id in members}
@@ -4,13 +4,15 @@ BulkSMSBD API integration with balance tracking and templates
 """
 import os
 import json
-import requests
 import logging
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 from dataclasses import dataclass
 from flask import current_app
 from models import SmsLog, SmsTemplate, User, Settings, db
+from services import sms_gateway
+from services.sms_dispatch import send_grouped
+from services.sms_segments import MIXED_WEIGHTED_PER_SMS, segment_message
 
 logger = logging.getLogger(__name__)
 
@@ -86,41 +88,8 @@ class SMSService:
                 'balance': 0
             }
         
-        try:
-            # BulkSMSBD Balance API format: GET http://bulksmsbd.net/api/getBalanceApi?api_key=YOUR_API_KEY
-            params = {
-                'api_key': self.config.api_key
-            }
-            
-            response = requests.get(
-                self.config.balance_url,
-                params=params,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                # Response format: {"balance":"994"}
-                data = response.json()
-                balance = int(data.get('balance', 0)) if data.get('balance') else 0
-                return {
-                    'success': True,
-                    'balance': balance,
-                    'currency': 'BDT'
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': f'API returned status {response.status_code}',
-                    'balance': 0
-                }
-                
-        except Exception as e:
-            logger.error(f"Error checking SMS balance: {e}")
-            return {
-                'success': False,
-                'error': str(e),
-                'balance': 0
-            }
+        # BulkSMSBD Balance API format: GET http://bulksmsbd.net/api/getBalanceApi?api_key=YOUR_API_KEY
+        return sms_gateway.check_balance(self.config.api_key, self.config.balance_url)
     
     def send_sms(self, message: SMSMessage, user_id: Optional[int] = None) -> SMSResult:
         """Send single SMS using BulkSMSBD API"""
@@ -130,162 +99,72 @@ class SMSService:
                 error='SMS API key not configured'
             )
         
+        result = self._deliver(message)
+        
+        # Log the SMS
+        self._log_sms(message, result, user_id)
+        
+        return result
+    
+    def _deliver(self, message: SMSMessage) -> SMSResult:
+        """Send through the gateway client without touching the database"""
         try:
-            # Format phone number for Bangladesh
-            formatted_phone = self.clean_phone_number(message.recipient)
-            if not formatted_phone.startswith('88'):
-                formatted_phone = '88' + formatted_phone
-            
-            # BulkSMSBD API format: GET with parameters
-            params = {
-                'api_key': self.config.api_key,
-                'type': 'text',
-                'number': formatted_phone,
-                'senderid': message.sender_id or self.config.sender_id,
-                'message': message.message
-            }
-            
-            # Send request using GET method
-            response = requests.get(
-                self.config.api_url,
-                params=params,
-                timeout=30
+            response = self._send_many(
+                [self._gateway_number(message.recipient)],
+                message.message,
+                message.sender_id or self.config.sender_id
             )
-            
-            # Parse response
-            result = self._parse_response(response, message, user_id)
-            
-            # Log the SMS
-            self._log_sms(message, result, user_id)
-            
-            return result
-            
         except Exception as e:
             logger.error(f"Error sending SMS: {e}")
-            result = SMSResult(
-                success=False,
-                error=str(e)
-            )
-            self._log_sms(message, result, user_id)
-            return result
+            response = {'success': False, 'error': str(e)}
+        return self._to_result(response)
     
-    def send_bulk_sms(self, messages: List[SMSMessage], user_id: Optional[int] = None) -> List[SMSResult]:
-        """Send multiple SMS messages"""
-        results = []
-        
-        for message in messages:
-            result = self.send_sms(message, user_id)
-            results.append(result)
-            
-            # Small delay between messages to avoid rate limiting
-            import time
-            time.sleep(0.1)
-        
-        return results
-
-def send_attendance_notification(phone_number, student_name, status, date, batch_name, teacher_name):
-    """
-    Send attendance notification SMS to parent/guardian
+    def _gateway_number(self, phone: str) -> str:
+        """Format phone number for Bangladesh"""
+        formatted_phone = self.clean_phone_number(phone)
+        if not formatted_phone.startswith('88'):
+            formatted_phone = '88' + formatted_phone
+        return formatted_phone
     
-    Args:
-        phone_number (str): Phone number to send SMS to
-        student_name (str): Name of the student
-        status (str): Attendance status (present/absent)
-        date (str): Date of attendance
-        batch_name (str): Name of the batch/class
-        teacher_name (str): Name of the teacher
-        
-    Returns:
-        dict: Result of SMS sending operation
-    """
-    try:
-        # Create SMS service instance
-        sms_service = SMSService()
-        
-        # Format the message
-        status_text = "PRESENT" if status.lower() == 'present' else "ABSENT"
-        message = f"Attendance Alert: {student_name} was {status_text} on {date} in {batch_name}. Teacher: {teacher_name}. Thank you."
-        
-        # Send SMS
-        result = sms_service.send_sms(phone_number, message, message_type='attendance')
-        
-        return {
-            'success': result.success,
-            'message': 'SMS sent successfully' if result.success else f'SMS failed: {result.error}',
-            'response': {
-                'message_id': result.message_id,
-                'cost': result.cost,
-                'balance_remaining': result.balance_remaining,
-                'error': result.error
-            }
-        }
-        
-    except Exception as e:
-        logger.error(f"Failed to send attendance SMS: {e}")
-        return {
-            'success': False,
-            'message': f'Unexpected error: {str(e)}',
-            'response': {'error': str(e)}
-        }
-
-def send_bulk_attendance_sms(attendance_data, batch_name, date, teacher_name):
-    """
-    Send attendance SMS to multiple parents
+    def _send_many(self, phones: List[str], text: str, sender_id: str) -> Dict[str, Any]:
+        # Pooled keep-alive client; retries only what the gateway did not process
+        return sms_gateway.send_sms_to_many(
+            phones,
+            text,
+            api_key=self.config.api_key,
+            sender_id=sender_id,
+            api_url=self.config.api_url
+        )
     
-    Args:
-        attendance_data (list): List of attendance records with student and phone info
-        batch_name (str): Name of the batch/class
-        date (str): Date of attendance
-        teacher_name (str): Name of the teacher
-        
-    Returns:
-        dict: Summary of SMS sending results
-    """
-    results = {
-        'total': len(attendance_data),
-        'sent': 0,
-        'failed': 0,
-        'details': []
-    }
+    def _to_result(self, response: Dict[str, Any]) -> SMSResult:
+        if response['success']:
+            return SMSResult(
+                success=True,
+                message_id=response.get('message_id'),
+                cost=1.0,  # Each SMS costs 1 credit
+                balance_remaining=0  # Will be updated from balance API
+            )
+        return SMSResult(success=False, error=response.get('error'))
     
-    for item in attendance_data:
-        student_name = item.get('student_name')
-        phone_number = item.get('phone_number')
-        status = item.get('status')
-        
-        if not phone_number:
-            results['failed'] += 1
-            results['details'].append({
-                'student': student_name,
-                'phone': phone_number,
-                'status': 'failed',
-                'error': 'No phone number'
-            })
-            continue
+    def send_bulk_sms(self, messages: List[SMSMessage], user_id: Optional[int] = None) -> List[SMSResult]:
+        """
+        Send multiple SMS messages: recipients of the same text share
+        multi-number requests, sent concurrently within the gateway's rate limit
+        """
+        if not self.config.api_key:
+            return [SMSResult(success=False, error='SMS API key not configured') for _ in messages]
         
-        result = send_attendance_notification(
-            phone_number=phone_number,
-            student_name=student_name,
-            status=status,
-            date=date,
-            batch_name=batch_name,
-            teacher_name=teacher_name
+        responses = send_grouped(
+            [(self._gateway_number(m.recipient), m.message, m.sender_id or self.config.sender_id) for m in messages],
+            send_many=self._send_many
         )
+        results = [self._to_result(response) for response in responses]
         
-        if result['success']:
-            results['sent'] += 1
-        else:
-            results['failed'] += 1
-            
-        results['details'].append({
-            'student': student_name,
-            'phone': phone_number,
-            'status': 'sent' if result['success'] else 'failed',
-            'message': result['message']
-        })
-    
-    return results
-    
+        for message, result in zip(messages, results):
+            self._log_sms(message, result, user_id)
+        
+        return results
+
     def send_template_sms(self, template_id: int, recipients: List[str], 
                          variables: Dict[str, Any], user_id: Optional[int] = None) -> List[SMSResult]:
         """Send SMS using template"""
@@ -314,47 +193,6 @@ def send_bulk_attendance_sms(attendance_data, batch_name, date, teacher_name):
             logger.error(f"Error sending template SMS: {e}")
             return [SMSResult(success=False, error=str(e))]
     
-    def _parse_response(self, response: requests.Response, message: SMSMessage, user_id: Optional[int]) -> SMSResult:
-        """Parse BulkSMSBD API response"""
-        try:
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    response_code = data.get('response_code')
-                    success_message = data.get('success_message', '')
-                    error_message = data.get('error_message', '')
-                    
-                    # BulkSMSBD success codes: 200 or 202
-                    if response_code in [200, 202]:
-                        return SMSResult(
-                            success=True,
-                            message_id=success_message,
-                            cost=1.0,  # Each SMS costs 1 credit
-                            balance_remaining=0  # Will be updated from balance API
-                        )
-                    else:
-                        return SMSResult(
-                            success=False,
-                            error=error_message or f"API Error Code: {response_code}"
-                        )
-                except ValueError:
-                    return SMSResult(
-                        success=False,
-                        error='Invalid API response format'
-                    )
-            else:
-                return SMSResult(
-                    success=False,
-                    error=f'HTTP {response.status_code}: {response.text}'
-                )
-                
-        except Exception as e:
-            logger.error(f"Error parsing SMS response: {e}")
-            return SMSResult(
-                success=False,
-                error=f'Response parsing error: {str(e)}'
-            )
-    
     def _log_sms(self, message: SMSMessage, result: SMSResult, user_id: Optional[int]):
         """Log SMS to database"""
         try:
@@ -426,63 +264,26 @@ def send_bulk_attendance_sms(attendance_data, batch_name, date, teacher_name):
     
     def calculate_sms_count(self, text: str) -> Dict[str, Any]:
         """
-        Calculate SMS count considering:
-        - Pure English: 160 chars per SMS
-        - Mixed Bangla/English: 100 chars per SMS (Unicode)
-        - Pure Bangla: 70 chars per SMS (each Bangla char = ~2.2 English chars)
+        Calculate SMS count with the same rules the message is charged by:
+        - Pure English: 120 chars per SMS
+        - Pure Bangla: 65 chars per SMS
+        - Mixed Bangla/English: 100 weighted chars per SMS (each Bangla char = 2.3 English chars)
         """
-        if not text:
+        segments = segment_message(text or '')
+        if segments.type == 'empty':
             return {'sms_count': 0, 'char_count': 0, 'type': 'empty'}
         
-        char_count = len(text)
-        is_unicode = self.contains_unicode(text)
-        
-        # Check if text has Bangla characters
-        has_bangla = any('\u0980' <= char <= '\u09FF' for char in text)
-        
-        if not is_unicode:
-            # Pure English: 160 chars per SMS
-            sms_count = 1 if char_count <= 160 else (char_count // 153) + (1 if char_count % 153 else 0)
-            return {
-                'sms_count': sms_count,
-                'char_count': char_count,
-                'type': 'english',
-                'limit_per_sms': 160 if sms_count == 1 else 153,
-                'chars_used': char_count,
-                'chars_remaining': (160 if sms_count == 1 else 153 * sms_count) - char_count
-            }
-        
-        if has_bangla:
-            # Mixed or Pure Bangla: 100 chars per SMS (safer for mixed content)
-            # Count Bangla chars with 2.2x weight
-            bangla_count = sum(1 for char in text if '\u0980' <= char <= '\u09FF')
-            english_count = char_count - bangla_count
-            weighted_count = int(bangla_count * 2.2 + english_count)
-            
-            # Use 100 char limit for mixed content
-            sms_count = 1 if weighted_count <= 100 else (weighted_count // 100) + (1 if weighted_count % 100 else 0)
-            
-            return {
-                'sms_count': sms_count,
-                'char_count': char_count,
-                'weighted_count': weighted_count,
-                'bangla_chars': bangla_count,
-                'english_chars': english_count,
-                'type': 'mixed' if english_count > 0 else 'bangla',
-                'limit_per_sms': 100,
-                'chars_used': weighted_count,
-                'chars_remaining': (100 * sms_count) - weighted_count
-            }
-        
-        # Unicode but not Bangla (other Unicode chars)
-        sms_count = 1 if char_count <= 70 else (char_count // 67) + (1 if char_count % 67 else 0)
+        chars_used = segments.weighted_count if segments.type == 'mixed' else segments.char_count
         return {
-            'sms_count': sms_count,
-            'char_count': char_count,
-            'type': 'unicode',
-            'limit_per_sms': 70 if sms_count == 1 else 67,
-            'chars_used': char_count,
-            'chars_remaining': (70 if sms_count == 1 else 67 * sms_count) - char_count
+            'sms_count': segments.sms_count,
+            'char_count': segments.char_count,
+            'weighted_count': segments.weighted_count,
+            'bangla_chars': segments.bengali_chars,
+            'english_chars': segments.other_chars,
+            'type': segments.type,
+            'limit_per_sms': segments.limit_per_sms,
+            'chars_used': chars_used,
+            'chars_remaining': segments.limit_per_sms * segments.sms_count - chars_used
         }
     
     def truncate_message(self, text: str, max_sms: int = 1) -> str:
@@ -492,27 +293,21 @@ def send_bulk_attendance_sms(attendance_data, batch_name, date, teacher_name):
         if not text:
             return text
         
-        is_unicode = self.contains_unicode(text)
-        has_bangla = any('\u0980' <= char <= '\u09FF' for char in text)
+        segments = segment_message(text)
+        if segments.sms_count <= max_sms:
+            return text
         
-        if has_bangla or is_unicode:
-            # Mixed/Bangla: 100 chars per SMS
-            max_chars = max_sms * 100
-            
-            # Calculate weighted length
-            truncated = text
-            while len(truncated) > 0:
-                stats = self.calculate_sms_count(truncated)
-                if stats['sms_count'] <= max_sms:
-                    return truncated
-                # Remove last 10 chars and try again
-                truncated = truncated[:-10].strip()
-            
-            return text[:max_chars]
-        else:
-            # English: 160 chars for first SMS, 153 for subsequent
-            max_chars = 160 if max_sms == 1 else (153 * max_sms)
-            return text[:max_chars]
+        if segments.type == 'english':
+            return text[:segments.limit_per_sms * max_sms]
+        
+        # Bangla/mixed: drop 10 chars at a time until the weighted length fits
+        truncated = text
+        while len(truncated) > 0:
+            if segment_message(truncated).sms_count <= max_sms:
+                return truncated
+            truncated = truncated[:-10].strip()
+        
+        return text[:max_sms * MIXED_WEIGHTED_PER_SMS]
     
     def get_templates(self, category: Optional[str] = None) -> List[SmsTemplate]:
         """Get SMS templates"""
@@ -566,6 +361,109 @@ def send_bulk_attendance_sms(attendance_data, batch_name, date, teacher_name):
         
         return True
 
+def send_attendance_notification(phone_number, student_name, status, date, batch_name, teacher_name):
+    """
+    Send attendance notification SMS to parent/guardian
+    
+    Args:
+        phone_number (str): Phone number to send SMS to
+        student_name (str): Name of the student
+        status (str): Attendance status (present/absent)
+        date (str): Date of attendance
+        batch_name (str): Name of the batch/class
+        teacher_name (str): Name of the teacher
+        
+    Returns:
+        dict: Result of SMS sending operation
+    """
+    try:
+        # Create SMS service instance
+        sms_service = SMSService()
+        
+        # Format the message
+        status_text = "PRESENT" if status.lower() == 'present' else "ABSENT"
+        message = f"Attendance Alert: {student_name} was {status_text} on {date} in {batch_name}. Teacher: {teacher_name}. Thank you."
+        
+        # Send SMS
+        result = sms_service.send_sms(phone_number, message, message_type='attendance')
+        
+        return {
+            'success': result.success,
+            'message': 'SMS sent successfully' if result.success else f'SMS failed: {result.error}',
+            'response': {
+                'message_id': result.message_id,
+                'cost': result.cost,
+                'balance_remaining': result.balance_remaining,
+                'error': result.error
+            }
+        }
+        
+    except Exception as e:
+        logger.error(f"Failed to send attendance SMS: {e}")
+        return {
+            'success': False,
+            'message': f'Unexpected error: {str(e)}',
+            'response': {'error': str(e)}
+        }
+
+def send_bulk_attendance_sms(attendance_data, batch_name, date, teacher_name):
+    """
+    Send attendance SMS to multiple parents
+    
+    Args:
+        attendance_data (list): List of attendance records with student and phone info
+        batch_name (str): Name of the batch/class
+        date (str): Date of attendance
+        teacher_name (str): Name of the teacher
+        
+    Returns:
+        dict: Summary of SMS sending results
+    """
+    results = {
+        'total': len(attendance_data),
+        'sent': 0,
+        'failed': 0,
+        'details': []
+    }
+    
+    for item in attendance_data:
+        student_name = item.get('student_name')
+        phone_number = item.get('phone_number')
+        status = item.get('status')
+        
+        if not phone_number:
+            results['failed'] += 1
+            results['details'].append({
+                'student': student_name,
+                'phone': phone_number,
+                'status': 'failed',
+                'error': 'No phone number'
+            })
+            continue
+        
+        result = send_attendance_notification(
+            phone_number=phone_number,
+            student_name=student_name,
+            status=status,
+            date=date,
+            batch_name=batch_name,
+            teacher_name=teacher_name
+        )
+        
+        if result['success']:
+            results['sent'] += 1
+        else:
+            results['failed'] += 1
+            
+        results['details'].append({
+            'student': student_name,
+            'phone': phone_number,
+            'status': 'sent' if result['success'] else 'failed',
+            'message': result['message']
+        })
+    
+    return results
+
 class SMSTemplateManager:
     """Manager for SMS templates with predefined templates"""
     
@@ -0,0 +1,182 @@
+"""
+Single-Flight Coalescing
+One computation per expensive key at a time, across threads and workers.
+
+The first request that finds a result missing or outdated takes a lock for
+its key (a thread lock plus an flock'd file, so gunicorn workers on the same
+host coordinate too) and computes it. Concurrent requests for the same key
+poll for the published result instead of computing it again, for at most
+SINGLE_FLIGHT_WAIT_SECONDS, and then fall back to the last stale copy.
+
+coalesce() works with any store the caller can read back (e.g. the ranking
+snapshot table); shared_result() adds a small file store for results that
+have no table of their own.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+from flask import current_app, has_app_context
+
+try:
+    import fcntl
+except ImportError:  # Windows: coordinate threads of this worker only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WAIT_SECONDS = 5.0
+POLL_INTERVAL_SECONDS = 0.05
+
+_registry_lock = threading.Lock()
+_thread_locks = {}  # key -> threading.Lock
+
+
+def _config(name, default):
+    return current_app.config.get(name, default) if has_app_context() else default
+
+
+def get_single_flight_dir():
+    if has_app_context():
+        path = current_app.config.get('SINGLE_FLIGHT_DIR') or os.path.join(current_app.instance_path, 'single_flight')
+    else:
+        path = os.path.join(tempfile.gettempdir(), 'single_flight')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _safe_name(key):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', key)
+
+
+class FlightLock:
+    """Non-blocking lock for one key, held by one thread of one worker at a time"""
+
+    def __init__(self, key):
+        with _registry_lock:
+            self._thread_lock = _thread_locks.setdefault(key, threading.Lock())
+        self._path = os.path.join(get_single_flight_dir(), f'{_safe_name(key)}.lock')
+        self._fd = None
+
+    def acquire(self):
+        if not self._thread_lock.acquire(blocking=False):
+            return False
+        if fcntl is None:
+            return True
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            self._thread_lock.release()
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+
+def coalesce(key, load, compute, wait_seconds=None):
+    """
+    Return a fresh value for key, computing it in one place at a time.
+
+    load() returns (value, fresh) from the shared store and must see results
+    committed by other workers; compute() builds the value, stores it and
+    returns it. Callers that lose the race wait for the winner's result, up
+    to wait_seconds, then return the last value load() gave them. Only when
+    there is no copy at all do they compute it themselves.
+    """
+    value, fresh = load()
+    if fresh:
+        return value
+    stale = value
+
+    lock = FlightLock(key)
+    if wait_seconds is None:
+        wait_seconds = _config('SINGLE_FLIGHT_WAIT_SECONDS', DEFAULT_WAIT_SECONDS)
+    deadline = time.monotonic() + wait_seconds
+
+    while True:
+        if lock.acquire():
+            try:
+                # The previous holder may have just published it
+                value, fresh = load()
+                return value if fresh else compute()
+            finally:
+                lock.release()
+
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(POLL_INTERVAL_SECONDS)
+        value, fresh = load()
+        if fresh:
+            return value
+        if value is not None:
+            stale = value
+
+    if stale is not None:
+        logger.warning(f"Serving a stale copy of {key}: still being computed after {wait_seconds}s")
+        return stale
+    logger.warning(f"Computing {key} without coalescing: no copy after {wait_seconds}s")
+    return compute()
+
+
+def make_fingerprint(*parts):
+    """Short stable hash of JSON-serializable parts"""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _read_result(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_result(path, fingerprint, value):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.result-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': fingerprint, 'value': value}, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def shared_result(key, fingerprint, compute, wait_seconds=None):
+    """
+    JSON-serializable result shared by every worker through a file.
+
+    The stored result is reused while fingerprint matches; otherwise one
+    caller recomputes it (see coalesce) and publishes it for the others.
+    """
+    path = os.path.join(get_single_flight_dir(), f'{_safe_name(key)}.json')
+
+    def load():
+        stored = _read_result(path)
+        if stored is None:
+            return None, False
+        return stored['value'], stored['fingerprint'] == fingerprint
+
+    def compute_and_store():
+        value = compute()
+        try:
+            _write_result(path, fingerprint, value)
+        except (OSError, TypeError) as e:
+            logger.warning(f"Could not store shared result {key}: {e}")
+        return value
+
+    return coalesce(key, load, compute_and_store, wait_seconds)
@@ -0,0 +1,145 @@
+"""
+SMS Credits
+Append-only ledger of the system SMS balance, with reserve/settle for campaigns.
+
+Every change to the balance is a row in sms_credit_ledger: the opening balance,
+credits added by the super user and debits for delivered messages. A campaign
+reserves its estimated cost in one entry before it sends and is settled once,
+when it finishes, with a single debit of what it actually used. The totals are
+materialized in the one-row sms_credit_balance table and moved with atomic
+`balance = balance + :delta` updates in the transaction of the ledger insert,
+so reading the balance is one primary-key lookup and rebuild_balance() can
+always recompute it from the ledger.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import exists, func, insert, literal, select
+
+from models import db, Settings, SmsCreditBalance, SmsCreditEntry
+
+logger = logging.getLogger(__name__)
+
+ENTRY_OPENING = 'opening'
+ENTRY_CREDIT = 'credit'
+ENTRY_DEBIT = 'debit'
+ENTRY_RESERVATION = 'reservation'
+
+RESERVATION_HELD = 'held'
+RESERVATION_SETTLED = 'settled'
+
+BALANCE_ROW_ID = 1
+LEGACY_BALANCE_KEY = 'sms_balance'  # Settings row the balance used to be rewritten in
+
+
+def _legacy_balance():
+    setting = Settings.query.filter_by(key=LEGACY_BALANCE_KEY).first()
+    return (setting.value or {}).get('balance', 0) if setting else 0
+
+
+def ensure_balance_row():
+    """
+    Create the balance row on first use, opening the ledger with the balance
+    that was kept in Settings. Does not commit.
+    """
+    if db.session.get(SmsCreditBalance, BALANCE_ROW_ID) is not None:
+        return
+    opening = _legacy_balance()
+    # Conditional insert: only the first of several racing workers opens the ledger
+    created = db.session.execute(insert(SmsCreditBalance).from_select(
+        ['id', 'balance', 'held', 'updated_at'],
+        select(literal(BALANCE_ROW_ID), literal(opening), literal(0), literal(datetime.utcnow())).where(
+            ~exists().where(SmsCreditBalance.id == BALANCE_ROW_ID)
+        )
+    )).rowcount
+    if created:
+        db.session.add(SmsCreditEntry(entry_type=ENTRY_OPENING, amount=opening,
+                                      memo='Balance carried over from settings'))
+
+
+def _move(balance=0, held=0):
+    SmsCreditBalance.query.filter_by(id=BALANCE_ROW_ID).update({
+        'balance': SmsCreditBalance.balance + balance,
+        'held': SmsCreditBalance.held + held,
+        'updated_at': datetime.utcnow()
+    }, synchronize_session=False)
+
+
+def get_sms_balance():
+    """Posted balance, credits held by running campaigns and what is left available"""
+    ensure_balance_row()
+    row = db.session.query(SmsCreditBalance.balance, SmsCreditBalance.held).filter(
+        SmsCreditBalance.id == BALANCE_ROW_ID
+    ).one()
+    return {'balance': row.balance, 'held': row.held, 'available': row.balance - row.held}
+
+
+def add_credits(amount, created_by=None, memo=None):
+    """Credit purchased SMS to the system balance. Does not commit."""
+    ensure_balance_row()
+    entry = SmsCreditEntry(entry_type=ENTRY_CREDIT, amount=amount, created_by=created_by, memo=memo)
+    db.session.add(entry)
+    _move(balance=amount)
+    return entry
+
+
+def debit_credits(amount, reference=None, created_by=None, reservation_id=None):
+    """Debit used SMS from the system balance. Does not commit."""
+    ensure_balance_row()
+    entry = SmsCreditEntry(entry_type=ENTRY_DEBIT, amount=-amount, reference=reference,
+                           created_by=created_by, reservation_id=reservation_id)
+    db.session.add(entry)
+    _move(balance=-amount)
+    return entry
+
+
+def reserve_credits(amount, reference=None, created_by=None):
+    """
+    Hold `amount` credits for a campaign about to send. Does not commit.
+
+    The hold does not refuse a campaign the balance cannot cover (the
+    gateway remains the authority on what can be sent); it keeps running
+    campaigns visible in get_sms_balance() until they are settled.
+    """
+    ensure_balance_row()
+    entry = SmsCreditEntry(entry_type=ENTRY_RESERVATION, amount=-amount, status=RESERVATION_HELD,
+                           reference=reference, created_by=created_by)
+    db.session.add(entry)
+    db.session.flush()
+    _move(held=amount)
+    return entry
+
+
+def settle_reservation(reservation_id, used):
+    """
+    Release a campaign's hold and debit the `used` credits, once.
+
+    Returns the debit entry, or None when the reservation was already settled
+    (e.g. by another worker). Does not commit.
+    """
+    settled = SmsCreditEntry.query.filter_by(
+        id=reservation_id, entry_type=ENTRY_RESERVATION, status=RESERVATION_HELD
+    ).update({'status': RESERVATION_SETTLED, 'settled_at': datetime.utcnow()}, synchronize_session=False)
+    if not settled:
+        return None
+    reservation = db.session.get(SmsCreditEntry, reservation_id)
+    _move(held=reservation.amount)
+    return debit_credits(used, reference=reservation.reference, created_by=reservation.created_by,
+                         reservation_id=reservation_id)
+
+
+def rebuild_balance():
+    """Recompute the materialized balance from the ledger. Does not commit."""
+    ensure_balance_row()
+    balance = db.session.query(func.coalesce(func.sum(SmsCreditEntry.amount), 0)).filter(
+        SmsCreditEntry.entry_type != ENTRY_RESERVATION
+    ).scalar()
+    held = db.session.query(func.coalesce(func.sum(-SmsCreditEntry.amount), 0)).filter(
+        SmsCreditEntry.entry_type == ENTRY_RESERVATION,
+        SmsCreditEntry.status == RESERVATION_HELD
+    ).scalar()
+    SmsCreditBalance.query.filter_by(id=BALANCE_ROW_ID).update(
+        {'balance': balance, 'held': held, 'updated_at': datetime.utcnow()}, synchronize_session=False
+    )
+    logger.info(f"Rebuilt SMS balance from ledger: {balance} ({held} held)")
+    return {'balance': balance, 'held': held, 'available': balance - held}
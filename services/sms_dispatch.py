@@ -0,0 +1,148 @@
+"""
+SMS Dispatch
+Bounded concurrent fan-out of gateway calls under the provider's rate limit.
+
+Sending is I/O bound, so a campaign's messages go out from a small thread pool
+(SMS_DISPATCH_WORKERS) instead of one after another. Every call first takes a
+token from a process-wide token bucket refilled at SMS_GATEWAY_RATE_PER_SECOND,
+so concurrent campaigns of this worker together stay under BulkSMSBD's request
+rate. Pool threads only talk to the gateway: results come back in input order
+for the caller to log and account for in its own database session.
+
+send_grouped() also merges recipients of the same text into multi-number
+requests, so a campaign costs a handful of requests instead of one per number.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+
+from services import sms_gateway
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_RATE_PER_SECOND = 20
+DEFAULT_NUMBERS_PER_REQUEST = 100
+
+_limiters_lock = threading.Lock()
+_limiters = {}  # (rate, burst) -> TokenBucket
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `capacity` banked"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _config(name, default):
+    return current_app.config.get(name, default) if has_app_context() else default
+
+
+def get_rate_limiter():
+    """The gateway's token bucket shared by every campaign of this process (None when unlimited)"""
+    rate = _config('SMS_GATEWAY_RATE_PER_SECOND', DEFAULT_RATE_PER_SECOND)
+    if not rate or rate <= 0:
+        return None
+    burst = _config('SMS_GATEWAY_BURST', None) or rate
+    with _limiters_lock:
+        return _limiters.setdefault((rate, burst), TokenBucket(rate, burst))
+
+
+def dispatch(calls, send=None, workers=None):
+    """
+    Run send(*args) for every args tuple in calls, concurrently and rate limited.
+
+    send defaults to the gateway client and must not touch the database
+    session. Returns the results in the order of calls; an exception raised
+    by send becomes {'success': False, 'error': ...}.
+    """
+    calls = list(calls)
+    send = send or sms_gateway.send_sms
+    limiter = get_rate_limiter()
+    app = current_app._get_current_object() if has_app_context() else None
+    if workers is None:
+        workers = _config('SMS_DISPATCH_WORKERS', DEFAULT_WORKERS)
+
+    def run(args):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            if app is None or has_app_context():
+                return send(*args)
+            # Pool threads need the app context for the gateway settings
+            with app.app_context():
+                return send(*args)
+        except Exception as e:
+            logger.warning(f"SMS dispatch failed: {e}")
+            return {'success': False, 'error': str(e)}
+
+    workers = max(1, min(workers or 1, len(calls)))
+    if workers == 1:
+        return [run(args) for args in calls]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sms-dispatch') as pool:
+        return list(pool.map(run, calls))
+
+
+def send_grouped(calls, send_many=None, chunk_size=None, workers=None):
+    """
+    Send (phone, message, *options) calls with one request per chunk of
+    numbers that share the message and options.
+
+    send_many(phones, message, *options) defaults to the gateway client.
+    Returns one result per call, in order; the numbers of a chunk share its
+    result. When the gateway rejects a multi-number request over an invalid
+    number, its numbers are retried one by one so the others still go out.
+    """
+    calls = list(calls)
+    send_many = send_many or sms_gateway.send_sms_to_many
+    if chunk_size is None:
+        chunk_size = _config('SMS_GATEWAY_NUMBERS_PER_REQUEST', DEFAULT_NUMBERS_PER_REQUEST)
+    chunk_size = max(1, chunk_size)
+
+    groups = {}  # (message, *options) -> [call index]
+    for index, call in enumerate(calls):
+        groups.setdefault(tuple(call[1:]), []).append(index)
+    chunks = [(key, indexes[start:start + chunk_size])
+              for key, indexes in groups.items()
+              for start in range(0, len(indexes), chunk_size)]
+
+    results = [None] * len(calls)
+    chunk_results = dispatch([([calls[i][0] for i in indexes], *key) for key, indexes in chunks],
+                             send=send_many, workers=workers)
+
+    retry_singly = []
+    for (key, indexes), result in zip(chunks, chunk_results):
+        if len(indexes) > 1 and result.get('response_code') in sms_gateway.INVALID_NUMBER_CODES:
+            retry_singly.extend(indexes)
+            continue
+        for i in indexes:
+            results[i] = result
+
+    if retry_singly:
+        logger.info(f"Gateway rejected an invalid number; sending {len(retry_singly)} numbers one by one")
+        single_results = dispatch([([calls[i][0]], *calls[i][1:]) for i in retry_singly],
+                                  send=send_many, workers=workers)
+        for i, result in zip(retry_singly, single_results):
+            results[i] = result
+    return results
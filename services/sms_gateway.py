@@ -0,0 +1,188 @@
+"""
+SMS Gateway Client
+One pooled, keep-alive HTTP client for the BulkSMSBD API.
+
+Every SMS path sends through this module instead of calling requests
+directly. A process-wide requests.Session keeps connections to the gateway
+open between messages. Requests the gateway did not process (connection
+failures, 429 and 503 responses) are retried a bounded number of times with
+exponential backoff; read timeouts are not retried, since the message may
+already have gone out. Each call's latency is measured, logged and returned.
+One request can carry several numbers that receive the same text.
+"""
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF_SECONDS = 0.5
+DEFAULT_POOL_SIZE = 10
+
+# BulkSMSBD response codes for an accepted message
+SUCCESS_CODES = (200, 202)
+# ... and for a request rejected because of a bad number in it
+INVALID_NUMBER_CODES = (1001,)
+
+_session_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+
+def _config(name, default):
+    return current_app.config.get(name, default) if has_app_context() else default
+
+
+def get_gateway_credentials():
+    """(api_key, sender_id, api_url) for sending"""
+    return (
+        _config('SMS_API_KEY', os.environ.get('SMS_API_KEY', '')),
+        _config('SMS_SENDER_ID', os.environ.get('SMS_SENDER_ID', '')),
+        _config('SMS_API_URL', 'http://bulksmsbd.net/api/smsapi')
+    )
+
+
+def _build_session():
+    retries = _config('SMS_GATEWAY_RETRIES', DEFAULT_RETRIES)
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        status_forcelist=(429, 503),
+        backoff_factor=_config('SMS_GATEWAY_BACKOFF_SECONDS', DEFAULT_BACKOFF_SECONDS),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    pool_size = _config('SMS_GATEWAY_POOL_SIZE', DEFAULT_POOL_SIZE)
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_gateway_session():
+    """The pooled session of this process (rebuilt after a fork)"""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = _build_session()
+                _session_pid = os.getpid()
+    return _session
+
+
+def reset_gateway_session():
+    """Drop the pooled session, e.g. after changing gateway settings"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_timeouts():
+    return (_config('SMS_GATEWAY_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+            _config('SMS_GATEWAY_READ_TIMEOUT', DEFAULT_READ_TIMEOUT))
+
+
+def format_gateway_number(phone):
+    """Number in the 88-prefixed form the gateway expects"""
+    number = phone.strip().replace(' ', '').replace('-', '').replace('+', '')
+    return number if number.startswith('88') else '88' + number
+
+
+def _get(url, params, action):
+    """GET the gateway; returns (response, latency_ms) or raises requests exceptions"""
+    started = time.perf_counter()
+    response = get_gateway_session().get(url, params=params, timeout=get_timeouts())
+    latency_ms = int((time.perf_counter() - started) * 1000)
+    logger.info(f"SMS gateway {action}: HTTP {response.status_code} in {latency_ms}ms")
+    return response, latency_ms
+
+
+def send_sms(phone, message, api_key=None, sender_id=None, api_url=None):
+    """
+    Send one message. Returns {'success', 'message_id', 'cost'} or
+    {'success': False, 'error'}, both with 'latency_ms'.
+    """
+    return send_sms_to_many([phone], message, api_key, sender_id, api_url)
+
+
+def send_sms_to_many(phones, message, api_key=None, sender_id=None, api_url=None):
+    """
+    Send the same message to several numbers in one request.
+
+    The gateway accepts or rejects the request as a whole, so the result
+    applies to every number; 'cost' is per number. A rejection carries the
+    gateway's 'response_code', telling it apart from transport failures.
+    """
+    default_key, default_sender, default_url = get_gateway_credentials()
+    params = {
+        'api_key': api_key or default_key,
+        'type': 'text',
+        'number': ','.join(format_gateway_number(phone) for phone in phones),
+        'senderid': sender_id or default_sender,
+        'message': message
+    }
+
+    started = time.perf_counter()
+    try:
+        response, latency_ms = _get(api_url or default_url, params, f'send to {len(phones)}')
+    except requests.exceptions.Timeout:
+        latency_ms = int((time.perf_counter() - started) * 1000)
+        logger.warning(f"SMS gateway send timed out after {latency_ms}ms")
+        return {'success': False, 'error': 'SMS API timeout', 'latency_ms': latency_ms}
+    except requests.exceptions.ConnectionError:
+        latency_ms = int((time.perf_counter() - started) * 1000)
+        logger.warning(f"SMS gateway connection failed after {latency_ms}ms")
+        return {'success': False, 'error': 'SMS API connection error', 'latency_ms': latency_ms}
+    except requests.exceptions.RequestException as e:
+        latency_ms = int((time.perf_counter() - started) * 1000)
+        logger.warning(f"SMS gateway request failed after {latency_ms}ms: {e}")
+        return {'success': False, 'error': f'SMS API error: {str(e)}', 'latency_ms': latency_ms}
+
+    if response.status_code != 200:
+        return {'success': False, 'error': f'HTTP {response.status_code}: {response.text}',
+                'latency_ms': latency_ms}
+    try:
+        data = response.json()
+    except ValueError:
+        return {'success': False, 'error': 'Invalid API response format', 'latency_ms': latency_ms}
+
+    response_code = data.get('response_code')
+    if response_code in SUCCESS_CODES:
+        return {'success': True, 'message_id': data.get('success_message', ''), 'cost': 1,
+                'latency_ms': latency_ms}
+    return {'success': False, 'error': data.get('error_message') or f"API Error Code: {response_code}",
+            'response_code': response_code, 'latency_ms': latency_ms}
+
+
+def check_balance(api_key=None, balance_url='http://bulksmsbd.net/api/getBalanceApi'):
+    """Gateway account balance: {'success', 'balance'} or {'success': False, 'error'}"""
+    try:
+        response, latency_ms = _get(balance_url, {'api_key': api_key or get_gateway_credentials()[0]},
+                                    'balance')
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Error checking SMS balance: {e}")
+        return {'success': False, 'error': str(e), 'balance': 0}
+
+    if response.status_code != 200:
+        return {'success': False, 'error': f'API returned status {response.status_code}', 'balance': 0}
+    try:
+        # Response format: {"balance":"994"}
+        data = response.json()
+    except ValueError:
+        return {'success': False, 'error': 'Invalid API response format', 'balance': 0}
+    balance = int(float(data.get('balance') or 0))
+    return {'success': True, 'balance': balance, 'currency': 'BDT', 'latency_ms': latency_ms}
@@ -0,0 +1,323 @@
+"""
+SMS Outbox
+Durable queue of outgoing SMS, delivered by a background worker.
+
+Routes add messages to sms_outbox in the transaction of the write that
+triggers them and return without waiting for the gateway. A daemon thread in
+each worker process claims due messages, sends them, writes their SmsLog row
+and retries failed deliveries with exponential backoff. A message is claimed
+with a conditional UPDATE, so several processes can drain the same table
+without sending anything twice.
+
+A campaign's messages share one credit reservation (reserve_campaign()):
+its system credits and the sender's SMS quota are held when it is queued and
+settled once, after its last message is delivered or given up on.
+"""
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func
+
+from models import db, SmsOutbox, SmsLog, SmsStatus, User
+from services.sms_credits import debit_credits, reserve_credits, settle_reservation
+from services.sms_dispatch import send_grouped
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_QUEUED = 'queued'
+OUTBOX_SENDING = 'sending'
+OUTBOX_SENT = 'sent'
+OUTBOX_FAILED = 'failed'
+
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_BASE_SECONDS = 30  # Doubled after every failed attempt
+CLAIM_BATCH_SIZE = 100
+DEFAULT_POLL_SECONDS = 5
+
+# A message left in 'sending' this long lost its worker (e.g. a restart)
+SENDING_TIMEOUT = timedelta(minutes=10)
+
+_worker_lock = threading.Lock()
+_worker_pid = None
+_wake = threading.Event()
+
+
+def enqueue_sms(phone, message, user_id=None, sent_by=None, category=None, charge_sender=False,
+                max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Queue one message for delivery.
+
+    Does not commit: call inside the transaction that triggers the message,
+    then notify_outbox() once it is committed.
+    """
+    item = SmsOutbox(
+        phone_number=phone,
+        message=message,
+        user_id=user_id,
+        sent_by=sent_by,
+        category=category,
+        charge_sender=charge_sender,
+        status=OUTBOX_QUEUED,
+        max_attempts=max_attempts,
+        next_attempt_at=datetime.utcnow()
+    )
+    db.session.add(item)
+    return item
+
+
+def reserve_campaign(items, created_by=None, reference=None):
+    """
+    Hold credits for a campaign of queued messages in one reservation.
+
+    Holds the estimated cost of all `items` on the system balance and takes
+    the charge_sender messages off their sender's SMS quota up front; both
+    are settled by drain_outbox() once the campaign is finished. Does not
+    commit. Returns the reservation entry (None for an empty campaign).
+    """
+    from routes.sms import calculate_sms_cost
+
+    if not items:
+        return None
+    reservation = reserve_credits(sum(calculate_sms_cost(item.message) for item in items),
+                                  reference=reference, created_by=created_by)
+    charged = {}
+    for item in items:
+        item.reservation_id = reservation.id
+        if item.charge_sender and item.sent_by:
+            charged[item.sent_by] = charged.get(item.sent_by, 0) + 1
+    for user_id, count in charged.items():
+        _adjust_quota(user_id, -count)
+    return reservation
+
+
+def _adjust_quota(user_id, delta):
+    User.query.filter_by(id=user_id).update({'sms_count': User.sms_count + delta}, synchronize_session=False)
+
+
+def settle_finished_campaigns(reservation_ids):
+    """
+    Settle the reservations whose messages are all sent or failed: one debit
+    of the credits actually used and a refund of the sender quota held for
+    messages that failed. Commits; returns the number of campaigns settled.
+    """
+    settled = 0
+    for reservation_id in reservation_ids:
+        pending = SmsOutbox.query.filter(
+            SmsOutbox.reservation_id == reservation_id,
+            SmsOutbox.status.in_((OUTBOX_QUEUED, OUTBOX_SENDING))
+        ).count()
+        if pending:
+            continue
+        used = db.session.query(func.coalesce(func.sum(SmsLog.cost), 0)).join(
+            SmsOutbox, SmsOutbox.sms_log_id == SmsLog.id
+        ).filter(SmsOutbox.reservation_id == reservation_id, SmsOutbox.status == OUTBOX_SENT).scalar()
+        if settle_reservation(reservation_id, int(used)) is None:
+            db.session.rollback()  # Settled by another worker
+            continue
+        refunds = db.session.query(SmsOutbox.sent_by, func.count(SmsOutbox.id)).filter(
+            SmsOutbox.reservation_id == reservation_id,
+            SmsOutbox.status == OUTBOX_FAILED,
+            SmsOutbox.charge_sender == True,
+            SmsOutbox.sent_by.isnot(None)
+        ).group_by(SmsOutbox.sent_by).all()
+        for user_id, count in refunds:
+            _adjust_quota(user_id, count)
+        db.session.commit()
+        settled += 1
+    return settled
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt after `attempts` failed ones"""
+    return timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+def _requeue_abandoned(now):
+    SmsOutbox.query.filter(
+        SmsOutbox.status == OUTBOX_SENDING,
+        SmsOutbox.claimed_at < now - SENDING_TIMEOUT
+    ).update({'status': OUTBOX_QUEUED, 'claim_token': None}, synchronize_session=False)
+
+
+def claim_due_messages(limit=CLAIM_BATCH_SIZE):
+    """Mark up to `limit` due messages as sending for this caller and return them"""
+    now = datetime.utcnow()
+    _requeue_abandoned(now)
+    due_ids = [row[0] for row in db.session.query(SmsOutbox.id).filter(
+        SmsOutbox.status == OUTBOX_QUEUED,
+        SmsOutbox.next_attempt_at <= now
+    ).order_by(SmsOutbox.next_attempt_at, SmsOutbox.id).limit(limit).all()]
+    if not due_ids:
+        db.session.commit()
+        return []
+
+    token = uuid.uuid4().hex
+    # Rows another worker claimed in the meantime are no longer 'queued'
+    SmsOutbox.query.filter(
+        SmsOutbox.id.in_(due_ids),
+        SmsOutbox.status == OUTBOX_QUEUED
+    ).update({'status': OUTBOX_SENDING, 'claim_token': token, 'claimed_at': now}, synchronize_session=False)
+    db.session.commit()
+    return SmsOutbox.query.filter_by(claim_token=token).order_by(SmsOutbox.id).populate_existing().all()
+
+
+def _charge_sender(user_id):
+    User.query.filter_by(id=user_id).update({
+        'sms_count': case((User.sms_count > 0, User.sms_count - 1), else_=0)
+    }, synchronize_session=False)
+
+
+def record_delivery(item, result):
+    """
+    Store the gateway result of a claimed message; returns its new status.
+
+    Messages outside a campaign are charged as they are delivered; a
+    campaign's messages are charged when its reservation is settled.
+    """
+    from routes.sms import calculate_sms_cost
+
+    now = datetime.utcnow()
+    item.attempts += 1
+    item.claim_token = None
+
+    if result.get('success'):
+        cost = calculate_sms_cost(item.message)
+        item.sms_log = SmsLog(
+            user_id=item.user_id,
+            phone_number=item.phone_number,
+            message=item.message,
+            status=SmsStatus.SENT,
+            api_response=result,
+            sent_by=item.sent_by,
+            cost=cost,
+            sent_at=now
+        )
+        item.status = OUTBOX_SENT
+        item.sent_at = now
+        item.last_error = None
+        if item.reservation_id is None:
+            if item.charge_sender and item.sent_by:
+                _charge_sender(item.sent_by)
+            debit_credits(cost, reference=f'outbox:{item.category or "sms"}', created_by=item.sent_by)
+    elif item.attempts < item.max_attempts:
+        item.status = OUTBOX_QUEUED
+        item.last_error = result.get('error')
+        item.next_attempt_at = now + retry_delay(item.attempts)
+    else:
+        item.sms_log = SmsLog(
+            user_id=item.user_id,
+            phone_number=item.phone_number,
+            message=item.message,
+            status=SmsStatus.FAILED,
+            api_response=result,
+            sent_by=item.sent_by,
+            cost=0,
+            sent_at=now
+        )
+        item.status = OUTBOX_FAILED
+        item.last_error = result.get('error')
+
+    db.session.commit()
+    return item.status
+
+
+def drain_outbox(limit=None):
+    """
+    Deliver due messages until none are left (or `limit` were handled).
+
+    Returns the number of messages sent, rescheduled for retry and failed.
+    """
+    from routes.sms import send_sms_many_via_api
+
+    counts = {OUTBOX_SENT: 0, OUTBOX_QUEUED: 0, OUTBOX_FAILED: 0}
+    handled = 0
+    while limit is None or handled < limit:
+        batch_size = CLAIM_BATCH_SIZE if limit is None else min(CLAIM_BATCH_SIZE, limit - handled)
+        claimed = claim_due_messages(batch_size)
+        if not claimed:
+            break
+        # Identical texts share multi-number requests, sent concurrently;
+        # outcomes are recorded here, one SmsLog per number
+        results = send_grouped([(item.phone_number, item.message) for item in claimed],
+                               send_many=send_sms_many_via_api)
+        for item, result in zip(claimed, results):
+            try:
+                counts[record_delivery(item, result)] += 1
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Could not record delivery of outbox message {item.id}: {e}", exc_info=True)
+        settle_finished_campaigns(sorted({item.reservation_id for item in claimed if item.reservation_id}))
+        handled += len(claimed)
+    return {'sent': counts[OUTBOX_SENT], 'retrying': counts[OUTBOX_QUEUED], 'failed': counts[OUTBOX_FAILED]}
+
+
+def _worker_loop(app):
+    poll_seconds = app.config.get('SMS_OUTBOX_POLL_SECONDS', DEFAULT_POLL_SECONDS)
+    while True:
+        with app.app_context():
+            try:
+                drain_outbox()
+            except Exception as e:
+                logger.error(f"SMS outbox worker failed: {e}", exc_info=True)
+                db.session.rollback()
+            finally:
+                db.session.remove()
+        # Woken early by notify_outbox(); the timeout picks up retries
+        _wake.wait(poll_seconds)
+        _wake.clear()
+
+
+def start_outbox_worker(app):
+    """Start this process's delivery thread once (and again in a forked child)"""
+    global _worker_pid
+    if not app.config.get('SMS_OUTBOX_WORKER', True) or _worker_pid == os.getpid():
+        return False
+    with _worker_lock:
+        if _worker_pid == os.getpid():
+            return False
+        _worker_pid = os.getpid()
+        threading.Thread(target=_worker_loop, args=(app,), name='sms-outbox', daemon=True).start()
+    return True
+
+
+def notify_outbox():
+    """Wake the delivery worker after committing newly queued messages"""
+    start_outbox_worker(current_app._get_current_object())
+    _wake.set()
+
+
+def get_outbox_summary(sent_by=None, status=None, limit=50):
+    """Message counts by status and the most recent messages, optionally for one sender"""
+    counts_query = db.session.query(SmsOutbox.status, func.count(SmsOutbox.id))
+    items_query = SmsOutbox.query
+    if sent_by is not None:
+        counts_query = counts_query.filter(SmsOutbox.sent_by == sent_by)
+        items_query = items_query.filter(SmsOutbox.sent_by == sent_by)
+    if status:
+        items_query = items_query.filter(SmsOutbox.status == status)
+
+    counts = {OUTBOX_QUEUED: 0, OUTBOX_SENDING: 0, OUTBOX_SENT: 0, OUTBOX_FAILED: 0}
+    counts.update(dict(counts_query.group_by(SmsOutbox.status).all()))
+    return {
+        'counts': counts,
+        'messages': [{
+            'id': item.id,
+            'phone_number': item.phone_number,
+            'message': item.message,
+            'user_id': item.user_id,
+            'category': item.category,
+            'status': item.status,
+            'attempts': item.attempts,
+            'max_attempts': item.max_attempts,
+            'next_attempt_at': item.next_attempt_at.isoformat() if item.status == OUTBOX_QUEUED else None,
+            'last_error': item.last_error,
+            'sms_log_id': item.sms_log_id,
+            'reservation_id': item.reservation_id,
+            'created_at': item.created_at.isoformat() if item.created_at else None,
+            'sent_at': item.sent_at.isoformat() if item.sent_at else None
+        } for item in items_query.order_by(SmsOutbox.id.desc()).limit(limit).all()]
+    }
@@ -0,0 +1,63 @@
+"""
+SMS Segments
+Length, segment count and cost of an SMS text, computed once per distinct text.
+
+The character limit check, the credit cost of a message and the template
+editor's statistics all derive from one classification of the text: how many
+of its characters are Bengali (U+0980 to U+09FF), weighted 2.3x, and how many
+are not. Plain ASCII text is recognised with str.isascii() and otherwise the
+Bengali characters are counted by a compiled regex, so no Python-level loop
+runs per character. Results are memoized: a campaign renders the same text
+for many recipients and charges it several times (reservation, delivery).
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+BENGALI_WEIGHT = 2.3  # A Bengali character counts as 2.3 English ones
+
+# Characters per SMS by message type; mixed messages count weighted characters
+ENGLISH_CHARS_PER_SMS = 120
+BANGLA_CHARS_PER_SMS = 65
+MIXED_WEIGHTED_PER_SMS = 100
+
+CACHE_SIZE = 4096
+
+_BENGALI = re.compile('[\u0980-\u09FF]')
+
+SmsSegments = namedtuple('SmsSegments', ['type', 'char_count', 'bengali_chars', 'other_chars',
+                                         'weighted_count', 'sms_count', 'limit_per_sms'])
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def segment_message(text):
+    """Classify `text` and compute its weighted length and SMS count"""
+    if not text:
+        return SmsSegments('empty', 0, 0, 0, 0, 0, ENGLISH_CHARS_PER_SMS)
+
+    char_count = len(text)
+    bengali = 0 if text.isascii() else len(_BENGALI.findall(text))
+    other = char_count - bengali
+    weighted = bengali * BENGALI_WEIGHT + other
+
+    if bengali == 0:
+        message_type, limit = 'english', ENGLISH_CHARS_PER_SMS
+        sms_count = (other + limit - 1) // limit
+    elif other == 0:
+        message_type, limit = 'bangla', BANGLA_CHARS_PER_SMS
+        sms_count = (bengali + limit - 1) // limit
+    else:
+        message_type, limit = 'mixed', MIXED_WEIGHTED_PER_SMS
+        sms_count = int((weighted + limit - 1) // limit)
+
+    return SmsSegments(message_type, char_count, bengali, other, int(weighted), max(1, sms_count), limit)
+
+
+def sms_cost(text):
+    """Credits charged for sending `text` to one number"""
+    return segment_message(text).sms_count
+
+
+def weighted_length(text):
+    """Length of `text` with Bengali characters weighted, as checked against the limit"""
+    return segment_message(text).weighted_count
@@ -0,0 +1,152 @@
+"""
+SMS Template Registry
+Saved SMS templates loaded once per worker and rendered by precompiled formatters.
+
+Template overrides live in two places: the shared `sms_template_<type>`
+Settings rows edited through /api/sms/templates/<type>, and the per-teacher
+SmsTemplate rows saved with PUT /api/sms/templates/<id>. Both are read in one
+load and kept in memory. Routes that change a template call
+invalidate_templates() after committing. That replaces a version file in the
+shared single-flight directory, and every worker reloads when it sees a new
+version, at the cost of one stat() per lookup. SMS_TEMPLATE_CACHE_SECONDS
+bounds how long a change made outside the routes (e.g. a script) goes
+unnoticed.
+
+compile_template() turns a template text into literal and placeholder parts
+once, so rendering a campaign is a single join per recipient instead of a
+str.replace() per placeholder.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+from flask import current_app, has_app_context
+
+from models import db, Settings, SmsTemplate
+from services.single_flight import get_single_flight_dir
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_KEY_PREFIX = 'sms_template_'
+VERSION_FILENAME = 'sms_templates.version'
+DEFAULT_CACHE_SECONDS = 300
+COMPILED_CACHE_SIZE = 256
+
+_PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+_lock = threading.Lock()
+_state = {'version': None, 'loaded_at': 0.0, 'shared': {}, 'personal': {}}
+
+
+def _config(name, default):
+    return current_app.config.get(name, default) if has_app_context() else default
+
+
+def _version_path():
+    return os.path.join(get_single_flight_dir(), VERSION_FILENAME)
+
+
+def _current_version():
+    path = _version_path()
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return path, None
+    return path, (stat.st_ino, stat.st_mtime_ns)
+
+
+def _load():
+    shared = {}
+    for key, value in db.session.query(Settings.key, Settings.value).filter(
+        Settings.key.like(f'{TEMPLATE_KEY_PREFIX}%')
+    ).all():
+        message = value.get('message') if value else None
+        if message:
+            shared[key[len(TEMPLATE_KEY_PREFIX):]] = message
+
+    personal = {}
+    for user_id, name, content in db.session.query(
+        SmsTemplate.created_by, SmsTemplate.name, SmsTemplate.content
+    ).filter(SmsTemplate.is_active == True).order_by(SmsTemplate.id).all():
+        personal[(user_id, name)] = content
+    return shared, personal
+
+
+def _templates():
+    version = _current_version()
+    max_age = _config('SMS_TEMPLATE_CACHE_SECONDS', DEFAULT_CACHE_SECONDS)
+    state = _state
+    if state['version'] == version and time.monotonic() - state['loaded_at'] < max_age:
+        return state
+
+    shared, personal = _load()
+    with _lock:
+        _state.update(version=version, loaded_at=time.monotonic(), shared=shared, personal=personal)
+    logger.debug(f"Loaded {len(shared)} shared and {len(personal)} personal SMS templates")
+    return _state
+
+
+def get_saved_templates():
+    """{template_type: message} of the shared templates saved in Settings"""
+    return dict(_templates()['shared'])
+
+
+def get_saved_template(template_type):
+    """Shared saved message of a template type, or None"""
+    return _templates()['shared'].get(template_type)
+
+
+def get_user_template(user_id, template_id):
+    """A teacher's own saved message for a template, or None"""
+    if user_id is None:
+        return None
+    return _templates()['personal'].get((user_id, template_id))
+
+
+def invalidate_templates():
+    """Make every worker reload templates; call after committing a template change"""
+    path = _version_path()
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(uuid.uuid4().hex)
+    os.replace(tmp_path, path)  # New inode: a new version even within one mtime tick
+    with _lock:
+        _state.update(version=None, loaded_at=0.0)
+
+
+class CompiledTemplate:
+    """Template text split once into literals and {placeholder} names"""
+
+    __slots__ = ('text', 'fields', '_parts')
+
+    def __init__(self, text):
+        self.text = text
+        self._parts = _PLACEHOLDER.split(text)  # literal, name, literal, name, ..., literal
+        self.fields = tuple(self._parts[1::2])
+
+    def render(self, values):
+        """Fill placeholders from `values`; unknown placeholders are left as written"""
+        parts = self._parts[:]
+        for i in range(1, len(parts), 2):
+            name = parts[i]
+            if name in values:
+                value = values[name]
+                parts[i] = '' if value is None else str(value)
+            else:
+                parts[i] = f'{{{name}}}'
+        return ''.join(parts)
+
+
+@lru_cache(maxsize=COMPILED_CACHE_SIZE)
+def compile_template(text):
+    """Compiled formatter for a template text, shared by every render of it"""
+    return CompiledTemplate(text)
+
+
+def render_template(text, **values):
+    """Render a template text with the given placeholder values"""
+    return compile_template(text).render(values)
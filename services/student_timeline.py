@@ -0,0 +1,103 @@
+"""
+Student Timeline
+Month-by-month progress of one student across monthly exams.
+
+Every saved final ranking of the student is read in one query; LAG() window
+functions over each batch's months supply the month-over-month deltas, so the
+cost grows with the number of months, not with the size of the batch.
+"""
+import logging
+
+from sqlalchemy import func
+
+from models import db, MonthlyExam, MonthlyRanking
+from services.attendance_calendar import get_month_calendars
+
+logger = logging.getLogger(__name__)
+
+
+def parse_year_month(value):
+    """Parse 'YYYY-MM' into (year, month); raises ValueError"""
+    year, month = (int(part) for part in value.split('-'))
+    if not 1 <= month <= 12:
+        raise ValueError(f'Invalid month in {value}')
+    return year, month
+
+
+def _delta(current, previous, digits=2):
+    if current is None or previous is None:
+        return None
+    return round(current - previous, digits)
+
+
+def get_student_timeline(user_id, start=None, end=None):
+    """
+    Final ranking rows of a student per monthly exam, oldest first.
+
+    start and end are optional inclusive (year, month) bounds. Deltas compare
+    with the same batch's previous ranked month, even when it lies before start.
+    """
+    period = MonthlyExam.year * 100 + MonthlyExam.month
+    by_month = {'partition_by': MonthlyExam.batch_id, 'order_by': (MonthlyExam.year, MonthlyExam.month)}
+
+    ranked = db.session.query(
+        MonthlyExam.id.label('exam_id'),
+        MonthlyExam.title.label('exam_title'),
+        MonthlyExam.batch_id,
+        MonthlyExam.year,
+        MonthlyExam.month,
+        period.label('period'),
+        MonthlyRanking.position,
+        MonthlyRanking.roll_number,
+        MonthlyRanking.percentage,
+        MonthlyRanking.gpa,
+        MonthlyRanking.grade,
+        MonthlyRanking.final_total,
+        MonthlyRanking.max_possible_total,
+        MonthlyRanking.attendance_marks,
+        func.lag(MonthlyRanking.position).over(**by_month).label('previous_position'),
+        func.lag(MonthlyRanking.percentage).over(**by_month).label('previous_percentage'),
+        func.lag(MonthlyRanking.gpa).over(**by_month).label('previous_gpa'),
+        func.lag(MonthlyRanking.attendance_marks).over(**by_month).label('previous_attendance')
+    ).join(
+        MonthlyExam, MonthlyRanking.monthly_exam_id == MonthlyExam.id
+    ).filter(
+        MonthlyRanking.user_id == user_id,
+        MonthlyRanking.is_final == True
+    ).subquery()
+
+    query = db.session.query(ranked)
+    if start:
+        query = query.filter(ranked.c.period >= start[0] * 100 + start[1])
+    if end:
+        query = query.filter(ranked.c.period <= end[0] * 100 + end[1])
+    rows = query.order_by(ranked.c.period, ranked.c.batch_id).all()
+
+    calendars = get_month_calendars((row.batch_id, row.year, row.month) for row in rows)
+
+    timeline = []
+    for row in rows:
+        working_days = calendars[(row.batch_id, row.year, row.month)].working_days
+        timeline.append({
+            'monthly_exam_id': row.exam_id,
+            'exam_title': row.exam_title,
+            'batch_id': row.batch_id,
+            'year': row.year,
+            'month': row.month,
+            'position': row.position,
+            'roll_number': row.roll_number,
+            'percentage': round(row.percentage or 0, 2),
+            'gpa': row.gpa,
+            'grade': row.grade,
+            'final_total': row.final_total,
+            'max_possible_total': row.max_possible_total,
+            'attendance_days': row.attendance_marks,
+            'working_days': working_days,
+            'attendance_percentage': round(row.attendance_marks / working_days * 100, 2) if working_days else 0,
+            # Positive position_change means the student moved up
+            'position_change': row.previous_position - row.position if row.previous_position else None,
+            'percentage_change': _delta(row.percentage, row.previous_percentage),
+            'gpa_change': _delta(row.gpa, row.previous_gpa),
+            'attendance_change': _delta(row.attendance_marks, row.previous_attendance, 0)
+        })
+    return timeline
@@ -0,0 +1,102 @@
+"""
+Subject Ranks
+Per-paper rank and percentile of every student in a monthly exam.
+
+RANK() and PERCENT_RANK() window functions over monthly_marks compute the
+values in one query per exam; they are stored on the marks rows with one
+executemany UPDATE whenever the exam's ranking snapshot is refreshed.
+Absent students are not ranked.
+"""
+import logging
+
+from sqlalchemy import bindparam, func, or_, update
+
+from models import db, MonthlyMark, IndividualExam, User
+
+logger = logging.getLogger(__name__)
+
+
+def _present():
+    return or_(MonthlyMark.is_absent == False, MonthlyMark.is_absent.is_(None))
+
+
+def refresh_subject_ranks(monthly_exam_id):
+    """Recompute and store subject_rank/subject_percentile for an exam. Does not commit."""
+    by_paper = {'partition_by': MonthlyMark.individual_exam_id, 'order_by': MonthlyMark.marks_obtained.desc()}
+    rows = db.session.query(
+        MonthlyMark.id,
+        func.rank().over(**by_paper),
+        func.percent_rank().over(**by_paper)
+    ).filter(
+        MonthlyMark.monthly_exam_id == monthly_exam_id,
+        _present()
+    ).all()
+
+    # Absent students lose any rank from an earlier refresh. Ranks are derived
+    # data: updated_at keeps the mark's last edit, which the marks fingerprints read
+    MonthlyMark.query.filter(
+        MonthlyMark.monthly_exam_id == monthly_exam_id,
+        MonthlyMark.is_absent == True,
+        MonthlyMark.subject_rank.isnot(None)
+    ).update({'subject_rank': None, 'subject_percentile': None, 'updated_at': MonthlyMark.updated_at},
+             synchronize_session=False)
+
+    if rows:
+        table = MonthlyMark.__table__
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('mark_id')).values(
+                subject_rank=bindparam('rank'), subject_percentile=bindparam('percentile'),
+                updated_at=table.c.updated_at
+            ).execution_options(synchronize_session=False),
+            [{'mark_id': mark_id, 'rank': rank, 'percentile': round((1 - percent_rank) * 100, 2)}
+             for mark_id, rank, percent_rank in rows]
+        )
+    return len(rows)
+
+
+def get_subject_ranks(monthly_exam_id, user_id=None):
+    """
+    Stored subject ranks grouped per paper, in paper order.
+
+    user_id limits the entries to one student; ranked_students still counts
+    everyone ranked in the paper.
+    """
+    papers = IndividualExam.query.filter_by(
+        monthly_exam_id=monthly_exam_id
+    ).order_by(IndividualExam.order_index).all()
+
+    ranked_counts = dict(db.session.query(
+        MonthlyMark.individual_exam_id, func.count(MonthlyMark.id)
+    ).filter(
+        MonthlyMark.monthly_exam_id == monthly_exam_id,
+        MonthlyMark.subject_rank.isnot(None)
+    ).group_by(MonthlyMark.individual_exam_id).all())
+
+    query = db.session.query(MonthlyMark, User).join(
+        User, MonthlyMark.user_id == User.id
+    ).filter(
+        MonthlyMark.monthly_exam_id == monthly_exam_id,
+        MonthlyMark.subject_rank.isnot(None)
+    )
+    if user_id is not None:
+        query = query.filter(MonthlyMark.user_id == user_id)
+
+    entries = {}
+    for mark, student in query.order_by(MonthlyMark.subject_rank, User.first_name).all():
+        entries.setdefault(mark.individual_exam_id, []).append({
+            'user_id': student.id,
+            'student_name': student.full_name,
+            'marks_obtained': mark.marks_obtained,
+            'total_marks': mark.total_marks,
+            'subject_rank': mark.subject_rank,
+            'subject_percentile': mark.subject_percentile
+        })
+
+    return [{
+        'individual_exam_id': paper.id,
+        'title': paper.title,
+        'subject': paper.subject,
+        'marks': paper.marks,
+        'ranked_students': ranked_counts.get(paper.id, 0),
+        'ranks': entries.get(paper.id, [])
+    } for paper in papers]
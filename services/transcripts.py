@@ -0,0 +1,192 @@
+"""
+Year-End Transcripts
+Per-student transcripts combining every monthly exam of a batch in a year.
+
+All marks, final rankings and attendance counts of the year are loaded up
+front in a fixed number of queries (seven, however many months are
+included). Transcripts are then assembled one student at a time while the
+CSV or JSON lines output is streamed.
+"""
+import calendar
+import csv
+import io
+import json
+import logging
+from datetime import date
+
+from sqlalchemy import extract, func
+
+from models import (db, MonthlyExam, IndividualExam, MonthlyMark, MonthlyRanking, User,
+                    Attendance, AttendanceStatus)
+from services.attendance_calendar import get_month_calendars
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_FORMATS = ('csv', 'jsonl')
+
+CSV_COLUMNS = ['user_id', 'student_name', 'roll_number', 'year', 'month', 'exam_title', 'position',
+               'total_students', 'final_total', 'max_possible_total', 'percentage', 'grade', 'gpa',
+               'attendance_days', 'working_days', 'attendance_percentage', 'subjects']
+
+
+def load_transcript_inputs(batch_id, year):
+    """Everything the transcripts of a batch year need, in seven queries"""
+    exams = MonthlyExam.query.filter_by(batch_id=batch_id, year=year).order_by(
+        MonthlyExam.month, MonthlyExam.id
+    ).all()
+    exam_ids = [exam.id for exam in exams]
+    if not exam_ids:
+        return {'batch_id': batch_id, 'year': year, 'exams': [], 'students': []}
+
+    papers = {}
+    for paper in IndividualExam.query.filter(IndividualExam.monthly_exam_id.in_(exam_ids)).order_by(
+        IndividualExam.monthly_exam_id, IndividualExam.order_index
+    ).all():
+        papers.setdefault(paper.monthly_exam_id, []).append(paper)
+
+    marks = {}
+    for row in db.session.query(
+        MonthlyMark.monthly_exam_id, MonthlyMark.individual_exam_id, MonthlyMark.user_id,
+        MonthlyMark.marks_obtained, MonthlyMark.total_marks, MonthlyMark.grade, MonthlyMark.is_absent
+    ).filter(MonthlyMark.monthly_exam_id.in_(exam_ids)).all():
+        marks[(row.user_id, row.individual_exam_id)] = row
+
+    rankings = {}
+    ranked_counts = {}
+    for ranking in MonthlyRanking.query.filter(
+        MonthlyRanking.monthly_exam_id.in_(exam_ids),
+        MonthlyRanking.is_final == True
+    ).all():
+        rankings[(ranking.user_id, ranking.monthly_exam_id)] = ranking
+        ranked_counts[ranking.monthly_exam_id] = ranked_counts.get(ranking.monthly_exam_id, 0) + 1
+
+    user_ids = {user_id for user_id, _ in marks} | {user_id for user_id, _ in rankings}
+    students = User.query.filter(User.id.in_(user_ids)).order_by(
+        User.first_name, User.last_name, User.id
+    ).all() if user_ids else []
+
+    month = extract('month', Attendance.date)
+    attendance = {
+        (user_id, int(month_number)): count
+        for user_id, month_number, count in db.session.query(
+            Attendance.user_id, month, func.count(Attendance.id)
+        ).filter(
+            Attendance.batch_id == batch_id,
+            Attendance.date >= date(year, 1, 1),
+            Attendance.date <= date(year, 12, 31),
+            Attendance.status == AttendanceStatus.PRESENT
+        ).group_by(Attendance.user_id, month).all()
+    }
+
+    calendars = get_month_calendars((batch_id, year, exam.month) for exam in exams)
+
+    return {
+        'batch_id': batch_id,
+        'year': year,
+        'exams': exams,
+        'papers': papers,
+        'marks': marks,
+        'rankings': rankings,
+        'ranked_counts': ranked_counts,
+        'students': students,
+        'attendance': attendance,
+        'working_days': {exam.month: calendars[(batch_id, year, exam.month)].working_days for exam in exams}
+    }
+
+
+def build_transcript(student, inputs):
+    """One student's transcript from preloaded inputs"""
+    months = []
+    for exam in inputs['exams']:
+        ranking = inputs['rankings'].get((student.id, exam.id))
+        subjects = []
+        for paper in inputs['papers'].get(exam.id, []):
+            mark = inputs['marks'].get((student.id, paper.id))
+            subjects.append({
+                'title': paper.title,
+                'subject': paper.subject,
+                'marks_obtained': mark.marks_obtained if mark else None,
+                'total_marks': mark.total_marks if mark else paper.marks,
+                'grade': mark.grade if mark else None,
+                'is_absent': mark is None or bool(mark.is_absent)
+            })
+        if ranking is None and all(subject['marks_obtained'] is None for subject in subjects):
+            continue  # Not part of this month's exam
+
+        working_days = inputs['working_days'][exam.month]
+        attendance_days = inputs['attendance'].get((student.id, exam.month), 0)
+        months.append({
+            'monthly_exam_id': exam.id,
+            'exam_title': exam.title,
+            'month': exam.month,
+            'month_name': calendar.month_name[exam.month],
+            'roll_number': ranking.roll_number if ranking else None,
+            'position': ranking.position if ranking else None,
+            'total_students': inputs['ranked_counts'].get(exam.id, 0),
+            'final_total': ranking.final_total if ranking else None,
+            'max_possible_total': ranking.max_possible_total if ranking else None,
+            'percentage': round(ranking.percentage, 2) if ranking and ranking.percentage is not None else None,
+            'grade': ranking.grade if ranking else None,
+            'gpa': ranking.gpa if ranking else None,
+            'attendance_days': attendance_days,
+            'working_days': working_days,
+            'attendance_percentage': round(attendance_days / working_days * 100, 2) if working_days else 0,
+            'subjects': subjects
+        })
+
+    ranked = [month for month in months if month['position'] is not None]
+    attendance_days = sum(month['attendance_days'] for month in months)
+    working_days = sum(month['working_days'] for month in months)
+    return {
+        'user_id': student.id,
+        'student_name': student.full_name,
+        'batch_id': inputs['batch_id'],
+        'year': inputs['year'],
+        'months': months,
+        'summary': {
+            'months_included': len(months),
+            'months_ranked': len(ranked),
+            'average_percentage': round(sum(m['percentage'] or 0 for m in ranked) / len(ranked), 2) if ranked else None,
+            'average_gpa': round(sum(m['gpa'] or 0 for m in ranked) / len(ranked), 2) if ranked else None,
+            'best_position': min(m['position'] for m in ranked) if ranked else None,
+            'attendance_days': attendance_days,
+            'working_days': working_days,
+            'attendance_percentage': round(attendance_days / working_days * 100, 2) if working_days else 0
+        }
+    }
+
+
+def iter_transcripts(inputs):
+    """Yield transcripts one student at a time"""
+    for student in inputs['students']:
+        yield build_transcript(student, inputs)
+
+
+def iter_transcript_jsonl(inputs):
+    """Yield one JSON line per student"""
+    for transcript in iter_transcripts(inputs):
+        yield json.dumps(transcript, ensure_ascii=False) + '\n'
+
+
+def _csv_line(values):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def iter_transcript_csv(inputs):
+    """Yield a header and one CSV row per student per month"""
+    yield _csv_line(CSV_COLUMNS)
+    for transcript in iter_transcripts(inputs):
+        for month in transcript['months']:
+            subjects = '; '.join(
+                f"{s['subject']}: {'Absent' if s['is_absent'] else s['marks_obtained']}/{s['total_marks']}"
+                for s in month['subjects']
+            )
+            yield _csv_line([
+                transcript['user_id'], transcript['student_name'], month['roll_number'],
+                transcript['year'], month['month'], month['exam_title'], month['position'],
+                month['total_students'], month['final_total'], month['max_possible_total'],
+                month['percentage'], month['grade'], month['gpa'], month['attendance_days'],
+                month['working_days'], month['attendance_percentage'], subjects
+            ])
@@ -0,0 +1,121 @@
+"""
+Shared pytest fixtures
+In-memory application, database and small factories for monthly exam data
+"""
+import sys
+from datetime import datetime, date
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import create_app
+from models import (db, User, UserRole, Batch, MonthlyExam, IndividualExam, MonthlyMark,
+                    Attendance, AttendanceStatus)
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Application bound to a fresh in-memory database"""
+    app = create_app('testing')
+    app.config['HOMEPAGE_SNAPSHOT_PATH'] = str(tmp_path / 'homepage_top_performers.json')
+    app.config['SINGLE_FLIGHT_DIR'] = str(tmp_path / 'single_flight')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, user):
+    """Put a user into the test client's session"""
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+        sess['user_role'] = user.role.value
+
+
+def make_teacher(phone='01700000000'):
+    teacher = User(phoneNumber=phone, first_name='Test', last_name='Teacher',
+                   role=UserRole.TEACHER, sms_count=1000)
+    db.session.add(teacher)
+    db.session.commit()
+    return teacher
+
+
+def make_batch(name='HSC Physics'):
+    batch = Batch(name=name, start_date=date(2025, 1, 1))
+    db.session.add(batch)
+    db.session.commit()
+    return batch
+
+
+def make_students(batch, count, start=0):
+    students = []
+    for i in range(start, start + count):
+        student = User(phoneNumber=f'0181{i:07d}', first_name=f'Student{i:03d}',
+                       last_name='Test', role=UserRole.STUDENT)
+        student.batches.append(batch)
+        db.session.add(student)
+        students.append(student)
+    db.session.commit()
+    return students
+
+
+def make_monthly_exam(batch, teacher, month=3, year=2025, papers=(('Physics', 50), ('Chemistry', 50))):
+    start_date = datetime(year, month, 1)
+    monthly_exam = MonthlyExam(title=f'Monthly {month}/{year}', month=month, year=year,
+                               total_marks=sum(m for _, m in papers), pass_marks=0,
+                               start_date=start_date, end_date=start_date,
+                               batch_id=batch.id, created_by=teacher.id)
+    db.session.add(monthly_exam)
+    db.session.flush()
+    for idx, (subject, marks) in enumerate(papers):
+        db.session.add(IndividualExam(monthly_exam_id=monthly_exam.id, title=f'{subject} Paper',
+                                      subject=subject, marks=marks, exam_date=start_date,
+                                      duration=60, order_index=idx + 1))
+    db.session.commit()
+    return monthly_exam
+
+
+def add_mark(monthly_exam, individual_exam, student, marks_obtained, is_absent=False):
+    mark = MonthlyMark(monthly_exam_id=monthly_exam.id, individual_exam_id=individual_exam.id,
+                       user_id=student.id, marks_obtained=marks_obtained,
+                       total_marks=individual_exam.marks,
+                       percentage=marks_obtained / individual_exam.marks * 100,
+                       is_absent=is_absent)
+    db.session.add(mark)
+    return mark
+
+
+def add_attendance(batch, student, day, status=AttendanceStatus.PRESENT):
+    record = Attendance(user_id=student.id, batch_id=batch.id, date=day, status=status)
+    db.session.add(record)
+    return record
+
+
+class QueryCounter:
+    """Count SQL statements executed on the database engine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
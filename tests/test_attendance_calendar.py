@@ -0,0 +1,54 @@
+"""
+Attendance calendar tests
+Working days skip weekends and holidays, and holidays feed the monthly ranking
+"""
+from datetime import date
+
+from models import db, Holiday
+from services.attendance_calendar import get_month_calendar, count_working_days
+from conftest import (login, make_teacher, make_batch, make_students, make_monthly_exam,
+                      add_attendance, QueryCounter)
+
+
+def test_working_days_exclude_weekends_and_holidays(app):
+    batch = make_batch()
+    other = make_batch('Other')
+    db.session.add_all([
+        Holiday(date=date(2025, 3, 26), name='Independence Day'),
+        Holiday(date=date(2025, 3, 17), name='Batch trip', batch_id=other.id),
+        Holiday(date=date(2025, 3, 15), name='Weekend holiday'),
+    ])
+    db.session.commit()
+
+    march = get_month_calendar(batch.id, 2025, 3)
+    assert march.working_days == 21 - 1
+    assert set(march.holidays) == {date(2025, 3, 26), date(2025, 3, 15)}
+    assert get_month_calendar(other.id, 2025, 3).working_days == 21 - 2
+    assert count_working_days(batch.id, date(2025, 2, 24), date(2025, 3, 7)) == 10
+
+    with QueryCounter(db.engine) as counter:
+        get_month_calendar(batch.id, 2025, 3)
+    assert counter.count == 0
+
+
+def test_holiday_changes_ranking_attendance_days(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 1)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    add_attendance(batch, students[0], date(2025, 3, 3))
+    db.session.commit()
+    login(client, teacher)
+
+    def total_attendance_days():
+        response = client.get(f'/api/monthly-exams/{monthly_exam.id}/comprehensive-ranking')
+        return response.get_json()['data']['rankings'][0]['total_attendance_days']
+
+    assert total_attendance_days() == 21
+
+    response = client.post('/api/attendance/holidays', json={'date': '2025-03-26', 'name': 'Independence Day'})
+    assert response.status_code == 201
+    assert total_attendance_days() == 20
+
+    response = client.get('/api/attendance/holidays?month=3&year=2025')
+    assert response.get_json()['data']['holidays'] == [{'date': '2025-03-26', 'name': 'Independence Day'}]
@@ -0,0 +1,66 @@
+"""
+Bonus marks tests
+Bonus marks live in monthly_bonus_marks and legacy Settings blobs migrate into it
+"""
+from models import db, MonthlyBonusMark, Settings
+from services.bonus_marks import get_exam_bonus_marks, migrate_settings_bonus_marks
+from conftest import login, make_teacher, make_batch, make_students, make_monthly_exam
+
+
+def test_update_bonus_upserts_rows(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 2)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    login(client, teacher)
+
+    def update(entries):
+        response = client.post(f'/api/monthly-exams/{monthly_exam.id}/update-bonus', json={'bonus_data': entries})
+        assert response.status_code == 200
+        return response.get_json()['data']['updated_count']
+
+    assert update([{'user_id': students[0].id, 'bonus_marks': 2}, {'bonus_marks': 4}]) == 1
+    assert update([{'user_id': students[0].id, 'bonus_marks': 3}, {'user_id': students[1].id, 'bonus_marks': '1.5'}]) == 2
+
+    assert get_exam_bonus_marks(monthly_exam.id) == {students[0].id: 3, students[1].id: 1.5}
+    assert get_exam_bonus_marks(monthly_exam.id, [students[1].id]) == {students[1].id: 1.5}
+    assert MonthlyBonusMark.query.count() == 2
+
+    response = client.get(f'/api/monthly-exams/{monthly_exam.id}/comprehensive-ranking')
+    bonuses = {r['user_id']: r['bonus_marks'] for r in response.get_json()['data']['rankings']}
+    assert bonuses == {students[0].id: 3, students[1].id: 1.5}
+
+
+def test_migrates_legacy_settings_blobs(app):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 3)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    db.session.add(MonthlyBonusMark(monthly_exam_id=monthly_exam.id, user_id=students[2].id, bonus_marks=9))
+    db.session.add_all([
+        Settings(key=f'monthly_exam_bonus_{monthly_exam.id}', category='exam_bonus',
+                 value={str(students[0].id): 2, str(students[1].id): 'bad', str(students[2].id): 1}),
+        Settings(key='monthly_exam_bonus_999', category='exam_bonus', value={'1': 5}),
+    ])
+    db.session.commit()
+
+    assert migrate_settings_bonus_marks() == (1, 1)
+    assert migrate_settings_bonus_marks() == (0, 0)
+
+    assert get_exam_bonus_marks(monthly_exam.id) == {students[0].id: 2, students[2].id: 9}
+    assert [s.key for s in Settings.query.all()] == ['monthly_exam_bonus_999']
+
+
+def test_deleting_exam_removes_its_bonus_marks(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 1)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    db.session.add(MonthlyBonusMark(monthly_exam_id=monthly_exam.id, user_id=students[0].id, bonus_marks=5))
+    db.session.commit()
+    login(client, teacher)
+
+    response = client.delete(f'/api/monthly-exams/{monthly_exam.id}')
+
+    assert response.status_code == 200
+    assert MonthlyBonusMark.query.count() == 0
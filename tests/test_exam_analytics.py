@@ -0,0 +1,65 @@
+"""
+Monthly exam analytics tests
+Statistics come from grouped SQL aggregates and are cached until marks change
+"""
+from models import db
+from conftest import login, make_teacher, make_batch, make_students, make_monthly_exam, add_mark, QueryCounter
+
+
+def _analytics(client, monthly_exam):
+    response = client.get(f'/api/monthly-exams/{monthly_exam.id}/analytics')
+    assert response.status_code == 200
+    return response.get_json()['data']
+
+
+def test_subject_aggregates_and_histogram(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 3)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    physics, chemistry = monthly_exam.individual_exams
+    for student, marks in zip(students, (50, 30, 10)):
+        add_mark(monthly_exam, physics, student, marks)
+    add_mark(monthly_exam, chemistry, students[0], 45)
+    db.session.commit()
+    login(client, teacher)
+
+    data = _analytics(client, monthly_exam)
+
+    assert data['overall_statistics']['total_students'] == 3
+    assert data['overall_statistics']['highest_percentage'] == 100
+    assert data['overall_statistics']['lowest_percentage'] == 20
+    assert data['subject_wise_performance']['Physics']['students_count'] == 3
+    assert data['subject_wise_performance']['Physics']['average'] == 60
+    assert data['subject_wise_performance']['Chemistry']['highest'] == 90
+    counts = {bucket['range']: bucket['count'] for bucket in data['score_distribution']}
+    assert counts == {'0-9': 0, '10-19': 0, '20-29': 1, '30-39': 0, '40-49': 0, '50-59': 0,
+                      '60-69': 1, '70-79': 0, '80-89': 0, '90-100': 2}
+    assert sum(data['grade_distribution'].values()) == 4
+
+
+def test_analytics_cached_until_marks_change(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 2)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    physics = monthly_exam.individual_exams[0]
+    add_mark(monthly_exam, physics, students[0], 20)
+    db.session.commit()
+    login(client, teacher)
+
+    first = _analytics(client, monthly_exam)
+    with QueryCounter(db.engine) as cached:
+        _analytics(client, monthly_exam)
+
+    response = client.post(
+        f'/api/monthly-exams/{monthly_exam.id}/individual-exams/{physics.id}/marks',
+        json={'students': [{'user_id': students[1].id, 'marks_obtained': 40}]}
+    )
+    assert response.status_code == 200
+    updated = _analytics(client, monthly_exam)
+
+    assert first['overall_statistics']['total_students'] == 1
+    assert updated['overall_statistics']['total_students'] == 2
+    # A cache hit only runs the session, exam and fingerprint lookups
+    assert cached.count <= 4
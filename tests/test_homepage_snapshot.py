@@ -0,0 +1,72 @@
+"""
+Homepage top performers snapshot tests
+The public endpoint serves a precomputed body with an ETag and never queries the database
+"""
+import pytest
+
+from models import db, MonthlyRanking
+from conftest import login, make_teacher, make_batch, make_students, make_monthly_exam, QueryCounter
+
+
+@pytest.fixture
+def seeded(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 4)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    for position, student in enumerate(students, start=1):
+        db.session.add(MonthlyRanking(monthly_exam_id=monthly_exam.id, user_id=student.id,
+                                      position=position, roll_number=position, final_total=100 - position,
+                                      max_possible_total=100, percentage=100 - position, grade='A',
+                                      is_final=True))
+    db.session.commit()
+    login(client, teacher)
+    return monthly_exam, students
+
+
+def _feature(client, monthly_exam, show=True):
+    response = client.post(f'/api/monthly-exams/{monthly_exam.id}/toggle-homepage',
+                           json={'show_on_homepage': show})
+    assert response.status_code == 200
+
+
+def test_featured_exam_top_three(client, seeded):
+    monthly_exam, students = seeded
+    _feature(client, monthly_exam)
+
+    response = client.get('/api/monthly-exams/homepage-top-performers')
+
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['count'] == 1
+    top = data['featured_results'][0]['top_students']
+    assert [s['position'] for s in top] == [1, 2, 3]
+    assert top[0]['student_name'] == students[0].full_name
+    assert data['featured_results'][0]['batch_name'] == monthly_exam.batch.name
+
+
+def test_served_without_queries_and_revalidated_by_etag(app, client, seeded):
+    monthly_exam, _ = seeded
+    _feature(client, monthly_exam)
+    first = client.get('/api/monthly-exams/homepage-top-performers')
+
+    with QueryCounter(db.engine) as counter:
+        again = client.get('/api/monthly-exams/homepage-top-performers')
+        not_modified = client.get('/api/monthly-exams/homepage-top-performers',
+                                  headers={'If-None-Match': first.headers['ETag']})
+
+    assert counter.count == 0
+    assert again.get_data() == first.get_data()
+    assert not_modified.status_code == 304
+
+
+def test_toggle_rebuilds_snapshot(client, seeded):
+    monthly_exam, _ = seeded
+    _feature(client, monthly_exam)
+    featured = client.get('/api/monthly-exams/homepage-top-performers')
+
+    _feature(client, monthly_exam, show=False)
+    response = client.get('/api/monthly-exams/homepage-top-performers')
+
+    assert response.headers['ETag'] != featured.headers['ETag']
+    assert response.get_json()['data']['featured_results'] == []
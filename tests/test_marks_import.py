@@ -0,0 +1,83 @@
+"""
+Marks sheet import tests
+CSV/XLSX uploads matched by roll number or phone with a per-row error report
+"""
+import io
+
+import pytest
+
+from models import db, MonthlyMark, MonthlyRanking
+from conftest import login, make_teacher, make_batch, make_students, make_monthly_exam
+
+
+@pytest.fixture
+def seeded(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 3)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    db.session.add(MonthlyRanking(monthly_exam_id=monthly_exam.id, user_id=students[0].id,
+                                  position=0, roll_number=7))
+    db.session.commit()
+    login(client, teacher)
+    return monthly_exam, monthly_exam.individual_exams[0], students
+
+
+def _upload(client, monthly_exam, paper, content, filename):
+    return client.post(
+        f'/api/monthly-exams/{monthly_exam.id}/individual-exams/{paper.id}/marks/import',
+        data={'file': (io.BytesIO(content), filename)},
+        content_type='multipart/form-data'
+    )
+
+
+def _marks(paper):
+    return {m.user_id: m.marks_obtained for m in MonthlyMark.query.filter_by(individual_exam_id=paper.id)}
+
+
+def test_csv_import_matches_roll_and_phone(client, seeded):
+    monthly_exam, paper, students = seeded
+    sheet = (
+        'Roll,Phone,Marks\n'
+        '7,,42\n'
+        f',{students[1].phoneNumber},35\n'
+        ',01999999999,20\n'
+        f',{students[2].phoneNumber},80\n'
+    ).encode()
+
+    response = _upload(client, monthly_exam, paper, sheet, 'marks.csv')
+
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['imported_count'] == 2
+    assert data['errors'] == [
+        {'row': 4, 'error': 'no student with phone 01999999999'},
+        {'row': 5, 'error': 'marks (80.0) cannot exceed total marks (50)'},
+    ]
+    assert _marks(paper) == {students[0].id: 42, students[1].id: 35}
+
+
+def test_xlsx_import(client, seeded):
+    openpyxl = pytest.importorskip('openpyxl')
+    monthly_exam, paper, students = seeded
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['Phone', 'Marks'])
+    sheet.append([int(students[2].phoneNumber), 25])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+
+    response = _upload(client, monthly_exam, paper, buffer.getvalue(), 'marks.xlsx')
+
+    assert response.status_code == 200
+    assert _marks(paper) == {students[2].id: 25}
+
+
+def test_import_rejects_sheet_without_marks_column(client, seeded):
+    monthly_exam, paper, _ = seeded
+
+    response = _upload(client, monthly_exam, paper, b'Roll,Score\n7,10\n', 'marks.csv')
+
+    assert response.status_code == 400
+    assert 'marks' in response.get_json()['error']
@@ -0,0 +1,83 @@
+"""
+Monthly marks bulk upsert tests
+Marks submission validates, inserts and updates in a fixed number of queries
+"""
+from models import db, MonthlyMark
+from services.marks_store import build_mark_row, upsert_monthly_marks
+from conftest import (login, make_teacher, make_batch, make_students, make_monthly_exam,
+                      add_mark, QueryCounter)
+
+
+def _submit(client, monthly_exam, paper, entries):
+    return client.post(
+        f'/api/monthly-exams/{monthly_exam.id}/individual-exams/{paper.id}/marks',
+        json={'students': entries}
+    )
+
+
+def test_upsert_inserts_and_updates(app):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 2)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    paper = monthly_exam.individual_exams[0]
+    add_mark(monthly_exam, paper, students[0], 5)
+    db.session.commit()
+
+    upsert_monthly_marks([
+        build_mark_row(monthly_exam.id, paper, students[0].id, 45),
+        build_mark_row(monthly_exam.id, paper, students[1].id, 20),
+    ])
+    db.session.commit()
+
+    marks = {m.user_id: m for m in MonthlyMark.query.filter_by(individual_exam_id=paper.id)}
+    assert len(marks) == 2
+    assert marks[students[0].id].marks_obtained == 45
+    assert marks[students[0].id].grade == 'A+'
+    assert marks[students[1].id].marks_obtained == 20
+
+
+def test_submission_reports_row_errors(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 2)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    paper = monthly_exam.individual_exams[0]
+    login(client, teacher)
+
+    response = _submit(client, monthly_exam, paper, [
+        {'user_id': students[0].id, 'marks_obtained': 30},
+        {'user_id': students[1].id, 'marks_obtained': 99},
+        {'user_id': 9999, 'marks_obtained': 10},
+    ])
+
+    data = response.get_json()['data']
+    assert response.status_code == 200
+    assert data['saved_count'] == 1
+    assert data['validation_errors'] == [
+        'Student entry 2: marks (99.0) cannot exceed total marks (50)',
+        'Student entry 3: student not found (ID: 9999)',
+    ]
+
+
+def test_submission_query_count_does_not_grow_with_rows(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 120)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    paper = monthly_exam.individual_exams[0]
+    for student in students[::2]:
+        add_mark(monthly_exam, paper, student, 1)
+    db.session.commit()
+    login(client, teacher)
+
+    def count_queries(rows):
+        entries = [{'user_id': s.id, 'marks_obtained': 40} for s in rows]
+        db.session.expire_all()
+        with QueryCounter(db.engine) as counter:
+            response = _submit(client, monthly_exam, paper, entries)
+        assert response.status_code == 200
+        return counter.count
+
+    assert count_queries(students[:10]) == count_queries(students)
+    assert MonthlyMark.query.filter_by(individual_exam_id=paper.id, marks_obtained=40).count() == 120
@@ -0,0 +1,120 @@
+"""
+Month-end close tests
+Every active batch is closed in one job; completed steps are skipped on re-runs
+"""
+from datetime import date
+
+import pytest
+
+import routes.sms as sms_routes
+import services.month_end as month_end
+from models import db, Fee, FeeStatus, MonthEndStep, MonthlyExam, MonthlyRanking, SmsCreditEntry, SmsOutbox
+from services.sms_credits import get_sms_balance
+from services.sms_outbox import drain_outbox
+from conftest import login, make_teacher, make_batch, make_students, make_monthly_exam, add_mark
+
+
+@pytest.fixture
+def seeded(app, client):
+    teacher = make_teacher()
+    batches, exams = [], []
+    for idx, name in enumerate(('HSC Physics', 'HSC Chemistry')):
+        batch = make_batch(name)
+        students = make_students(batch, 2, start=idx * 10)
+        monthly_exam = make_monthly_exam(batch, teacher)
+        for student in students:
+            for paper in monthly_exam.individual_exams:
+                add_mark(monthly_exam, paper, student, 30)
+            db.session.add(Fee(user_id=student.id, batch_id=batch.id, amount=500,
+                               due_date=date(2025, 3, 10), status=FeeStatus.PENDING))
+        batches.append(batch)
+        exams.append(monthly_exam)
+    db.session.commit()
+    login(client, teacher)
+    return batches, exams, teacher
+
+
+def _queued(batch):
+    """Result SMS queued for a batch's students"""
+    student_ids = [student.id for student in batch.students]
+    return SmsOutbox.query.filter(SmsOutbox.category == 'result', SmsOutbox.user_id.in_(student_ids)).all()
+
+
+def _close(client):
+    response = client.post('/api/monthly-exams/month-end-close', json={'year': 2025, 'month': 3})
+    assert response.status_code == 202
+    job = client.get(response.get_json()['data']['status_url']).get_json()['data']
+    assert job['status'] == 'completed'
+    return job['result']
+
+
+def test_closes_every_batch(client, seeded):
+    batches, exams, teacher = seeded
+
+    result = _close(client)
+
+    assert result['failed_batches'] == []
+    assert [outcome['batch_id'] for outcome in result['batches']] == [b.id for b in batches]
+    for outcome in result['batches']:
+        assert [s['status'] for s in outcome['steps']] == ['completed'] * 4
+        assert all(s['duration_ms'] >= 0 for s in outcome['steps'])
+        assert outcome['steps'][2]['result'] == {'queued': 2}
+        assert outcome['steps'][3]['result'] == {'students_with_dues': 2, 'unpaid_fees': 2, 'amount_due': 1000.0}
+    for batch in batches:
+        items = _queued(batch)
+        assert len(items) == 2
+        assert {item.sent_by for item in items} == {teacher.id}
+        assert len({item.reservation_id for item in items}) == 1
+    assert len(SmsCreditEntry.query.filter_by(entry_type='reservation').all()) == 2
+    for exam in exams:
+        assert db.session.get(MonthlyExam, exam.id).show_results is True
+        assert MonthlyRanking.query.filter_by(monthly_exam_id=exam.id, is_final=True).count() == 2
+
+
+def test_rerun_skips_completed_and_retries_failed_steps(client, seeded, monkeypatch):
+    batches, _, _ = seeded
+    original = month_end.STEP_RUNNERS[month_end.STEP_PUBLISH_RESULTS]
+
+    def flaky_publish(batch, *args):
+        if batch.id == batches[1].id:
+            raise RuntimeError('database is locked')
+        return original(batch, *args)
+
+    monkeypatch.setitem(month_end.STEP_RUNNERS, month_end.STEP_PUBLISH_RESULTS, flaky_publish)
+    first = _close(client)
+
+    assert first['failed_batches'] == [batches[1].id]
+    failed = MonthEndStep.query.filter_by(batch_id=batches[1].id, step='publish_results').one()
+    assert failed.status == 'failed' and 'locked' in failed.error
+    assert (len(_queued(batches[0])), len(_queued(batches[1]))) == (2, 0)
+
+    monkeypatch.setitem(month_end.STEP_RUNNERS, month_end.STEP_PUBLISH_RESULTS, original)
+    second = _close(client)
+
+    assert second['failed_batches'] == []
+    statuses = {o['batch_id']: [s['status'] for s in o['steps']] for o in second['batches']}
+    assert statuses[batches[0].id] == ['skipped'] * 4
+    assert statuses[batches[1].id] == ['skipped', 'completed', 'completed', 'completed']
+    assert (len(_queued(batches[0])), len(_queued(batches[1]))) == (2, 2)
+
+    steps = client.get('/api/monthly-exams/month-end-close?year=2025&month=3').get_json()['data']['steps']
+    assert len(steps) == 8 and {s['status'] for s in steps} == {'completed'}
+
+
+def test_result_sms_are_debited_once_delivered(client, seeded, monkeypatch):
+    batches, _, _ = seeded
+    batches[0].students[0].phoneNumber = ''
+    db.session.commit()
+    monkeypatch.setattr(sms_routes, 'send_sms_many_via_api',
+                        lambda phones, message: {'success': True, 'cost': len(phones)})
+
+    result = _close(client)
+
+    assert [outcome['steps'][2]['result'] for outcome in result['batches']] == [{'queued': 1}, {'queued': 2}]
+    held = get_sms_balance()['held']
+    assert held > 0
+
+    assert drain_outbox() == {'sent': 3, 'retrying': 0, 'failed': 0}
+    debits = SmsCreditEntry.query.filter_by(entry_type='debit').all()
+    assert -sum(entry.amount for entry in debits) == held
+    assert get_sms_balance()['held'] == 0
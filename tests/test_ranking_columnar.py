@@ -0,0 +1,64 @@
+"""
+Columnar ranking format tests
+?format=columnar sends paper metadata once and per-student arrays aligned to it
+"""
+import pytest
+
+from models import db
+from conftest import login, make_teacher, make_batch, make_students, make_monthly_exam, add_mark
+
+
+@pytest.fixture
+def seeded(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 3)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    papers = list(monthly_exam.individual_exams)
+    for idx, student in enumerate(students):
+        add_mark(monthly_exam, papers[0], student, 10 + idx)
+    db.session.commit()
+    login(client, teacher)
+    return monthly_exam, papers, students
+
+
+def _get(client, exam_id, query=''):
+    response = client.get(f'/api/monthly-exams/{exam_id}/comprehensive-ranking{query}')
+    assert response.status_code == 200
+    return response.get_json()['data']
+
+
+def test_default_shape_is_unchanged(client, seeded):
+    monthly_exam, _, _ = seeded
+
+    data = _get(client, monthly_exam.id)
+
+    assert 'format' not in data
+    assert isinstance(data['rankings'], list)
+    assert 'individual_marks' in data['rankings'][0]
+
+
+@pytest.mark.parametrize('warm', [False, True])
+def test_columnar_rows_match_default_rankings(client, seeded, warm):
+    monthly_exam, papers, students = seeded
+    if warm:
+        _get(client, monthly_exam.id)  # Serve the columnar read from the stored snapshot
+
+    columnar = _get(client, monthly_exam.id, '?format=columnar')
+    default = _get(client, monthly_exam.id)
+
+    assert columnar['format'] == 'columnar'
+    assert columnar['individual_exams'] == default['individual_exams']
+    table = columnar['rankings']
+    columns, mark_fields = table['columns'], table['mark_fields']
+    assert 'individual_marks' not in columns
+    assert len(table['rows']) == len(default['rankings']) == len(students)
+
+    for row, rank in zip(table['rows'], default['rankings']):
+        record = dict(zip(columns, row))
+        for column in columns[:-1]:
+            assert record[column] == rank[column]
+        assert len(record['marks']) == len(papers)
+        for exam, values in zip(columnar['individual_exams'], record['marks']):
+            expected = rank['individual_marks'][str(exam['id'])]
+            assert dict(zip(mark_fields, values)) == {field: expected[field] for field in mark_fields}
@@ -0,0 +1,79 @@
+"""
+Ranking engine tests
+Comprehensive ranking values and constant query count as the batch grows
+"""
+from datetime import date
+
+from models import db
+from services.ranking_engine import build_comprehensive_rankings
+from conftest import (login, make_teacher, make_batch, make_students, make_monthly_exam,
+                      add_mark, add_attendance, QueryCounter)
+
+
+def _seed_batch(student_count):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, student_count)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    for idx, student in enumerate(students):
+        for paper in monthly_exam.individual_exams:
+            add_mark(monthly_exam, paper, student, (idx * 7) % 50)
+        add_attendance(batch, student, date(2025, 3, 3))
+    db.session.commit()
+    return teacher, monthly_exam, students
+
+
+def test_ranking_totals_and_positions(app):
+    teacher, monthly_exam, students = _seed_batch(3)
+
+    individual_exams, rankings = build_comprehensive_rankings(monthly_exam)
+
+    assert len(individual_exams) == 2
+    assert [r['position'] for r in rankings] == [1, 2, 3]
+    top = rankings[0]
+    assert top['user_id'] == students[2].id
+    assert top['total_exam_marks'] == 28
+    assert top['attendance_marks'] == 1
+    # March 2025 has 21 weekdays
+    assert top['max_attendance_marks'] == 21
+    assert top['final_total'] == 29
+    assert top['total_possible'] == 121
+    assert top['position_trend'] == 'new'
+
+
+def test_ranking_query_count_is_constant(app):
+    teacher, monthly_exam, _ = _seed_batch(5)
+
+    def count_queries():
+        db.session.expire_all()
+        # A fresh app context per run, like separate requests
+        with app.app_context(), QueryCounter(db.engine) as counter:
+            _, rankings = build_comprehensive_rankings(monthly_exam)
+        return counter.count, len(rankings)
+
+    small_count, small_total = count_queries()
+
+    batch = monthly_exam.batch
+    more_students = make_students(batch, 40, start=100)
+    for student in more_students:
+        for paper in monthly_exam.individual_exams:
+            add_mark(monthly_exam, paper, student, 30)
+        add_attendance(batch, student, date(2025, 3, 4))
+    db.session.commit()
+
+    large_count, large_total = count_queries()
+
+    assert (small_total, large_total) == (5, 45)
+    assert large_count == small_count
+
+
+def test_comprehensive_ranking_endpoint(client, app):
+    teacher, monthly_exam, students = _seed_batch(3)
+    login(client, teacher)
+
+    response = client.get(f'/api/monthly-exams/{monthly_exam.id}/comprehensive-ranking')
+
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['total_students'] == 3
+    assert data['rankings'][0]['user_id'] == students[2].id
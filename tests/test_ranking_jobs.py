@@ -0,0 +1,82 @@
+"""
+Ranking generation job tests
+generate-ranking enqueues a job, progress is polled and duplicate clicks reuse the running job
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, BackgroundJob, MonthlyRanking
+from conftest import login, make_teacher, make_batch, make_students, make_monthly_exam, add_mark
+
+
+@pytest.fixture
+def seeded(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 3)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    for idx, student in enumerate(students):
+        for paper in monthly_exam.individual_exams:
+            add_mark(monthly_exam, paper, student, 10 + idx)
+    db.session.commit()
+    login(client, teacher)
+    return monthly_exam, students
+
+
+def _generate(client, monthly_exam):
+    response = client.post(f'/api/monthly-exams/{monthly_exam.id}/generate-ranking')
+    assert response.status_code == 202
+    return response.get_json()
+
+
+def test_generate_ranking_runs_as_job(client, seeded):
+    monthly_exam, students = seeded
+
+    data = _generate(client, monthly_exam)['data']
+
+    response = client.get(data['status_url'])
+    assert response.status_code == 200
+    job = response.get_json()['data']
+    assert job['status'] == 'completed'
+    assert job['progress'] == 100
+    assert job['result']['rankings_count'] == 3
+
+    saved = MonthlyRanking.query.filter_by(monthly_exam_id=monthly_exam.id, is_final=True).all()
+    assert {r.user_id: r.position for r in saved}[students[2].id] == 1
+
+
+def test_duplicate_request_reuses_active_job(client, seeded):
+    monthly_exam, _ = seeded
+    key = f'generate_ranking:{monthly_exam.id}'
+    running = BackgroundJob(id='a' * 32, job_type='generate_ranking', job_key=key,
+                            active_key=key, status='running', progress=40)
+    db.session.add(running)
+    db.session.commit()
+
+    body = _generate(client, monthly_exam)
+
+    assert body['message'] == 'Ranking generation already in progress'
+    assert body['data']['job_id'] == running.id
+    assert BackgroundJob.query.count() == 1
+    assert MonthlyRanking.query.filter_by(monthly_exam_id=monthly_exam.id).count() == 0
+
+
+def test_abandoned_job_does_not_block_new_run(client, seeded):
+    monthly_exam, _ = seeded
+    key = f'generate_ranking:{monthly_exam.id}'
+    db.session.add(BackgroundJob(id='b' * 32, job_type='generate_ranking', job_key=key,
+                                 active_key=key, status='running',
+                                 updated_at=datetime.utcnow() - timedelta(hours=1)))
+    db.session.commit()
+
+    data = _generate(client, monthly_exam)['data']
+
+    assert data['job_id'] != 'b' * 32
+    assert data['status'] == 'completed'
+    assert db.session.get(BackgroundJob, 'b' * 32).status == 'failed'
+
+
+def test_unknown_job_returns_404(client, seeded):
+    response = client.get('/api/monthly-exams/jobs/missing')
+    assert response.status_code == 404
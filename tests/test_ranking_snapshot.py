@@ -0,0 +1,100 @@
+"""
+Ranking snapshot tests
+Snapshots are served until a marks, attendance or bonus write marks them stale
+"""
+import pytest
+
+from models import db, RankingSnapshot
+import services.ranking_snapshot as ranking_snapshot
+from conftest import login, make_teacher, make_batch, make_students, make_monthly_exam, add_mark
+
+
+@pytest.fixture
+def seeded(app, client, monkeypatch):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 3)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    for idx, student in enumerate(students):
+        for paper in monthly_exam.individual_exams:
+            add_mark(monthly_exam, paper, student, 10 + idx)
+    db.session.commit()
+    login(client, teacher)
+
+    calls = []
+    original = ranking_snapshot.build_comprehensive_rankings
+
+    def counting_build(exam):
+        calls.append(exam.id)
+        return original(exam)
+
+    monkeypatch.setattr(ranking_snapshot, 'build_comprehensive_rankings', counting_build)
+    return monthly_exam, batch, students, calls
+
+
+def _ranking(client, exam_id):
+    response = client.get(f'/api/monthly-exams/{exam_id}/comprehensive-ranking')
+    assert response.status_code == 200
+    return response.get_json()['data']['rankings']
+
+
+def test_snapshot_is_reused_between_reads(client, seeded):
+    monthly_exam, _, students, calls = seeded
+
+    first = _ranking(client, monthly_exam.id)
+    second = _ranking(client, monthly_exam.id)
+
+    assert first == second
+    assert first[0]['user_id'] == students[2].id
+    assert calls == [monthly_exam.id]
+    assert RankingSnapshot.query.filter_by(monthly_exam_id=monthly_exam.id).one().is_stale is False
+
+
+def test_marks_submission_marks_snapshot_stale(client, seeded):
+    monthly_exam, _, students, calls = seeded
+    _ranking(client, monthly_exam.id)
+    paper = monthly_exam.individual_exams[0]
+
+    response = client.post(
+        f'/api/monthly-exams/{monthly_exam.id}/individual-exams/{paper.id}/marks',
+        json={'students': [{'user_id': students[0].id, 'marks_obtained': 50},
+                           {'user_id': students[1].id, 'marks_obtained': 50}]}
+    )
+    assert response.status_code == 200
+
+    rankings = _ranking(client, monthly_exam.id)
+    assert rankings[0]['user_id'] == students[1].id
+    assert len(calls) == 2
+
+
+def test_attendance_and_bonus_writes_mark_snapshot_stale(client, seeded):
+    monthly_exam, batch, students, calls = seeded
+    _ranking(client, monthly_exam.id)
+
+    response = client.post('/api/attendance/bulk', json={
+        'batchId': batch.id,
+        'date': '2025-03-05',
+        'attendanceData': [{'userId': students[0].id, 'status': 'present'}]
+    })
+    assert response.status_code == 200
+
+    rankings = _ranking(client, monthly_exam.id)
+    assert next(r for r in rankings if r['user_id'] == students[0].id)['attendance_marks'] == 1
+    assert len(calls) == 2
+
+    response = client.post(f'/api/monthly-exams/{monthly_exam.id}/update-bonus',
+                           json={'bonus_data': [{'user_id': students[1].id, 'bonus_marks': 2}]})
+    assert response.status_code == 200
+
+    _ranking(client, monthly_exam.id)
+    assert len(calls) == 3
+
+
+def test_roster_change_refreshes_snapshot(client, seeded):
+    monthly_exam, batch, _, calls = seeded
+    _ranking(client, monthly_exam.id)
+
+    make_students(batch, 1, start=50)
+
+    assert len(_ranking(client, monthly_exam.id)) == 4
+    assert len(calls) == 2
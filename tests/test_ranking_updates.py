@@ -0,0 +1,104 @@
+"""
+Incremental ranking update tests
+A single mark correction moves one student and must match a full recompute
+"""
+import pytest
+
+from models import db, MonthlyRanking, RankingSnapshot
+import services.ranking_snapshot as ranking_snapshot
+from services.ranking_engine import build_comprehensive_rankings
+from services.ranking_jobs import save_final_rankings
+from services.ranking_updates import move_ranking_row, update_student_ranking
+from conftest import login, make_teacher, make_batch, make_students, make_monthly_exam, add_mark
+
+
+@pytest.fixture
+def seeded(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 6)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    for idx, student in enumerate(students):
+        for paper in monthly_exam.individual_exams:
+            add_mark(monthly_exam, paper, student, 10 + idx * 5)
+    db.session.commit()
+    login(client, teacher)
+    return monthly_exam, students
+
+
+def _without_full_recompute(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ranking_snapshot, 'build_comprehensive_rankings',
+                        lambda exam: calls.append(exam.id) or build_comprehensive_rankings(exam))
+    return calls
+
+
+def _correct_mark(client, monthly_exam, student, marks_obtained):
+    paper = monthly_exam.individual_exams[0]
+    response = client.post(f'/api/monthly-exams/{monthly_exam.id}/individual-exams/{paper.id}/marks',
+                           json={'students': [{'user_id': student.id, 'marks_obtained': marks_obtained}]})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('student_idx, marks_obtained', [(0, 50), (5, 0), (3, 32)])
+def test_single_correction_matches_full_recompute(client, seeded, monkeypatch, student_idx, marks_obtained):
+    monthly_exam, students = seeded
+    save_final_rankings(monthly_exam)
+    db.session.commit()
+    ranking_snapshot.get_ranking_snapshot(monthly_exam)  # Saving final rankings marks the snapshot stale
+
+    calls = _without_full_recompute(monkeypatch)
+    _correct_mark(client, monthly_exam, students[student_idx], marks_obtained)
+
+    snapshot = RankingSnapshot.query.filter_by(monthly_exam_id=monthly_exam.id).one()
+    assert snapshot.is_stale is False
+    assert calls == []
+
+    _, expected = build_comprehensive_rankings(monthly_exam)
+    stored = snapshot.payload['rankings']
+    assert [r['user_id'] for r in stored] == [r['user_id'] for r in expected]
+    for row, full in zip(stored, expected):
+        assert {k: v for k, v in row.items() if k != 'individual_marks'} == \
+               {k: v for k, v in full.items() if k != 'individual_marks'}
+
+    final = {r.user_id: r for r in MonthlyRanking.query.filter_by(monthly_exam_id=monthly_exam.id).all()}
+    for full in expected:
+        assert final[full['user_id']].position == full['position']
+        assert final[full['user_id']].final_total == full['final_total']
+
+
+def test_single_correction_refreshes_homepage_snapshot(client, seeded):
+    monthly_exam, students = seeded
+    save_final_rankings(monthly_exam)
+    db.session.commit()
+    ranking_snapshot.get_ranking_snapshot(monthly_exam)
+    response = client.post(f'/api/monthly-exams/{monthly_exam.id}/toggle-homepage', json={'show_on_homepage': True})
+    assert response.status_code == 200
+
+    _correct_mark(client, monthly_exam, students[4], 50)
+
+    data = client.get('/api/monthly-exams/homepage-top-performers').get_json()['data']
+    assert data['featured_results'][0]['top_students'][0]['student_name'] == students[4].full_name
+
+
+def test_stale_snapshot_falls_back_to_full_recompute(app, seeded):
+    monthly_exam, students = seeded
+
+    assert update_student_ranking(monthly_exam, students[0].id) is None
+    db.session.commit()
+
+    assert RankingSnapshot.query.filter_by(monthly_exam_id=monthly_exam.id).first() is None
+
+
+def test_move_ranking_row_renumbers_only_the_rows_in_between():
+    rankings = [{'user_id': uid, 'student_name': str(uid), 'percentage': pct, 'final_total': pct,
+                 'position': pos, 'previous_position': None}
+                for pos, (uid, pct) in enumerate([(1, 90), (2, 80), (3, 70), (4, 60), (5, 50)], start=1)]
+    untouched = rankings[0]
+
+    moved = move_ranking_row(rankings, {**rankings[3], 'percentage': 85, 'final_total': 85})
+
+    assert [r['user_id'] for r in rankings] == [1, 4, 2, 3, 5]
+    assert [r['user_id'] for r in moved] == [4, 2, 3]
+    assert [r['position'] for r in rankings] == [1, 2, 3, 4, 5]
+    assert 'current_position' not in untouched
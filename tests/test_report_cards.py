@@ -0,0 +1,68 @@
+"""
+Report card tests
+Every ranked student's card is rendered and streamed back in one ZIP
+"""
+import io
+import zipfile
+
+import services.report_cards as report_cards
+from models import db, MonthlyRanking
+from conftest import login, make_teacher, make_batch, make_students, make_monthly_exam, add_mark
+
+
+def _seed(count):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, count)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    physics = monthly_exam.individual_exams[0]
+    for position, student in enumerate(students, start=1):
+        add_mark(monthly_exam, physics, student, 50 - position)
+        db.session.add(MonthlyRanking(monthly_exam_id=monthly_exam.id, user_id=student.id, position=position,
+                                      roll_number=position, attendance_marks=4, percentage=90 - position,
+                                      grade='A', is_final=True))
+    db.session.commit()
+    return teacher, monthly_exam, students
+
+
+def _download(client, monthly_exam):
+    response = client.get(f'/api/monthly-exams/{monthly_exam.id}/report-cards')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    return zipfile.ZipFile(io.BytesIO(response.get_data()))
+
+
+def test_zip_contains_one_card_per_student(app, client):
+    teacher, monthly_exam, students = _seed(3)
+    login(client, teacher)
+
+    archive = _download(client, monthly_exam)
+
+    names = archive.namelist()
+    assert names == ['001_1_Student000_Test.html', '002_2_Student001_Test.html', '003_3_Student002_Test.html']
+    card = archive.read(names[0]).decode('utf-8')
+    assert students[0].full_name in card
+    assert '1 / 3' in card          # Position
+    assert 'Absent' in card         # Chemistry has no mark
+    assert '49' in card             # Physics marks
+
+
+def test_large_batch_renders_in_process_pool(app, client, monkeypatch):
+    monkeypatch.setattr(report_cards, 'MIN_CARDS_FOR_POOL', 2)
+    app.config['REPORT_CARD_WORKERS'] = 2
+    teacher, monthly_exam, students = _seed(6)
+    login(client, teacher)
+
+    archive = _download(client, monthly_exam)
+
+    assert len(archive.namelist()) == 6
+    assert archive.testzip() is None
+
+
+def test_requires_final_rankings(app, client):
+    teacher = make_teacher()
+    monthly_exam = make_monthly_exam(make_batch(), teacher)
+    login(client, teacher)
+
+    response = client.get(f'/api/monthly-exams/{monthly_exam.id}/report-cards')
+    assert response.status_code == 400
@@ -0,0 +1,91 @@
+"""
+Roll number tests
+Inheritance and assignment are resolved for the whole batch in a fixed number of queries
+"""
+from models import db, MonthlyRanking
+from services.roll_numbers import get_inherited_roll_numbers
+from conftest import (login, make_teacher, make_batch, make_students, make_monthly_exam,
+                      add_mark, QueryCounter)
+
+
+def _rolls(monthly_exam):
+    return {r.user_id: r.roll_number for r in MonthlyRanking.query.filter_by(monthly_exam_id=monthly_exam.id)}
+
+
+def test_inherits_previous_month_final_rolls(app):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 3)
+    february = make_monthly_exam(batch, teacher, month=2)
+    march = make_monthly_exam(batch, teacher, month=3)
+    db.session.add_all([
+        MonthlyRanking(monthly_exam_id=february.id, user_id=students[0].id, position=1, roll_number=12, is_final=True),
+        MonthlyRanking(monthly_exam_id=february.id, user_id=students[1].id, position=2, roll_number=5, is_final=False),
+    ])
+    db.session.commit()
+
+    assert get_inherited_roll_numbers(march) == {students[0].id: 12}
+
+
+def test_assign_roll_numbers_skips_outsiders(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    other = make_batch('Other')
+    students = make_students(batch, 2)
+    outsider = make_students(other, 1, start=50)[0]
+    monthly_exam = make_monthly_exam(batch, teacher)
+    db.session.add(MonthlyRanking(monthly_exam_id=monthly_exam.id, user_id=students[0].id, position=3, roll_number=1))
+    db.session.commit()
+    login(client, teacher)
+
+    response = client.post(f'/api/monthly-exams/{monthly_exam.id}/assign-roll-numbers', json={'roll_assignments': [
+        {'user_id': students[0].id, 'roll_number': 7},
+        {'user_id': students[1].id, 'roll_number': 8},
+        {'user_id': outsider.id, 'roll_number': 9},
+        {'user_id': students[1].id},
+    ]})
+
+    assert response.status_code == 200
+    assert response.get_json()['data']['updated_count'] == 2
+    assert _rolls(monthly_exam) == {students[0].id: 7, students[1].id: 8}
+
+
+def test_assign_query_count_does_not_grow(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 200)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    for student in students[::2]:
+        db.session.add(MonthlyRanking(monthly_exam_id=monthly_exam.id, user_id=student.id, position=0))
+    db.session.commit()
+    login(client, teacher)
+
+    def count_queries(rows, offset):
+        assignments = [{'user_id': s.id, 'roll_number': idx + offset} for idx, s in enumerate(rows)]
+        with QueryCounter(db.engine) as counter:
+            response = client.post(f'/api/monthly-exams/{monthly_exam.id}/assign-roll-numbers',
+                                   json={'roll_assignments': assignments})
+        assert response.status_code == 200
+        return counter.count
+
+    assert count_queries(students[:10], 1) == count_queries(students, 101)
+    rolls = _rolls(monthly_exam)
+    assert len(rolls) == 200
+    assert rolls[students[0].id] == 101 and rolls[students[199].id] == 300
+
+
+def test_auto_assign_uses_ranking_positions(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 3)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    for idx, student in enumerate(students):
+        add_mark(monthly_exam, monthly_exam.individual_exams[0], student, 10 + idx)
+    db.session.add(MonthlyRanking(monthly_exam_id=monthly_exam.id, user_id=students[0].id, position=0))
+    db.session.commit()
+    login(client, teacher)
+
+    response = client.post(f'/api/monthly-exams/{monthly_exam.id}/auto-assign-roll-numbers')
+
+    assert response.status_code == 200
+    assert _rolls(monthly_exam) == {students[2].id: 1, students[1].id: 2, students[0].id: 3}
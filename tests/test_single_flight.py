@@ -0,0 +1,145 @@
+"""
+Single-flight tests
+Concurrent requests for one key share a computation; waits are bounded
+"""
+import json
+import os
+import threading
+import time
+
+import fcntl
+
+import services.exam_analytics as exam_analytics
+from services.single_flight import FlightLock, coalesce, shared_result, get_single_flight_dir
+from models import db, RankingSnapshot
+from services.ranking_snapshot import get_ranking_snapshot, mark_rankings_stale
+from routes.monthly_exams import MERIT_LIST_MAX_TOP
+from conftest import login, make_teacher, make_batch, make_students, make_monthly_exam, add_mark
+
+
+def test_concurrent_callers_share_one_computation(app):
+    store = {}
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        store['value'] = 'fresh'
+        return 'fresh'
+
+    results = []
+
+    def worker():
+        with app.app_context():
+            results.append(coalesce('shared', lambda: (store.get('value'), 'value' in store), compute))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['fresh'] * 5
+    assert len(calls) == 1
+
+
+def test_bounded_wait_falls_back_to_stale_copy(app):
+    busy = FlightLock('busy')
+    assert busy.acquire()
+    try:
+        started = time.monotonic()
+        value = coalesce('busy', lambda: ('stale', False), lambda: 'recomputed', wait_seconds=0.2)
+    finally:
+        busy.release()
+
+    assert value == 'stale'
+    assert time.monotonic() - started < 1
+
+
+def test_other_worker_holding_the_lock_file_is_respected(app):
+    # flock conflicts between open file descriptions, as between gunicorn workers
+    fd = os.open(os.path.join(get_single_flight_dir(), 'worker_key.lock'), os.O_RDWR | os.O_CREAT)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        value = coalesce('worker_key', lambda: ('stale', False), lambda: 'recomputed', wait_seconds=0.1)
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    assert value == 'stale'
+    assert coalesce('worker_key', lambda: ('stale', False), lambda: 'recomputed') == 'recomputed'
+
+
+def test_shared_result_reused_until_fingerprint_changes(app):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'count': len(calls)}
+
+    assert shared_result('report', 'v1', compute) == {'count': 1}
+    assert shared_result('report', 'v1', compute) == {'count': 1}
+    assert shared_result('report', 'v2', compute) == {'count': 2}
+
+
+def test_analytics_computed_once_across_workers(app, monkeypatch):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 2)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    add_mark(monthly_exam, monthly_exam.individual_exams[0], students[0], 20)
+    db.session.commit()
+
+    calls = []
+    original = exam_analytics.compute_exam_analytics
+    monkeypatch.setattr(exam_analytics, 'compute_exam_analytics', lambda exam: calls.append(1) or original(exam))
+
+    first = exam_analytics.cached_exam_analytics(monthly_exam)
+    exam_analytics._cache.clear()  # Another worker has an empty in-process cache
+    second = exam_analytics.cached_exam_analytics(monthly_exam)
+
+    assert first['overall_statistics'] == second['overall_statistics']
+    assert len(calls) == 1
+
+
+def test_ranking_reader_gets_stale_snapshot_while_another_recomputes(app):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 2)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    add_mark(monthly_exam, monthly_exam.individual_exams[0], students[0], 20)
+    db.session.commit()
+    fresh = get_ranking_snapshot(monthly_exam)
+    mark_rankings_stale([monthly_exam.id])
+    db.session.commit()
+
+    app.config['SINGLE_FLIGHT_WAIT_SECONDS'] = 0.1
+    busy = FlightLock(f'ranking_snapshot_{monthly_exam.id}')
+    assert busy.acquire()
+    try:
+        served = get_ranking_snapshot(monthly_exam)
+    finally:
+        busy.release()
+
+    assert served == json.loads(json.dumps(fresh))  # As stored in the JSON column
+    assert RankingSnapshot.query.filter_by(monthly_exam_id=monthly_exam.id).one().is_stale is True
+
+
+def test_merit_list_top_is_clamped(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 3)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    for idx, student in enumerate(students):
+        add_mark(monthly_exam, monthly_exam.individual_exams[0], student, 20 + idx)
+    db.session.commit()
+    login(client, teacher)
+
+    for top in (500, 10 ** 9, MERIT_LIST_MAX_TOP + 1):
+        response = client.get(f'/api/monthly-exams/{monthly_exam.id}/merit-list?top={top}')
+        assert len(response.get_json()['data']['merit_list']) == 3
+    response = client.get(f'/api/monthly-exams/{monthly_exam.id}/merit-list?top=-2')
+    assert len(response.get_json()['data']['merit_list']) == 1
+
+    stored = sorted(name for name in os.listdir(get_single_flight_dir()) if name.endswith('.json'))
+    assert stored == [f'merit_list_{monthly_exam.id}_1.json', f'merit_list_{monthly_exam.id}_{MERIT_LIST_MAX_TOP}.json']
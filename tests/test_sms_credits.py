@@ -0,0 +1,154 @@
+"""
+SMS credit ledger tests
+Campaigns reserve their credits once and are settled once; the materialized
+balance always matches the ledger
+"""
+import pytest
+
+import routes.sms as sms_routes
+import services.sms_outbox as sms_outbox
+from models import db, Settings, SmsCreditEntry, UserRole
+from services.sms_credits import (add_credits, get_sms_balance, rebuild_balance, reserve_credits,
+                                  settle_reservation)
+from conftest import login, make_teacher, make_batch, make_students
+
+
+@pytest.fixture
+def gateway(app, monkeypatch):
+    calls = []
+
+    def send_many(phones, message):
+        calls.append(len(phones))
+        return {'success': True, 'cost': 1}
+
+    monkeypatch.setattr(sms_routes, 'send_sms_many_via_api', send_many)
+    return calls
+
+
+def _entries(entry_type):
+    return SmsCreditEntry.query.filter_by(entry_type=entry_type).all()
+
+
+def test_ledger_opens_with_settings_balance(app):
+    db.session.add(Settings(key='sms_balance', value={'balance': 250}, category='sms'))
+    db.session.commit()
+
+    assert get_sms_balance() == {'balance': 250, 'held': 0, 'available': 250}
+    get_sms_balance()
+    db.session.commit()
+    assert [entry.amount for entry in _entries('opening')] == [250]
+
+
+def test_reservation_is_settled_once(app):
+    add_credits(100)
+    reservation = reserve_credits(10, reference='test')
+    db.session.commit()
+    assert get_sms_balance() == {'balance': 100, 'held': 10, 'available': 90}
+
+    assert settle_reservation(reservation.id, 7) is not None
+    assert settle_reservation(reservation.id, 7) is None
+    db.session.commit()
+
+    assert get_sms_balance() == {'balance': 93, 'held': 0, 'available': 93}
+    assert [entry.amount for entry in _entries('debit')] == [-7]
+    assert rebuild_balance() == get_sms_balance()
+
+
+def test_campaign_is_debited_once(client, app, gateway, monkeypatch):
+    monkeypatch.setattr(sms_outbox, 'CLAIM_BATCH_SIZE', 2)
+    add_credits(100)
+    admin = make_teacher()
+    admin.role = UserRole.SUPER_USER
+    batch = make_batch()
+    make_students(batch, 5)
+    login(client, admin)
+
+    response = client.post('/api/sms/send-bulk', json={
+        'batch_id': batch.id, 'use_custom_message': True, 'custom_message': 'Exam on Sunday'
+    })
+
+    assert response.get_json()['data']['queued'] == 5
+    assert get_sms_balance() == {'balance': 100, 'held': 5, 'available': 95}
+    assert [entry.amount for entry in _entries('reservation')] == [-5]
+
+    # Drained over three claim batches, settled after the last one
+    assert sms_outbox.drain_outbox() == {'sent': 5, 'retrying': 0, 'failed': 0}
+    assert gateway == [2, 2, 1]
+    assert [entry.amount for entry in _entries('debit')] == [-5]
+    assert _entries('reservation')[0].status == 'settled'
+    assert get_sms_balance() == {'balance': 95, 'held': 0, 'available': 95}
+    assert rebuild_balance() == get_sms_balance()
+
+
+def test_super_user_adds_credits(client, app):
+    admin = make_teacher()
+    admin.role = UserRole.SUPER_USER
+    db.session.commit()
+    login(client, admin)
+
+    response = client.post('/api/sms/balance/add', json={'amount': 500})
+
+    data = response.get_json()['data']
+    assert (data['previous_balance'], data['added_amount'], data['new_balance']) == (0, 500, 500)
+    assert [(entry.amount, entry.created_by) for entry in _entries('credit')] == [(500, admin.id)]
+    assert client.get('/api/sms/balance').get_json()['data']['balance'] == 500
+
+
+def _mark_absent(client, batch, students):
+    return client.post('/api/attendance/bulk-absent-sms', json={
+        'batchId': batch.id, 'date': '2025-03-03',
+        'attendanceData': [{'userId': student.id, 'status': 'absent'} for student in students]
+    })
+
+
+def test_absent_sms_releases_hold_when_sending_breaks(client, app, monkeypatch):
+    add_credits(100)
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 3)
+    login(client, teacher)
+    replies = iter([{'success': True}, None])
+    monkeypatch.setattr(sms_routes, 'send_sms_via_api', lambda phone, message: next(replies))
+
+    response = _mark_absent(client, batch, students)
+
+    assert response.status_code == 500
+    assert _entries('reservation')[0].status == 'settled'
+    assert [entry.amount for entry in _entries('debit')] == [-1]
+    assert get_sms_balance() == {'balance': 99, 'held': 0, 'available': 99}
+
+
+def test_absent_sms_without_numbers_reserves_nothing(client, app):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 2)
+    for student in students:
+        student.phoneNumber = ''
+    db.session.commit()
+    login(client, teacher)
+
+    response = _mark_absent(client, batch, students)
+
+    assert response.get_json()['data']['sms_sent'] == 0
+    assert _entries('reservation') == []
+
+
+def test_noauth_bulk_releases_hold_when_sending_breaks(client, app, monkeypatch):
+    add_credits(100)
+    teacher = make_teacher()
+    teacher.first_name = 'Sample'
+    batch = make_batch()
+    make_students(batch, 2)
+
+    def broken_send(calls, send_many=None):
+        raise RuntimeError('gateway pool closed')
+
+    monkeypatch.setattr(sms_routes, 'send_grouped', broken_send)
+
+    response = client.post('/api/sms/send-bulk-noauth', json={
+        'batch_id': batch.id, 'use_custom_message': True, 'custom_message': 'Exam on Sunday'
+    })
+
+    assert response.status_code == 500
+    assert _entries('reservation')[0].status == 'settled'
+    assert get_sms_balance() == {'balance': 100, 'held': 0, 'available': 100}
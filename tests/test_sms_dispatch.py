@@ -0,0 +1,94 @@
+"""
+SMS dispatch tests
+Bulk sends fan out over a bounded pool, in order, under a token-bucket rate limit,
+with identical messages merged into multi-number requests
+"""
+import threading
+import time
+
+import routes.sms as sms_routes
+from models import db, SmsLog, SmsStatus, UserRole
+from services.sms_dispatch import TokenBucket, dispatch, send_grouped
+from conftest import login, make_teacher, make_batch, make_students
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=100, capacity=5)
+
+    started = time.monotonic()
+    for _ in range(15):
+        bucket.acquire()
+
+    # 5 from the burst, then 10 more at 100 per second
+    assert time.monotonic() - started >= 0.09
+
+
+def test_dispatch_runs_concurrently_in_order(app):
+    app.config.update(SMS_GATEWAY_RATE_PER_SECOND=0, SMS_DISPATCH_WORKERS=4)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def send(phone, message):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        if phone == 'bad':
+            raise ValueError('boom')
+        return {'success': True, 'phone': phone}
+
+    started = time.monotonic()
+    results = dispatch([(f'01{i}', 'Hi') for i in range(8)] + [('bad', 'Hi')], send=send)
+
+    assert time.monotonic() - started < 0.3
+    assert peak[0] == 4
+    assert [r['phone'] for r in results[:8]] == [f'01{i}' for i in range(8)]
+    assert results[8] == {'success': False, 'error': 'boom'}
+
+
+def test_identical_messages_share_requests(app):
+    app.config.update(SMS_GATEWAY_RATE_PER_SECOND=0)
+    requests = []
+
+    def send_many(phones, message):
+        requests.append((len(phones), message))
+        return {'success': True, 'cost': 1}
+
+    calls = [(f'0181{i:07d}', 'Holiday tomorrow') for i in range(250)] + [('01900000000', 'Fee due')]
+    results = send_grouped(calls, send_many=send_many, chunk_size=100)
+
+    assert sorted(requests) == [(1, 'Fee due'), (50, 'Holiday tomorrow'),
+                                (100, 'Holiday tomorrow'), (100, 'Holiday tomorrow')]
+    assert len(results) == 251 and all(r['success'] for r in results)
+
+
+def test_batch_sms_route_keeps_response_shape(client, app, monkeypatch):
+    app.config.update(SMS_GATEWAY_RATE_PER_SECOND=0)
+    admin = make_teacher()
+    admin.role = UserRole.SUPER_USER
+    batch = make_batch()
+    students = make_students(batch, 4)
+    db.session.commit()
+    invalid = students[1].phoneNumber
+    requests = []
+
+    def send_many(phones, message):
+        requests.append(len(phones))
+        if invalid in phones:
+            return {'success': False, 'error': 'Invalid Number', 'response_code': 1001}
+        return {'success': True, 'cost': 1}
+
+    monkeypatch.setattr(sms_routes, 'send_sms_many_via_api', send_many)
+    login(client, admin)
+
+    response = client.post('/api/sms/send-batch', json={'message': 'Class cancelled', 'batch_ids': [batch.id]})
+
+    data = response.get_json()['data']
+    assert (data['total_recipients'], data['sent_count'], data['failed_count']) == (4, 3, 1)
+    # The rejected group is retried number by number
+    assert requests == [4, 1, 1, 1, 1]
+    logs = {log.phone_number: log for log in SmsLog.query.all()}
+    assert logs[invalid].status == SmsStatus.FAILED
+    assert {log.user_id for log in logs.values()} == {s.id for s in students}
@@ -0,0 +1,94 @@
+"""
+SMS gateway client tests
+Messages reuse one keep-alive connection; unprocessed requests are retried
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from services import sms_gateway
+
+
+class FakeGateway(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep connections open between requests
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.client_address, parse_qs(urlparse(self.path).query)))
+        status, body = server.responses.pop(0) if server.responses else (200, {'response_code': 202,
+                                                                               'success_message': 'SMS Submitted'})
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def gateway(app):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGateway)
+    server.requests = []
+    server.responses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    app.config.update(SMS_API_URL=f'http://127.0.0.1:{server.server_port}/api/smsapi',
+                      SMS_API_KEY='test-key', SMS_SENDER_ID='8800000000000',
+                      SMS_GATEWAY_BACKOFF_SECONDS=0)
+    sms_gateway.reset_gateway_session()
+    yield server
+    sms_gateway.reset_gateway_session()
+    server.shutdown()
+    server.server_close()
+
+
+def test_messages_reuse_one_connection(gateway):
+    results = [sms_gateway.send_sms(f'0181111111{i}', 'Hello') for i in range(3)]
+
+    assert all(result['success'] for result in results)
+    assert all(result['latency_ms'] >= 0 for result in results)
+    assert len({client for client, _ in gateway.requests}) == 1
+    first = gateway.requests[0][1]
+    assert first['number'] == ['8801811111110']
+    assert (first['api_key'], first['senderid']) == (['test-key'], ['8800000000000'])
+
+
+def test_unprocessed_request_is_retried(gateway):
+    gateway.responses.append((503, {'error_message': 'busy'}))
+
+    result = sms_gateway.send_sms('01811111111', 'Hello')
+
+    assert result['success'] is True
+    assert len(gateway.requests) == 2
+
+
+def test_rejected_message_is_not_retried(gateway):
+    gateway.responses.append((200, {'response_code': 1007, 'error_message': 'Balance Insufficient'}))
+
+    result = sms_gateway.send_sms('01811111111', 'Hello')
+
+    assert (result['success'], result['error'], result['response_code']) == (False, 'Balance Insufficient', 1007)
+    assert len(gateway.requests) == 1
+
+
+def test_connection_error_is_reported(app):
+    app.config.update(SMS_API_URL='http://127.0.0.1:9/api/smsapi', SMS_GATEWAY_RETRIES=0)
+    sms_gateway.reset_gateway_session()
+
+    result = sms_gateway.send_sms('01811111111', 'Hello')
+
+    sms_gateway.reset_gateway_session()
+    assert (result['success'], result['error']) == (False, 'SMS API connection error')
+
+
+def test_one_request_for_many_numbers(gateway):
+    result = sms_gateway.send_sms_to_many(['01811111111', '8801822222222'], 'Holiday tomorrow')
+
+    assert result['success'] is True
+    assert [params['number'] for _, params in gateway.requests] == [['8801811111111,8801822222222']]
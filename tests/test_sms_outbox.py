@@ -0,0 +1,172 @@
+"""
+SMS outbox tests
+Routes only queue messages; the worker sends them, logs them and retries failures
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import routes.sms as sms_routes
+from models import db, Settings, SmsLog, SmsOutbox, SmsStatus, User, UserRole
+from services.sms_credits import get_sms_balance
+from services.sms_outbox import claim_due_messages, drain_outbox, enqueue_sms
+from conftest import login, make_teacher, make_batch, make_students, make_monthly_exam
+
+
+@pytest.fixture
+def gateway(app, monkeypatch):
+    """Records numbers sent to; request responses are popped from `results`, defaulting to success"""
+    calls = []
+    results = []
+
+    def send_many(phones, message):
+        calls.extend(phones)
+        return results.pop(0) if results else {'success': True, 'message_id': 'ok', 'cost': 1}
+
+    monkeypatch.setattr(sms_routes, 'send_sms_many_via_api', send_many)
+    db.session.add(Settings(key='sms_balance', value={'balance': 100}, category='sms'))
+    db.session.commit()
+    return calls, results
+
+
+def _balance():
+    return get_sms_balance()['balance']
+
+
+def test_bulk_sms_is_queued_then_delivered(client, gateway):
+    calls, _ = gateway
+    admin = make_teacher()
+    admin.role = UserRole.SUPER_USER
+    batch = make_batch()
+    students = make_students(batch, 3)
+    login(client, admin)
+
+    response = client.post('/api/sms/send-bulk', json={
+        'batch_id': batch.id, 'use_custom_message': True, 'custom_message': 'Hello {student_name}'
+    })
+
+    assert response.status_code == 200
+    assert response.get_json()['data']['queued'] == 3
+    assert calls == []
+    assert SmsOutbox.query.filter_by(status='queued').count() == 3
+
+    assert drain_outbox() == {'sent': 3, 'retrying': 0, 'failed': 0}
+    assert sorted(calls) == sorted(s.phoneNumber for s in students)
+    logs = SmsLog.query.order_by(SmsLog.user_id).all()
+    assert [log.status for log in logs] == [SmsStatus.SENT] * 3
+    assert logs[0].message == 'Hello Student000'
+    assert all(item.sms_log_id for item in SmsOutbox.query.all())
+    assert _balance() == 97
+
+
+def test_failed_delivery_is_retried_with_backoff(app, gateway):
+    calls, results = gateway
+    results.append({'success': False, 'error': 'gateway down'})
+    item = enqueue_sms('01811111111', 'Result published')
+    db.session.commit()
+
+    assert drain_outbox() == {'sent': 0, 'retrying': 1, 'failed': 0}
+    item = db.session.get(SmsOutbox, item.id)
+    assert (item.status, item.attempts, item.last_error) == ('queued', 1, 'gateway down')
+    assert item.next_attempt_at > datetime.utcnow()
+    assert SmsLog.query.count() == 0
+
+    # Not due yet
+    assert drain_outbox() == {'sent': 0, 'retrying': 0, 'failed': 0}
+
+    item.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert drain_outbox() == {'sent': 1, 'retrying': 0, 'failed': 0}
+    item = db.session.get(SmsOutbox, item.id)
+    assert (item.status, item.attempts, item.last_error) == ('sent', 2, None)
+    assert item.sms_log.status == SmsStatus.SENT
+    assert len(calls) == 2
+
+
+def test_message_fails_after_max_attempts(app, gateway):
+    _, results = gateway
+    results.extend([{'success': False, 'error': 'invalid number'}] * 2)
+    item = enqueue_sms('01811111111', 'Result published', max_attempts=2)
+    db.session.commit()
+
+    drain_outbox()
+    db.session.get(SmsOutbox, item.id).next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert drain_outbox() == {'sent': 0, 'retrying': 0, 'failed': 1}
+    item = db.session.get(SmsOutbox, item.id)
+    assert (item.status, item.attempts) == ('failed', 2)
+    assert item.sms_log.status == SmsStatus.FAILED
+    assert _balance() == 100
+
+
+def test_claimed_messages_are_not_claimed_again(app, gateway):
+    for i in range(3):
+        enqueue_sms(f'0181111111{i}', 'Hello')
+    db.session.commit()
+
+    first = claim_due_messages(2)
+    second = claim_due_messages(5)
+
+    assert len(first) == 2 and len(second) == 1
+    assert {item.id for item in first}.isdisjoint(item.id for item in second)
+    assert claim_due_messages(5) == []
+
+
+def test_attendance_sms_reserves_teacher_quota(client, gateway):
+    calls, results = gateway
+    results.append({'success': False, 'error': 'Invalid Number'})
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 2)
+    login(client, teacher)
+
+    response = client.post('/api/attendance/bulk', json={
+        'batchId': batch.id,
+        'date': '2025-03-03',
+        'sendSms': True,
+        'attendanceData': [{'userId': s.id, 'status': 'present'} for s in students]
+    })
+
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert (data['sms_queued'], data['sms_balance']) == (2, 998)
+    assert calls == []
+
+    assert drain_outbox() == {'sent': 1, 'retrying': 1, 'failed': 0}
+    db.session.expire_all()
+    assert db.session.get(User, teacher.id).sms_count == 998
+
+    # The campaign is settled after its last message gives up, refunding its quota
+    results.append({'success': False, 'error': 'Invalid Number'})
+    SmsOutbox.query.filter_by(status='queued').update({
+        'max_attempts': 2, 'next_attempt_at': datetime.utcnow() - timedelta(seconds=1)
+    })
+    db.session.commit()
+    assert drain_outbox() == {'sent': 0, 'retrying': 0, 'failed': 1}
+    db.session.expire_all()
+    assert len(calls) == 3
+    assert db.session.get(User, teacher.id).sms_count == 999
+    assert {item.category for item in SmsOutbox.query.all()} == {'attendance'}
+
+
+def test_exam_marks_sms_is_queued(client, gateway):
+    calls, _ = gateway
+    teacher = make_teacher()
+    batch = make_batch()
+    student = make_students(batch, 1)[0]
+    monthly_exam = make_monthly_exam(batch, teacher)
+    paper = monthly_exam.individual_exams[0]
+    login(client, teacher)
+
+    response = client.post(f'/api/monthly-exams/{monthly_exam.id}/individual-exams/{paper.id}/marks',
+                           json={'students': [{'user_id': student.id, 'marks_obtained': 40}], 'send_sms': True})
+
+    data = response.get_json()['data']
+    assert (data['sms_queued'], data['sms_failed']) == (1, 0)
+    assert calls == []
+    item = SmsOutbox.query.one()
+    assert (item.user_id, item.category, item.charge_sender) == (student.id, 'exam_result', True)
+
+    drain_outbox()
+    assert calls == [student.phoneNumber]
@@ -0,0 +1,51 @@
+"""
+SMS segmentation tests
+Character limit, cost and template statistics agree, and each text is classified once
+"""
+from routes.sms import calculate_sms_cost, count_sms_characters
+from services.sms_segments import segment_message
+from services.sms_service import SMSService
+
+
+def _reference_cost(text):
+    """The per-character rules messages have always been charged by"""
+    bengali = sum(1 for char in text if 'ঀ' <= char <= '৿')
+    other = len(text) - bengali
+    if bengali == 0:
+        return max(1, (other + 119) // 120)
+    if other == 0:
+        return max(1, (bengali + 64) // 65)
+    return max(1, int((bengali * 2.3 + other + 99) // 100))
+
+
+def test_segments_match_charging_rules():
+    texts = ['Hello', 'A' * 120, 'A' * 121, 'আ' * 65, 'আ' * 66, 'Result: গণিত 85/100',
+             'Café ✓ naïve', 'আমি ' * 30]
+
+    for text in texts:
+        assert calculate_sms_cost(text) == _reference_cost(text), text
+
+    assert count_sms_characters('আমি ভাত খাই') == int(9 * 2.3 + 2)
+    assert segment_message('Café ✓').type == 'english'
+    assert segment_message('আমি').type == 'bangla'
+
+
+def test_template_stats_use_the_same_rules():
+    stats = SMSService().calculate_sms_count('Hi আমি')
+
+    assert (stats['type'], stats['bangla_chars'], stats['english_chars']) == ('mixed', 3, 3)
+    assert stats['weighted_count'] == count_sms_characters('Hi আমি')
+    assert stats['sms_count'] == calculate_sms_cost('Hi আমি')
+    assert SMSService().calculate_sms_count('')['sms_count'] == 0
+    assert SMSService().truncate_message('A' * 300) == 'A' * 120
+
+
+def test_repeated_texts_are_classified_once():
+    segment_message.cache_clear()
+
+    for _ in range(50):
+        calculate_sms_cost('Dear Parent, your child was ABSENT today.')
+        count_sms_characters('Dear Parent, your child was ABSENT today.')
+
+    info = segment_message.cache_info()
+    assert (info.misses, info.hits) == (1, 99)
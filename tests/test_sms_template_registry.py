@@ -0,0 +1,72 @@
+"""
+SMS template registry tests
+Saved templates are loaded once per worker, reloaded after an edit, and
+rendered by a precompiled formatter
+"""
+from models import db, Settings, SmsOutbox, UserRole
+from routes.monthly_exams import get_sms_template
+from services.sms_template_registry import compile_template, invalidate_templates
+from conftest import login, make_teacher, make_batch, make_students, QueryCounter
+
+
+def test_compiled_template_renders_placeholders():
+    template = compile_template('{student_name} পেয়েছে {marks}/{total} {unknown}')
+
+    assert template.fields == ('student_name', 'marks', 'total', 'unknown')
+    assert template.render({'student_name': 'Rahim', 'marks': 85, 'total': None}) == \
+        'Rahim পেয়েছে 85/ {unknown}'
+    assert compile_template('{student_name} পেয়েছে {marks}/{total} {unknown}') is template
+
+
+def test_saved_templates_are_loaded_once_and_reloaded_after_edit(client, app):
+    teacher = make_teacher()
+    login(client, teacher)
+    invalidate_templates()
+
+    with app.test_request_context():
+        assert get_sms_template('exam_result').startswith('{student_name} পেয়েছে')
+        with QueryCounter(db.engine) as counter:
+            for _ in range(20):
+                get_sms_template('exam_result')
+        assert counter.count == 0
+
+    response = client.post('/api/sms/templates/exam_result/save', json={'message': 'Result: {marks}/{total}'})
+
+    assert response.status_code == 200
+    with app.test_request_context():
+        assert get_sms_template('exam_result') == 'Result: {marks}/{total}'
+
+
+def test_other_workers_edits_are_seen_once_announced(app):
+    invalidate_templates()
+    with app.test_request_context():
+        assert get_sms_template('fee_reminder').startswith('{student_name} এর ফি')
+
+        # Written by another worker: cached here until it announces the change
+        db.session.add(Settings(key='sms_template_fee_reminder', value={'message': 'Fee due: {amount}'}))
+        db.session.commit()
+        assert get_sms_template('fee_reminder').startswith('{student_name} এর ফি')
+
+        invalidate_templates()
+        assert get_sms_template('fee_reminder') == 'Fee due: {amount}'
+
+
+def test_bulk_sms_uses_teachers_saved_template(client, app):
+    admin = make_teacher()
+    admin.role = UserRole.SUPER_USER
+    batch = make_batch()
+    make_students(batch, 2)
+    login(client, admin)
+
+    response = client.put('/api/sms/templates/attendance_absent',
+                          json={'message': '{student_name} absent in {batch_name}'})
+    assert response.status_code == 200
+
+    # A fresh session has no copy of the template: it comes from the registry
+    other_client = app.test_client()
+    login(other_client, admin)
+    response = other_client.post('/api/sms/send-bulk', json={'batch_id': batch.id, 'template_id': 'attendance_absent'})
+
+    assert response.get_json()['data']['queued'] == 2
+    messages = sorted(item.message for item in SmsOutbox.query.all())
+    assert messages == ['Student000 absent in HSC Physics', 'Student001 absent in HSC Physics']
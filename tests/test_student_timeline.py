@@ -0,0 +1,57 @@
+"""
+Student timeline tests
+Month-over-month progress comes from saved final rankings in one query
+"""
+from models import db, MonthlyRanking
+from conftest import login, make_teacher, make_batch, make_students, make_monthly_exam, QueryCounter
+
+
+def _seed(months):
+    teacher = make_teacher()
+    batch = make_batch()
+    student, other = make_students(batch, 2)
+    for month, position, percentage in months:
+        exam = make_monthly_exam(batch, teacher, month=month)
+        db.session.add_all([
+            MonthlyRanking(monthly_exam_id=exam.id, user_id=student.id, position=position,
+                           percentage=percentage, gpa=percentage / 20, attendance_marks=month, is_final=True),
+            MonthlyRanking(monthly_exam_id=exam.id, user_id=other.id, position=9, is_final=True),
+        ])
+    db.session.commit()
+    return teacher, student, other
+
+
+def test_timeline_deltas(app, client):
+    teacher, student, _ = _seed([(1, 5, 60.0), (2, 3, 70.0), (3, 4, 65.0)])
+    login(client, teacher)
+
+    response = client.get(f'/api/monthly-exams/students/{student.id}/timeline?start=2025-02')
+
+    assert response.status_code == 200
+    timeline = response.get_json()['data']['timeline']
+    assert [(t['month'], t['position']) for t in timeline] == [(2, 3), (3, 4)]
+    assert timeline[0]['position_change'] == 2  # Compared with January, outside the range
+    assert timeline[0]['percentage_change'] == 10
+    assert timeline[1]['position_change'] == -1
+    assert timeline[1]['gpa_change'] == -0.25
+    assert timeline[1]['attendance_days'] == 3
+
+
+def test_timeline_query_count_independent_of_months(app, client):
+    teacher, student, _ = _seed([(month, month, 50.0) for month in range(1, 13)])
+    login(client, teacher)
+
+    with QueryCounter(db.engine) as counter:
+        response = client.get(f'/api/monthly-exams/students/{student.id}/timeline?start=2025-01&end=2025-12')
+    assert response.status_code == 200
+    assert response.get_json()['data']['months_count'] == 12
+    # Current user, student, the timeline query and one holiday query for all twelve months
+    assert counter.count <= 4
+
+
+def test_students_only_see_their_own_timeline(app, client):
+    _, student, other = _seed([(1, 1, 50.0)])
+    login(client, student)
+
+    assert client.get(f'/api/monthly-exams/students/{student.id}/timeline').status_code == 200
+    assert client.get(f'/api/monthly-exams/students/{other.id}/timeline').status_code == 403
@@ -0,0 +1,93 @@
+"""
+Subject rank tests
+RANK()/PERCENT_RANK() per paper, stored with the ranking snapshot
+"""
+from datetime import datetime
+
+import pytest
+
+from models import db, MonthlyMark
+from services.exam_analytics import get_marks_fingerprint
+from services.subject_ranks import refresh_subject_ranks
+from conftest import login, make_teacher, make_batch, make_students, make_monthly_exam, add_mark
+
+
+@pytest.fixture
+def seeded(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 4)
+    monthly_exam = make_monthly_exam(batch, teacher)
+    physics, chemistry = monthly_exam.individual_exams
+    for student, score in zip(students, (40, 30, 40, 10)):
+        add_mark(monthly_exam, physics, student, score)
+    for student, score in zip(students, (10, 20, 30)):
+        add_mark(monthly_exam, chemistry, student, score)
+    add_mark(monthly_exam, chemistry, students[3], 0, is_absent=True)
+    db.session.commit()
+    return teacher, monthly_exam, students
+
+
+def _subjects(client, exam_id):
+    response = client.get(f'/api/monthly-exams/{exam_id}/subject-ranks')
+    assert response.status_code == 200
+    return response.get_json()['data']['subjects']
+
+
+def test_ranks_ties_and_percentiles(client, seeded):
+    teacher, monthly_exam, students = seeded
+    login(client, teacher)
+
+    physics, chemistry = _subjects(client, monthly_exam.id)
+
+    ranks = {entry['user_id']: (entry['subject_rank'], entry['subject_percentile']) for entry in physics['ranks']}
+    assert ranks == {
+        students[0].id: (1, 100.0),
+        students[2].id: (1, 100.0),
+        students[1].id: (3, 33.33),
+        students[3].id: (4, 0.0)
+    }
+    assert chemistry['ranked_students'] == 3
+    assert [entry['user_id'] for entry in chemistry['ranks']] == [students[2].id, students[1].id, students[0].id]
+
+
+def test_ranks_follow_mark_changes(client, seeded):
+    teacher, monthly_exam, students = seeded
+    login(client, teacher)
+    _subjects(client, monthly_exam.id)
+
+    chemistry = monthly_exam.individual_exams[1]
+    response = client.post(f'/api/monthly-exams/{monthly_exam.id}/individual-exams/{chemistry.id}/marks',
+                           json={'students': [{'user_id': students[0].id, 'marks_obtained': 45}]})
+    assert response.status_code == 200
+
+    mark = MonthlyMark.query.filter_by(individual_exam_id=chemistry.id, user_id=students[0].id).one()
+    assert mark.subject_rank == 1
+    assert _subjects(client, monthly_exam.id)[1]['ranks'][0]['user_id'] == students[0].id
+
+
+def test_student_sees_only_own_ranks(client, seeded):
+    _, monthly_exam, students = seeded
+    login(client, students[1])
+
+    physics, chemistry = _subjects(client, monthly_exam.id)
+
+    assert [entry['user_id'] for entry in physics['ranks']] == [students[1].id]
+    assert physics['ranked_students'] == 4
+    assert chemistry['ranks'][0]['subject_rank'] == 2
+
+
+def test_refresh_keeps_marks_updated_at(app, seeded):
+    _, monthly_exam, students = seeded
+    # A stale rank on the absent mark, so both writes of the refresh run
+    MonthlyMark.query.update({'updated_at': datetime(2025, 1, 1), 'subject_rank': 9})
+    db.session.commit()
+    fingerprint = get_marks_fingerprint(monthly_exam.id)
+
+    refresh_subject_ranks(monthly_exam.id)
+    db.session.commit()
+
+    db.session.expire_all()
+    assert {mark.updated_at for mark in MonthlyMark.query.all()} == {datetime(2025, 1, 1)}
+    assert MonthlyMark.query.filter_by(is_absent=True).one().subject_rank is None
+    assert get_marks_fingerprint(monthly_exam.id) == fingerprint
@@ -0,0 +1,94 @@
+"""
+Transcript tests
+Year-end transcripts stream as CSV or JSON lines with a fixed query count
+"""
+import csv
+import io
+import json
+from datetime import date
+
+from models import db
+from services.ranking_jobs import save_final_rankings
+from services.transcripts import load_transcript_inputs
+from conftest import (login, make_teacher, make_batch, make_students, make_monthly_exam,
+                      add_mark, add_attendance, QueryCounter)
+
+
+def _seed_months(teacher, batch, students, months):
+    for month in months:
+        monthly_exam = make_monthly_exam(batch, teacher, month=month)
+        for idx, student in enumerate(students):
+            for paper in monthly_exam.individual_exams:
+                add_mark(monthly_exam, paper, student, 20 + idx + month)
+            add_attendance(batch, student, date(2025, month, 3))
+        db.session.commit()
+        save_final_rankings(monthly_exam)
+        db.session.commit()
+
+
+def _download(client, batch, output_format):
+    response = client.get(f'/api/monthly-exams/transcripts?batch_id={batch.id}&year=2025&format={output_format}')
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def test_jsonl_transcript_per_student(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 2)
+    _seed_months(teacher, batch, students, [3, 4])
+    login(client, teacher)
+
+    transcripts = [json.loads(line) for line in _download(client, batch, 'jsonl').splitlines()]
+
+    assert [t['user_id'] for t in transcripts] == [s.id for s in students]
+    top = transcripts[1]
+    assert [m['month'] for m in top['months']] == [3, 4]
+    assert [m['position'] for m in top['months']] == [1, 1]
+    assert top['months'][0]['subjects'][0]['marks_obtained'] == 24
+    assert top['months'][0]['attendance_days'] == 1
+    assert top['summary']['months_ranked'] == 2
+    assert top['summary']['best_position'] == 1
+
+
+def test_csv_has_one_row_per_student_month(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 3)
+    _seed_months(teacher, batch, students, [3, 4, 5])
+    login(client, teacher)
+
+    rows = list(csv.DictReader(io.StringIO(_download(client, batch, 'csv'))))
+
+    assert len(rows) == 9
+    assert rows[0]['subjects'] == 'Physics: 23/50; Chemistry: 23/50'
+
+
+def test_query_count_does_not_grow_with_months(app):
+    teacher = make_teacher()
+    batch = make_batch()
+    students = make_students(batch, 3)
+    _seed_months(teacher, batch, students, [1, 2])
+    batch_id = batch.id
+
+    def count_queries():
+        db.session.expire_all()
+        with app.app_context(), QueryCounter(db.engine) as counter:
+            inputs = load_transcript_inputs(batch_id, 2025)
+        return counter.count, len(inputs['exams'])
+
+    few = count_queries()
+    _seed_months(teacher, batch, students, range(3, 13))
+    many = count_queries()
+
+    assert (few[1], many[1]) == (2, 12)
+    assert few[0] == many[0] == 7
+
+
+def test_unknown_format_is_rejected(app, client):
+    teacher = make_teacher()
+    batch = make_batch()
+    login(client, teacher)
+
+    response = client.get(f'/api/monthly-exams/transcripts?batch_id={batch.id}&year=2025&format=xml')
+    assert response.status_code == 400